@@ -0,0 +1,407 @@
+"""
+This script converts whole directory trees of Quantum Espresso (pw.x) outputs into training data.
+Every pwfilename.out (with its pwfilename.inp next to it) is parsed in a single streaming pass on a process pool,
+and atomic positions, cell parameters, total energy and forces are written directly to
+one consolidated extended XYZ file and/or one XSF file per structure (same conventions as
+createxyzfromqe.py and createxsffromqe.py: eV, eV/Angstrom, energies referenced to the atomic references below).
+By default only the final ionic step of each output is converted; with --all-steps every ionic step of
+relax/vc-relax runs becomes a frame (optionally thinned with --stride and a minimum-change filter).
+A manifest of file sizes, modification times, hashes and output targets is kept (keyed by the absolute path of each
+pwfilename.out, which is also the 'source' of its frames), so re-runs only convert new or changed outputs and outputs
+whose XYZ/XSF target changed or was deleted. Only outputs under the directories and files given in a run are removed
+from the manifest and the XYZ file when they disappear.
+Usage: python convert_qe_outputs.py [options] <dir or pwfilename.out> [...] [--xyz all.xyz] [--xsf-dir xsf/]
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from ase import Atoms
+from ase.io import iread, write
+from ase.calculators.singlepoint import SinglePointCalculator
+
+rydberg = 0.5 * 27.211386245988
+bohr = 0.529177210903
+
+def atomic_reference(species):
+    atoms = {
+                      'H': -16.77118161, # adsorbates referenced to Pt ontop
+                      'Pt': -2889.448072}  # Pt referenced to Pt bulk atom
+    value = atoms[species]
+    return value
+
+def strip_label(species):
+    # 'Pt1' -> 'Pt'
+    while species[-1].isdigit():
+        species = species[:-1]
+    return species
+
+def read_qe_input(inp_file):
+    '''
+        read_qe_input
+        Cell (Angstrom), species and crystal coordinates from pwfilename.inp
+    '''
+    with open(inp_file, 'r') as inp:
+        lines = inp.readlines()
+    cell = []
+    syms = []
+    coords = []
+    i = 0
+    while i < len(lines):
+        s = lines[i]
+        i += 1
+        if s.find('CELL_PARAMETERS')>-1:
+            cell = [[float(x) for x in lines[i+k].replace('d','e').split()[:3]] for k in range(3)]
+            i += 3
+        elif s.find('ATOMIC_POSITIONS')>-1:
+            if s.find('crystal')<0:
+                raise ValueError(f"{inp_file}: don't know how to parse non-crystal unit coordinates")
+            # the number of atoms is not known yet: read rows until the next card
+            while i < len(lines):
+                splitt = lines[i].split()
+                try:
+                    xyz = [float(x.replace('d','e')) for x in splitt[1:4]]
+                except ValueError:
+                    break
+                if len(xyz) < 3:
+                    break
+                syms.append(strip_label(splitt[0]))
+                coords.append(xyz)
+                i += 1
+    return np.array(cell), syms, np.array(coords)
+
+def _cell_scale(header, alat):
+    # conversion of CELL_PARAMETERS in pw.x output to Angstrom
+    if header.find('alat=')>-1:
+        return float(header.split('alat=')[1].strip(' )\n')) * bohr
+    if header.find('bohr')>-1:
+        return bohr
+    if header.find('alat')>-1:
+        return alat * bohr
+    return 1.0
+
+def _positions(header, values, cell, alat):
+    # atomic positions of a pw.x ATOMIC_POSITIONS block in Angstrom
+    if header.find('crystal')>-1:
+        return values @ cell
+    if header.find('bohr')>-1:
+        return values * bohr
+    if header.find('alat')>-1:
+        return values * alat * bohr
+    return values
+
+def parse_qe_output(out_file):
+    '''
+        parse_qe_output
+        Single streaming pass over pwfilename.out (hashing it on the way).
+        Every completed ionic step (energy followed by the forces block) is returned as a dict with
+        positions, cell, energy (eV, referenced) and forces (eV/Angstrom). The geometry of the first
+        step is taken from pwfilename.inp, later steps use the ATOMIC_POSITIONS / CELL_PARAMETERS
+        blocks printed by relax and vc-relax runs.
+        Returns (steps, symbols, sha1 of .out and .inp)
+    '''
+    inp_file = os.path.splitext(out_file)[0] + '.inp'
+    sha = hashlib.sha1()
+    with open(inp_file, 'rb') as ffile:
+        sha.update(ffile.read())
+    cell, syms, coords = read_qe_input(inp_file)
+    natoms = len(syms)
+    positions = coords @ cell
+    reference = sum(atomic_reference(s) for s in syms)
+    alat = None
+
+    steps = []
+    energy = None
+    forces = []
+    with open(out_file, 'rb') as out:
+        lines = iter(out)
+        for raw in lines:
+            sha.update(raw)
+            s = raw.decode(errors='replace')
+            if energy is None:
+                if s.find('!    total energy')>-1:
+                    energy = float(s.split()[-2])
+                    ts = 0.0
+                elif s.find('lattice parameter (alat)')>-1:
+                    alat = float(s.split()[-2])
+                elif s.find('CELL_PARAMETERS')>-1:
+                    scale = _cell_scale(s, alat)
+                    rows = []
+                    for i in range(3):
+                        raw = next(lines)
+                        sha.update(raw)
+                        rows.append([float(x) for x in raw.split()[:3]])
+                    new_cell = np.array(rows) * scale
+                    # crystal coordinates stay fixed when the cell changes
+                    positions = np.linalg.solve(cell.T, positions.T).T @ new_cell
+                    cell = new_cell
+                elif s.find('ATOMIC_POSITIONS')>-1:
+                    rows = []
+                    for i in range(natoms):
+                        raw = next(lines)
+                        sha.update(raw)
+                        rows.append([float(x) for x in raw.split()[1:4]])
+                    positions = _positions(s, np.array(rows), cell, alat)
+            else:
+                if s.find('smearing contrib. (-TS)')>-1:
+                    ts = float(s.split()[-2])
+                elif s.find('force =')>-1:
+                    forces.append([float(x)*rydberg/bohr for x in s.split()[-3:]])
+                    if len(forces) == natoms:
+                        steps.append({'positions': positions.copy(),
+                                      'cell': cell.copy(),
+                                      'energy': (energy - 0.5*ts)*rydberg - reference,
+                                      'forces': np.array(forces)})
+                        energy = None
+                        forces = []
+    return steps, syms, sha.hexdigest()
+
+def file_hash(out_file):
+    '''
+        file_hash
+        sha1 of pwfilename.out and pwfilename.inp (same digest as parse_qe_output)
+    '''
+    sha = hashlib.sha1()
+    for path in (os.path.splitext(out_file)[0] + '.inp', out_file):
+        with open(path, 'rb') as ffile:
+            for chunk in iter(lambda: ffile.read(1 << 20), b''):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+def select_steps(steps, all_steps=False, stride=1, min_disp=None, min_de=None):
+    '''
+        select_steps
+        Indices of the steps that are converted into training frames.
+        Without all_steps only the final step is used. Otherwise every stride-th step is considered; if min_disp
+        and/or min_de are given, a step is kept only if some atom moved by at least min_disp (Angstrom) or the
+        energy changed by at least min_de (eV) relative to the last kept step. The final step is always kept.
+    '''
+    last = len(steps) - 1
+    if not all_steps:
+        return [last]
+    selected = []
+    for i in range(0, last, stride):
+        if selected and (min_disp is not None or min_de is not None):
+            ref = steps[selected[-1]]
+            changed = False
+            if min_disp is not None:
+                changed = max_displacement(steps[i], ref) >= min_disp
+            if min_de is not None:
+                changed = changed or abs(steps[i]['energy'] - ref['energy']) >= min_de
+            if not changed:
+                continue
+        selected.append(i)
+    selected.append(last)
+    return selected
+
+def max_displacement(step, ref):
+    # largest displacement of any atom between two steps (cell changes count through the positions)
+    return np.max(np.linalg.norm(step['positions'] - ref['positions'], axis=1))
+
+def convert(args):
+    '''
+        convert
+        Worker: parse one output and return its frames (or the error message)
+    '''
+    out_file, rel, options = args
+    try:
+        steps, syms, sha1 = parse_qe_output(out_file)
+        if len(steps) == 0:
+            raise ValueError('no total energy with forces found')
+    except Exception as err:
+        return rel, None, None, f'{type(err).__name__}: {err}'
+    frames = []
+    for i in select_steps(steps, **options):
+        step = steps[i]
+        frames.append((i, step['positions'], step['cell'], step['energy'], step['forces']))
+    return rel, syms, frames, sha1
+
+def find_outputs(paths):
+    '''
+        find_outputs
+        (real path, name) of every .out file with a matching .inp, and the real paths of the scanned
+        directories and files. The real path is the manifest key; the name is the path relative to the common
+        ancestor of all inputs (used for the XSF file names)
+    '''
+    found = []
+    roots = []
+    for path in paths:
+        if os.path.isdir(path):
+            roots.append(os.path.realpath(path))
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.out') and os.path.exists(os.path.join(root, name[:-4]+'.inp')):
+                        found.append(os.path.realpath(os.path.join(root, name)))
+        elif path.endswith('.out'):
+            roots.append(os.path.realpath(path))
+            found.append(os.path.realpath(path))
+        else:
+            print(f'skipping {path}: expected a directory or a pwfilename.out', file=sys.stderr)
+    if not found:
+        return [], roots
+    # an output given twice (e.g. as a file and through its directory) is converted once
+    found = list(dict.fromkeys(found))
+    base = os.path.commonpath([root if os.path.isdir(root) else os.path.dirname(root) for root in roots])
+    return [(full, os.path.relpath(full, base)) for full in found], roots
+
+def under(path, roots):
+    # path is one of the roots or lies below one of the root directories
+    return any(os.path.commonpath([path, root]) == root for root in roots)
+
+def up_to_date(entry, xyz, xsf_dir):
+    '''
+        up_to_date
+        True if the frames of a manifest entry are in the requested targets (and these still exist)
+    '''
+    if xyz is not None and (entry.get('xyz') != xyz or not os.path.exists(xyz)):
+        return False
+    if xsf_dir is not None:
+        files = entry.get('xsf', [])
+        if not files or any(os.path.dirname(f) != xsf_dir or not os.path.exists(f) for f in files):
+            return False
+    return True
+
+def write_xsf(filename, symbols, positions, cell, energy, forces):
+    '''
+        write_xsf
+        XSF file in the format written by createxsffromqe.py
+    '''
+    lines = ['# total energy = '+str(energy)+ ' eV', '', 'SLAB', 'PRIMVEC']
+    lines += ['%.14f %.14f %.14f' % tuple(c) for c in cell]
+    lines += ['PRIMCOORD', '%d 1' % len(symbols)]
+    lines += ['%s  %15.10f %15.10f %15.10f %15.10f %15.10f %15.10f' % ((s,) + tuple(p) + tuple(f))
+              for s, p, f in zip(symbols, positions, forces)]
+    with open(filename, 'w') as xsf:
+        xsf.write('\n'.join(lines) + '\n')
+
+def frame_atoms(symbols, positions, cell, energy, forces, source, step):
+    at = Atoms(symbols, positions=positions, cell=cell, pbc=True)
+    at.calc = SinglePointCalculator(at, energy=energy, forces=forces)
+    at.info['source'] = source
+    at.info['step'] = step
+    return at
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r') as ffile:
+            return json.load(ffile)
+    return {}
+
+def save_manifest(path, manifest):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as ffile:
+        json.dump(manifest, ffile, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert directory trees of pw.x outputs to extxyz/XSF training data.')
+    parser.add_argument('inputs', nargs='+', help='directories (searched recursively) or pwfilename.out files')
+    parser.add_argument('--xyz', help='consolidated extended XYZ output')
+    parser.add_argument('--xsf-dir', help='directory for one XSF file per structure')
+    parser.add_argument('--manifest', default='qe_manifest.json', help='record of converted outputs')
+    parser.add_argument('--nproc', type=int, default=os.cpu_count())
+    parser.add_argument('--force', action='store_true', help='ignore the manifest and convert everything')
+    parser.add_argument('--all-steps', action='store_true', help='emit every ionic step, not just the final one')
+    parser.add_argument('--stride', type=int, default=1, help='with --all-steps: consider every n-th ionic step')
+    parser.add_argument('--min-disp', type=float, default=None,
+                        help='with --all-steps: keep steps in which some atom moved this far (Angstrom) since the last kept step')
+    parser.add_argument('--min-de', type=float, default=None,
+                        help='with --all-steps: keep steps whose energy changed this much (eV) since the last kept step '
+                             '(with --min-disp: steps meeting either criterion are kept)')
+    args = parser.parse_args()
+    if args.xyz is None and args.xsf_dir is None:
+        parser.error('nothing to write: give --xyz and/or --xsf-dir')
+    if args.stride < 1:
+        parser.error('--stride must be at least 1')
+    xyz = os.path.realpath(args.xyz) if args.xyz else None
+    xsf_dir = os.path.realpath(args.xsf_dir) if args.xsf_dir else None
+    options = {'all_steps': args.all_steps, 'stride': args.stride, 'min_disp': args.min_disp, 'min_de': args.min_de}
+
+    outputs, roots = find_outputs(args.inputs)
+    rels = dict(outputs)
+    if args.xsf_dir:
+        names = {}
+        for out_file, rel in outputs:
+            names.setdefault(os.path.splitext(rel)[0].replace(os.sep, '_'), []).append(rel)
+        clashes = [rels for rels in names.values() if len(rels) > 1]
+        if clashes:
+            parser.error(f'outputs would write the same XSF files: {", ".join(clashes[0])}')
+    manifest = {} if args.force else load_manifest(args.manifest)
+    current = {}
+    todo = []
+    for out_file, rel in outputs:
+        st = os.stat(out_file)
+        inp_st = os.stat(os.path.splitext(out_file)[0] + '.inp')
+        stamp = [st.st_size, st.st_mtime, inp_st.st_size, inp_st.st_mtime]
+        current[out_file] = stamp
+        entry = manifest.get(out_file)
+        if entry is not None and entry.get('options') == options and up_to_date(entry, xyz, xsf_dir):
+            if entry['stamp'] == stamp:
+                continue
+            if entry['sha1'] == file_hash(out_file):
+                # touched or copied, but unchanged
+                entry['stamp'] = stamp
+                continue
+        todo.append((out_file, out_file, options))
+
+    # outputs converted earlier that changed, or disappeared from the scanned directories: their frames have
+    # to leave the consolidated file (entries of outputs outside this run's inputs are kept as they are)
+    stale = ({key for key in manifest if key not in current and under(key, roots)}
+             | {key for _, key, _ in todo if key in manifest})
+    for key in stale:
+        del manifest[key]
+    print(f'{len(outputs)} outputs found, {len(todo)} to convert, {len(outputs)-len(todo)} up to date')
+
+    results = []
+    with Pool(args.nproc) as pool:
+        for key, syms, frames, sha1 in pool.imap_unordered(convert, todo, chunksize=4):
+            if syms is None:
+                print(f'{rels[key]}: {sha1}', file=sys.stderr)
+                continue
+            results.append((key, syms, frames, sha1))
+    results.sort(key=lambda x: x[0])
+
+    xsf_files = {}
+    if args.xsf_dir:
+        os.makedirs(xsf_dir, exist_ok=True)
+        for key, syms, frames, sha1 in results:
+            base = os.path.join(xsf_dir, os.path.splitext(rels[key])[0].replace(os.sep, '_'))
+            xsf_files[key] = []
+            for step, pos, cell, energy, forces in frames:
+                name = base + '.xsf' if not options['all_steps'] else base + '_%03d.xsf' % step
+                write_xsf(name, syms, pos, cell, energy, forces)
+                xsf_files[key].append(name)
+
+    if args.xyz:
+        new = [frame_atoms(syms, pos, cell, energy, forces, key, step)
+               for key, syms, frames, sha1 in results for step, pos, cell, energy, forces in frames]
+        # appending is only safe if none of the converted outputs can already have frames in the file
+        if os.path.exists(args.xyz) and not args.force and not stale and manifest:
+            write(args.xyz, new, format='extxyz', append=True)
+        else:
+            # rewrite without the frames of changed or removed outputs; a per-process temporary file
+            # keeps concurrent runs from clobbering each other
+            tmp = f'{args.xyz}.{os.getpid()}.tmp'
+            if os.path.exists(args.xyz) and not args.force:
+                replaced = stale | {key for key, _, _, _ in results}
+                kept = (at for at in iread(args.xyz, index=':') if at.info.get('source') not in replaced)
+                write(tmp, kept, format='extxyz')
+                write(tmp, new, format='extxyz', append=True)
+            else:
+                write(tmp, new, format='extxyz')
+            os.replace(tmp, args.xyz)
+
+    for key, syms, frames, sha1 in results:
+        manifest[key] = {'stamp': current[key], 'sha1': sha1, 'frames': len(frames), 'options': options,
+                         'xyz': xyz, 'xsf': xsf_files.get(key, [])}
+    save_manifest(args.manifest, manifest)
+    print(f'{sum(len(r[2]) for r in results)} frames written')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Columnar, indexed binary store for training sets in extended XYZ format (xyz_files/struct_seed.xyz, al_1..al_5, ...).
+All frames are kept as concatenated typed arrays (species, positions, forces, any other per-atom arrays)
+plus per-frame cells, pbc flags and energies, with per-frame atom offsets. The other numeric calculator results
+(stress, free_energy, magmoms, charges, ...) are kept as extra per-frame or per-atom columns, NaN for frames
+without them. Every array is a .npy file in the store directory and is memory-mapped on opening, so any frame
+is accessed in O(1) without parsing text, and frames can be iterated lazily as ASE Atoms objects.
+Import from and export to extended XYZ is lossless (frame info, calculator results and extra arrays round-trip);
+non-numeric calculator results cannot be stored and are reported on import.
+
+Usage:
+    python dataset_store.py import <name.store> <file.xyz> [<file.xyz> ...]
+    python dataset_store.py export <name.store> <out.xyz> [--frames 0:100]
+    python dataset_store.py info <name.store>
+
+From Python:
+    from dataset_store import DatasetStore
+    store = DatasetStore('train.store')
+    atoms = store[17]
+    for atoms in store.iter_atoms(range(0, len(store), 10)):
+        ...
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+from ase import Atoms
+from ase.io import iread, write
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.io.extxyz import per_atom_properties
+
+store_version = 1
+
+def _jsonable(value):
+    # numpy scalars/arrays in atoms.info -> plain python for meta.json
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+class DatasetStore:
+    '''
+        DatasetStore
+        Read access to a store directory written by DatasetStore.create / import_extxyz
+    '''
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as ffile:
+            self.meta = json.load(ffile)
+        if self.meta['version'] != store_version:
+            raise ValueError(f'{path}: unsupported store version {self.meta["version"]}')
+        load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        self.offsets = load('offsets')
+        self.numbers = load('numbers')
+        self.positions = load('positions')
+        self.cells = load('cells')
+        self.pbc = load('pbc')
+        self.energies = load('energies')
+        self.forces = load('forces') if self.meta['has_forces'] else None
+        self.arrays = {name: load('array_' + name) for name in self.meta['arrays']}
+        # stores written before the extra results were kept have no 'results' entry
+        self.results = {name: load('result_' + name) for name in self.meta.get('results', {})}
+        self.info = self.meta['info']
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def natoms(self, i=None):
+        '''
+            natoms
+            Number of atoms of frame i (or of all frames)
+        '''
+        counts = np.diff(self.offsets)
+        return counts if i is None else int(counts[i])
+
+    def atom_slice(self, i):
+        return slice(int(self.offsets[i]), int(self.offsets[i+1]))
+
+    def get_atoms(self, i):
+        '''
+            get_atoms
+            Frame i as an ASE Atoms object (energy, forces and the other stored results as a SinglePointCalculator)
+        '''
+        if i < 0:
+            i += len(self)
+        sl = self.atom_slice(i)
+        at = Atoms(numbers=np.array(self.numbers[sl]), positions=np.array(self.positions[sl]),
+                   cell=np.array(self.cells[i]), pbc=np.array(self.pbc[i]))
+        for name, arr in self.arrays.items():
+            at.arrays[name] = np.array(arr[sl])
+        if self.info is not None:
+            at.info.update(self.info[i])
+        results = {}
+        if not np.isnan(self.energies[i]):
+            results['energy'] = float(self.energies[i])
+        if self.forces is not None:
+            results['forces'] = np.array(self.forces[sl])
+        for name, column in self.results.items():
+            value = np.array(column[sl] if self.meta['results'][name] == 'atom' else column[i])
+            if not np.all(np.isnan(value)):
+                results[name] = value if value.ndim else float(value)
+        if results:
+            at.calc = SinglePointCalculator(at, **results)
+        return at
+
+    def __getitem__(self, i):
+        return self.get_atoms(i)
+
+    def iter_atoms(self, indices=None):
+        '''
+            iter_atoms
+            Lazily yield the selected frames (all frames by default) as Atoms objects
+        '''
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            yield self.get_atoms(int(i))
+
+    def __iter__(self):
+        return self.iter_atoms()
+
+    def to_extxyz(self, filename, indices=None):
+        '''
+            to_extxyz
+            Write the selected frames to an extended XYZ file
+        '''
+        write(filename, self.iter_atoms(indices), format='extxyz')
+
+    @staticmethod
+    def create(path, images):
+        '''
+            create
+            Write a new store from an iterable of Atoms objects (single pass, frames are not kept in memory
+            beyond the growing column arrays)
+        '''
+        os.makedirs(path, exist_ok=True)
+        counts, numbers, positions, forces, cells, pbc, energies, infos = [], [], [], [], [], [], [], []
+        arrays = None
+        has_forces = None
+        extra_results = {}   # name -> value of every frame so far (None if missing)
+        skipped = set()
+        for at in images:
+            results = at.calc.results if at.calc is not None else {}
+            counts.append(len(at))
+            numbers.append(at.numbers.astype(np.uint8))
+            positions.append(at.positions)
+            cells.append(np.array(at.cell))
+            pbc.append(at.pbc.copy())
+            energies.append(results.get('energy', np.nan))
+            frame_has_forces = 'forces' in results
+            if has_forces is None:
+                has_forces = frame_has_forces
+            elif has_forces != frame_has_forces:
+                raise ValueError('either all or no frames need forces')
+            if has_forces:
+                forces.append(results['forces'])
+            extra = {name: arr for name, arr in at.arrays.items() if name not in ('numbers', 'positions')}
+            if arrays is None:
+                arrays = {name: [] for name in extra}
+            if set(extra) != set(arrays):
+                raise ValueError('all frames need the same per-atom arrays')
+            for name, arr in extra.items():
+                arrays[name].append(arr)
+            infos.append({key: _jsonable(value) for key, value in at.info.items()})
+            for name, value in results.items():
+                if name in ('energy', 'forces'):
+                    continue
+                try:
+                    value = np.asarray(value, dtype=np.float64)
+                except (TypeError, ValueError):
+                    skipped.add(name)
+                    continue
+                extra_results.setdefault(name, [None]*(len(counts)-1)).append(value)
+            for column in extra_results.values():
+                if len(column) < len(counts):
+                    column.append(None)
+        if skipped:
+            print(f'non-numeric calculator results not stored: {", ".join(sorted(skipped))}')
+        if not counts:
+            raise ValueError('no frames to store')
+
+        save = lambda name, arr: np.save(os.path.join(path, name + '.npy'), arr)
+        save('offsets', np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+        save('numbers', np.concatenate(numbers))
+        save('positions', np.concatenate(positions).astype(np.float64))
+        save('cells', np.array(cells, dtype=np.float64).reshape(-1, 3, 3))
+        save('pbc', np.array(pbc, dtype=bool).reshape(-1, 3))
+        save('energies', np.array(energies, dtype=np.float64))
+        if has_forces:
+            save('forces', np.concatenate(forces).astype(np.float64))
+        for name, arr in arrays.items():
+            save('array_' + name, np.concatenate(arr))
+        kinds = {}
+        for name, column in extra_results.items():
+            kinds[name] = 'atom' if name in per_atom_properties else 'frame'
+            shapes = {value.shape[1:] if kinds[name] == 'atom' else value.shape for value in column if value is not None}
+            if len(shapes) > 1:
+                raise ValueError(f'calculator result {name} has different shapes in different frames')
+            shape = shapes.pop()
+            if kinds[name] == 'atom':
+                save('result_' + name, np.concatenate([value if value is not None else np.full((n,) + shape, np.nan)
+                                                       for value, n in zip(column, counts)]))
+            else:
+                save('result_' + name, np.array([value if value is not None else np.full(shape, np.nan) for value in column]))
+        meta = {'version': store_version,
+                'n_frames': len(counts),
+                'n_atoms': int(np.sum(counts)),
+                'has_forces': bool(has_forces),
+                'arrays': sorted(arrays),
+                'results': kinds,
+                'info': infos if any(infos) else None}
+        with open(os.path.join(path, 'meta.json'), 'w') as ffile:
+            json.dump(meta, ffile)
+        return DatasetStore(path)
+
+def import_extxyz(path, files):
+    '''
+        import_extxyz
+        Create a store from one or more extended XYZ files (frames in file order)
+    '''
+    images = (at for ffile in files for at in iread(ffile, index=':'))
+    return DatasetStore.create(path, images)
+
+def parse_frames(text, n):
+    '''
+        parse_frames
+        Frame selection 'start:stop[:step]' or comma-separated indices
+    '''
+    if text is None:
+        return range(n)
+    if ':' in text:
+        return range(n)[slice(*[int(x) if x else None for x in text.split(':')])]
+    return [int(x) for x in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar binary store for extended XYZ training sets.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('import', help='create a store from extended XYZ files')
+    p.add_argument('store')
+    p.add_argument('xyz', nargs='+')
+    p = sub.add_parser('export', help='write (selected frames of) a store to extended XYZ')
+    p.add_argument('store')
+    p.add_argument('xyz')
+    p.add_argument('--frames', help="'start:stop[:step]' or comma-separated indices")
+    p = sub.add_parser('info', help='print a summary of a store')
+    p.add_argument('store')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        store = import_extxyz(args.store, args.xyz)
+        print(f'{args.store}: {len(store)} frames, {store.meta["n_atoms"]} atoms')
+    elif args.command == 'export':
+        store = DatasetStore(args.store)
+        store.to_extxyz(args.xyz, parse_frames(args.frames, len(store)))
+    else:
+        store = DatasetStore(args.store)
+        natoms = store.natoms()
+        print(f'{args.store}: {len(store)} frames, {store.meta["n_atoms"]} atoms '
+              f'({natoms.min()}-{natoms.max()} per frame), forces: {store.meta["has_forces"]}, '
+              f'extra arrays: {store.meta["arrays"]}, extra results: {sorted(store.meta.get("results", {}))}')
+
+
+if __name__ == '__main__':
+    main()
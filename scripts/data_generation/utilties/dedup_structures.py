@@ -0,0 +1,206 @@
+"""
+This script removes near-duplicate structures before they are submitted for DFT.
+Every structure is reduced to a rotation-, translation- and permutation-invariant fingerprint
+(pair-distance histogram per species pair, normalized to unit length), fingerprints are bucketed
+with locality-sensitive hashing (random projections), and a structure is dropped when it lies within
+a distance tolerance of a structure that was already kept. Structures are kept in input order.
+Inputs can be ASE databases (inp.db), extended XYZ / trajectory files or directories of them (e.g. xyz_files/*).
+Usage: python dedup_structures.py [options] <input> [<input> ...] -o <kept.db|kept.xyz>
+"""
+
+import os
+import glob
+import argparse
+import itertools
+import numpy as np
+from multiprocessing import Pool
+from ase.io import iread, write
+from ase.db import connect
+from ase.neighborlist import neighbor_list
+
+structure_extensions = ('.xyz', '.extxyz', '.traj', '.db')
+
+def expand_inputs(paths):
+    '''
+        expand_inputs
+        Replace directories by the structure files they contain (recursively), keep files as given
+    '''
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for ext in structure_extensions:
+                found.extend(glob.glob(os.path.join(path, '**', '*'+ext), recursive=True))
+            files.extend(sorted(found))
+        else:
+            files.append(path)
+    return files
+
+def iter_structures(files):
+    '''
+        iter_structures
+        Yield (file, index, atoms) for every structure in the input files
+    '''
+    for ffile in files:
+        if ffile.endswith('.db'):
+            with connect(ffile) as db:
+                for i, row in enumerate(db.select()):
+                    yield ffile, i, row.toatoms()
+        else:
+            for i, atoms in enumerate(iread(ffile, index=':')):
+                yield ffile, i, atoms
+
+def composition_key(atoms):
+    '''
+        composition_key
+        Only structures with identical composition can be duplicates of each other
+    '''
+    symbols, counts = np.unique(atoms.get_chemical_symbols(), return_counts=True)
+    return tuple(zip(symbols.tolist(), counts.tolist()))
+
+def fingerprint(atoms, cutoff=6.0, bin_width=0.1):
+    '''
+        fingerprint
+        Pair-distance histogram for every species pair within the cutoff, with linear interpolation
+        between neighbouring bins so the fingerprint changes continuously with the geometry.
+        Returns the composition key and the fingerprint normalized to unit length (float32).
+    '''
+    key = composition_key(atoms)
+    elements = [s for s, _ in key]
+    pairs = list(itertools.combinations_with_replacement(range(len(elements)), 2))
+    pair_index = -np.ones((len(elements), len(elements)), dtype=int)
+    for p, (a, b) in enumerate(pairs):
+        pair_index[a, b] = pair_index[b, a] = p
+    nbins = int(np.ceil(cutoff/bin_width))
+
+    species = np.searchsorted(elements, atoms.get_chemical_symbols())
+    i, j, d = neighbor_list('ijd', atoms, cutoff)
+    pid = pair_index[species[i], species[j]]
+    # distance in units of bins, measured from the first bin centre
+    x = np.clip(d/bin_width - 0.5, 0.0, nbins - 1.0)
+    lo = np.floor(x).astype(int)
+    hi = np.minimum(lo + 1, nbins - 1)
+    w_hi = x - lo
+    hist = np.bincount(pid*nbins + lo, weights=1.0 - w_hi, minlength=len(pairs)*nbins)
+    hist += np.bincount(pid*nbins + hi, weights=w_hi, minlength=len(pairs)*nbins)
+    norm = np.linalg.norm(hist)
+    if norm > 0.0:
+        hist /= norm
+    return key, hist.astype(np.float32)
+
+def _fingerprint_task(args):
+    # helper for Pool.imap: unpack (atoms, cutoff, bin_width)
+    atoms, cutoff, bin_width = args
+    return fingerprint(atoms, cutoff, bin_width)
+
+def find_unique(fingerprints, keys, tol=0.05, n_tables=10, n_proj=4, seed=0):
+    '''
+        find_unique
+        Greedy selection in input order: a structure is kept unless a kept structure of the same
+        composition has a fingerprint closer than tol (Euclidean). Candidates are looked up in
+        n_tables hash tables, each hashing n_proj quantized random projections with bucket width 4*tol,
+        so only structures sharing a bucket with the query are compared explicitly.
+        Returns a boolean array (True = keep).
+    '''
+    keep = np.zeros(len(keys), dtype=bool)
+    rng = np.random.RandomState(seed)
+    width = 4.0*tol
+    tables = [dict() for _ in range(n_tables)]
+    kept_fps = {}  # composition -> list of kept fingerprints (indexed by position in that list)
+    # fingerprints of different compositions differ in length: hash each composition group in one go
+    groups = {}
+    for n, key in enumerate(keys):
+        groups.setdefault(key, []).append(n)
+    hashes = {}
+    for key, members in groups.items():
+        fps = np.array([fingerprints[n] for n in members])
+        proj = rng.normal(size=(fps.shape[1], n_tables*n_proj)).astype(np.float32)
+        shift = rng.uniform(0.0, width, size=n_tables*n_proj).astype(np.float32)
+        codes = np.floor((fps @ proj + shift)/width).astype(np.int64).reshape(len(members), n_tables, n_proj)
+        for n, code in zip(members, codes):
+            hashes[n] = code
+        kept_fps[key] = []
+    for n, key in enumerate(keys):
+        buckets = [(key, t) + tuple(hashes[n][t]) for t in range(n_tables)]
+        candidates = set()
+        for t, bucket in enumerate(buckets):
+            candidates.update(tables[t].get(bucket, ()))
+        if candidates:
+            cand = np.fromiter(candidates, dtype=int)
+            ref = np.array([kept_fps[key][c] for c in cand])
+            if np.min(np.linalg.norm(ref - fingerprints[n], axis=1)) < tol:
+                continue
+        keep[n] = True
+        kept_fps[key].append(fingerprints[n])
+        for t, bucket in enumerate(buckets):
+            tables[t].setdefault(bucket, []).append(len(kept_fps[key]) - 1)
+    return keep
+
+def write_kept(files, keep, output):
+    '''
+        write_kept
+        Second streaming pass over the inputs, writing only the kept structures
+    '''
+    if os.path.exists(output):
+        os.remove(output)
+    if output.endswith('.db'):
+        with connect(output) as db:
+            n = 0
+            for ffile in files:
+                if ffile.endswith('.db'):
+                    with connect(ffile) as src:
+                        for row in src.select():
+                            if keep[n]:
+                                db.write(row.toatoms(), key_value_pairs=row.key_value_pairs, data=row.data)
+                            n += 1
+                else:
+                    for atoms in iread(ffile, index=':'):
+                        if keep[n]:
+                            db.write(atoms)
+                        n += 1
+    else:
+        kept = (atoms for n, (_, _, atoms) in enumerate(iter_structures(files)) if keep[n])
+        write(output, kept)
+
+def main():
+    parser = argparse.ArgumentParser(description='Drop near-duplicate structures before DFT submission.')
+    parser.add_argument('inputs', nargs='+', help='inp.db, extxyz/traj files or directories')
+    parser.add_argument('-o', '--output', help='file for the kept structures (.db or any ASE format)')
+    parser.add_argument('--tol', type=float, default=0.05, help='fingerprint distance below which structures are duplicates')
+    parser.add_argument('--cutoff', type=float, default=6.0, help='pair-distance cutoff in Angstrom')
+    parser.add_argument('--bin-width', type=float, default=0.1, help='histogram bin width in Angstrom')
+    parser.add_argument('--tables', type=int, default=10, help='number of LSH tables')
+    parser.add_argument('--nproc', type=int, default=os.cpu_count(), help='processes used for fingerprinting')
+    parser.add_argument('--index-out', help='write "<file> <index>" of every kept structure to this file')
+    args = parser.parse_args()
+
+    files = expand_inputs(args.inputs)
+    sources = []
+    def tasks():
+        # single streaming pass over the inputs, recording where each structure came from
+        for ffile, i, atoms in iter_structures(files):
+            sources.append((ffile, i))
+            yield atoms, args.cutoff, args.bin_width
+
+    keys = []
+    fingerprints = []
+    with Pool(args.nproc) as pool:
+        # imap keeps the input order
+        for key, fp in pool.imap(_fingerprint_task, tasks(), chunksize=64):
+            keys.append(key)
+            fingerprints.append(fp)
+
+    keep = find_unique(fingerprints, keys, tol=args.tol, n_tables=args.tables)
+    print(f'{len(keep)} structures read, {np.sum(keep)} kept, {len(keep)-np.sum(keep)} near-duplicates dropped')
+
+    if args.index_out:
+        with open(args.index_out, 'w') as ffile:
+            for (src, i), k in zip(sources, keep):
+                if k:
+                    ffile.write(f'{src} {i}\n')
+    if args.output:
+        write_kept(files, keep, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+This script is a packed replacement for generate_displaced_xsf.py.
+For every training structure all displacements (+/- delta along x, y, z of every atom, in-plane
+displacements skipped for in-plane forces below force_threshold) and their first-order energies
+E - F.displacement are built in one array operation and stored in a single packed file per input
+(<name>_FFF.npz) or in one HDF5 archive: the reference geometry, the (atom, direction, sign) index and the
+energies of the displacements, from which every displaced geometry is rebuilt when it is unpacked.
+Displacements that are equivalent by symmetry (same pair-distance fingerprint and energy) can be skipped.
+The XSF files needed by aenet's generate.x are only unpacked on demand, e.g. to node-local scratch,
+together with the list of files for the FILES section of generate.in.
+
+Usage:
+    python generate_displaced_packed.py pack [--symmetry] [--archive displaced.h5] [xsf files]
+    python generate_displaced_packed.py unpack <packed .npz/.h5> [...] --dir <dir> [--files-list files.txt]
+"""
+
+import os
+import glob
+import argparse
+import numpy as np
+from ase import io
+from ase import Atoms
+from dedup_structures import fingerprint
+
+delta = 0.05 #small displacement in Angstroms to teach aenet the forces
+force_threshold = 0.001 #force below which in-plane forces are not trained against
+
+def read_training_xsf(xsf):
+    '''
+        read_training_xsf
+        Structure, forces and energy of a training XSF file (as in generate_displaced_xsf.py)
+    '''
+    at = io.read(xsf)
+    forces = at.get_forces() / 27.211386245988 #ase thinks the energies are in Hartree
+    with open(xsf, 'r') as fi:
+        energy = float(fi.readline().split()[-2])
+    return at, forces, energy
+
+def displacements(forces, energy):
+    '''
+        displacements
+        All displacements of one structure at once.
+        Returns index (M,3: atom, direction, sign) and energies (M,)
+    '''
+    train = np.ones(forces.shape, dtype=bool)
+    train[:, :2] = np.abs(forces[:, :2]) >= force_threshold
+    iatom, j = np.nonzero(train)
+    iatom = np.repeat(iatom, 2)
+    j = np.repeat(j, 2)
+    k = np.tile([-1, 1], len(iatom)//2)
+    #project forces onto displacement to get approximate energy change
+    newenergy = energy - delta*k*forces[iatom, j]
+    index = np.stack((iatom, j, k), axis=1).astype(np.int32)
+    return index, newenergy
+
+def displaced_position(reference, iatom, j, k, step=delta):
+    # position of the displaced atom
+    p = reference[iatom].copy()
+    p[j] += step*k
+    return p
+
+def symmetry_unique(at, index, energies, tol=1e-4, etol=1e-8):
+    '''
+        symmetry_unique
+        Mask of displacements to keep: a displaced structure is skipped if an earlier one has the same
+        first-order energy and the same (fine-binned) pair-distance fingerprint, i.e. is equivalent
+        by a symmetry operation of the undisplaced structure. Energy and fingerprint are quantized to
+        etol and tol and looked up in a hash table (equivalent structures whose values fall on different
+        sides of a quantization step are kept).
+    '''
+    keep = np.ones(len(index), dtype=bool)
+    seen = set()
+    disp = Atoms(at.get_chemical_symbols(), positions=at.positions, cell=at.cell, pbc=at.pbc)
+    for m, (iatom, j, k) in enumerate(index):
+        positions = at.positions.copy()
+        positions[iatom] = displaced_position(at.positions, iatom, j, k)
+        disp.positions = positions
+        fp = fingerprint(disp, cutoff=6.0, bin_width=0.01)[1]
+        key = (int(np.round(energies[m]/etol)), np.round(fp/tol).astype(np.int64).tobytes())
+        if key in seen:
+            keep[m] = False
+        else:
+            seen.add(key)
+    return keep
+
+def pack_structure(xsf, symmetry=False, source=None):
+    '''
+        pack_structure
+        Packed displacement data of one training structure as a dict of arrays (source: name of the structure,
+        file name of the XSF by default)
+    '''
+    at, forces, energy = read_training_xsf(xsf)
+    index, energies = displacements(forces, energy)
+    if symmetry:
+        keep = symmetry_unique(at, index, energies)
+        index, energies = index[keep], energies[keep]
+    return {'source': np.array(source if source is not None else os.path.basename(xsf)),
+            'symbols': np.array(at.get_chemical_symbols()),
+            'cell': np.array(at.cell),
+            'reference': at.positions,
+            'index': index,
+            'energies': energies}
+
+def read_packed(path):
+    '''
+        read_packed
+        Yield the packed displacement data (dict of arrays) stored in a .npz file or an HDF5 archive
+    '''
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            yield {key: data[key] for key in data.files}
+    else:
+        import h5py
+        with h5py.File(path, 'r') as f:
+            for name in f['files'].asstr()[()]:
+                g = f[name]
+                data = {key: g[key][()] for key in g}
+                data['source'] = np.array(name)
+                data['symbols'] = g['symbols'].asstr()[()]
+                data['delta'] = f.attrs['delta']
+                yield data
+
+def xsf_texts(data):
+    '''
+        xsf_texts
+        (file name, XSF text) of every displaced structure, in the format of generate_displaced_xsf.py.
+        Only the line of the displaced atom differs between structures, so all other lines are formatted once.
+    '''
+    symbols = data['symbols']
+    natoms = len(symbols)
+    base = str(data['source']).replace('.xsf', '')
+    head = ['', 'SLAB', 'PRIMVEC'] + ['%.12f %.12f %.12f' % tuple(c) for c in data['cell']] + ['PRIMCOORD', '%d 1' % natoms]
+    # '+ 0.' as in pos + displace of generate_displaced_xsf.py (prints -0.0 as 0.0)
+    rows = ['%s  %.12f %.12f %.12f %.12f %.12f %.12f' % (s, p[0], p[1], p[2], 0., 0., 0.) for s, p in zip(symbols, data['reference'] + 0.)]
+    step = float(data['delta']) if 'delta' in data else delta
+    for (iatom, j, k), energy in zip(data['index'], data['energies']):
+        p = displaced_position(data['reference'], iatom, j, k, step) + 0.
+        body = list(rows)
+        body[iatom] = '%s  %.12f %.12f %.12f %.12f %.12f %.12f' % (symbols[iatom], p[0], p[1], p[2], 0., 0., 0.)
+        text = '\n'.join(['# total energy = '+str(energy)+ ' eV'] + head + body) + '\n'
+        yield base + '_FFF_%d_%d_%d.xsf' % (iatom, j, k), text
+
+def pack(args):
+    xsfs = args.xsf if args.xsf else glob.glob('*.xsf') #training structures in xsf format
+    xsfs = [x for x in xsfs if x.find('_FFF_')<0] #skip xsf files generated from forces
+    if args.archive:
+        import h5py
+        # group names: paths relative to the common directory of the inputs (file names if they share one)
+        common = os.path.commonpath([os.path.dirname(os.path.abspath(x)) for x in xsfs]) if xsfs else ''
+        sources = [os.path.relpath(os.path.abspath(x), common) for x in xsfs]
+        if len(set(sources)) < len(sources):
+            raise ValueError('training structures given more than once: ' + ', '.join(sorted({x for x in sources if sources.count(x) > 1})))
+        with h5py.File(args.archive, 'w') as f:
+            names = []
+            for xsf, source in zip(xsfs, sources):
+                data = pack_structure(xsf, args.symmetry, source)
+                name = str(data['source'])
+                g = f.create_group(name)
+                for key in ('cell', 'reference', 'index', 'energies'):
+                    g.create_dataset(key, data=data[key])
+                g.create_dataset('symbols', data=data['symbols'].astype('S'))
+                names.append(name)
+                print(f'{xsf}: {len(data["index"])} displacements')
+            f.create_dataset('files', data=np.array(names, dtype='S'))
+            f.attrs['delta'] = delta
+            f.attrs['force_threshold'] = force_threshold
+    else:
+        for xsf in xsfs:
+            data = pack_structure(xsf, args.symmetry)
+            np.savez(xsf.replace('.xsf', '_FFF.npz'), delta=delta, force_threshold=force_threshold, **data)
+            print(f'{xsf}: {len(data["index"])} displacements')
+
+def unpack(args):
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+    names = []
+    for path in args.packed:
+        for data in read_packed(path):
+            for name, text in xsf_texts(data):
+                name = os.path.join(args.dir, name) if args.dir else name
+                if not args.list_only:
+                    # structures of an archive from several directories keep their relative paths
+                    if os.path.dirname(name):
+                        os.makedirs(os.path.dirname(name), exist_ok=True)
+                    with open(name, 'w') as newxsf:
+                        newxsf.write(text)
+                names.append(name)
+    if args.files_list:
+        # number of files followed by one file per line, as in the FILES section of generate.in
+        with open(args.files_list, 'w') as ffile:
+            ffile.write(f'{len(names)}\n')
+            ffile.write(''.join(f'{name}\n' for name in names))
+    print(f'{len(names)} displaced structures')
+
+def main():
+    parser = argparse.ArgumentParser(description='Packed force-displacement training data for aenet.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('pack', help='build the displaced structures of training XSF files')
+    p.add_argument('xsf', nargs='*', help='training structures (default: *.xsf)')
+    p.add_argument('--archive', help='write one HDF5 archive instead of one .npz per input')
+    p.add_argument('--symmetry', action='store_true', help='skip displacements equivalent by symmetry')
+    p.set_defaults(func=pack)
+    u = sub.add_parser('unpack', help='write XSF files and/or the aenet file list')
+    u.add_argument('packed', nargs='+', help='<name>_FFF.npz files or an HDF5 archive')
+    u.add_argument('--dir', default='', help='directory for the XSF files (e.g. node-local scratch)')
+    u.add_argument('--files-list', help='write the FILES section (count and paths) for generate.in')
+    u.add_argument('--list-only', action='store_true', help='only write the file list, no XSF files')
+    u.set_defaults(func=unpack)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
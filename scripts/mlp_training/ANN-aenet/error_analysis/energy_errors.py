@@ -16,46 +16,15 @@ It also generates a plot comparing the predicted energies against the reference
  
 import numpy
 import matplotlib.pyplot as plt
+from predict_parser import read_predict_out
 
 def get_all_values():
     '''
         get_all_values
-        Read the predict.out file
+        Read the predict.out file (parsed once and cached, see predict_parser.py)
     '''
-    ffile = open('predict.out','r')
-    lines = ffile.readlines()
-    ffile.close()
-    #
-    predicted = []
-    reference = []
-    natoms = []
-    # Total energy
-    for a,line in enumerate(lines):
-        splitt = line.split()
-        if len(splitt) > 1:
-            if splitt[0] == 'Number' and splitt[1] == 'of' and splitt[2] == 'atoms':
-                nat = splitt[4]
-                natoms.append(nat)
-            if splitt[0] == 'File' and splitt[1] == 'name' and splitt[3].find('.ann') == -1: # Not the potentials, just the structures
-                current_struct = splitt[3]
-                # Read reference value from this file! Path is the same as in predict.out
-                ref = open(current_struct,'r')
-                lin = ref.readlines()
-                ref.close()
-                ref_val = float(lin[0].split()[-2])
-            
-                abort = False
-                i = 0
-                while abort == False:
-                    i += 1
-                    splitt2 = lines[a+i].split()
-                    if len(splitt2) > 2:
-                        if splitt2[0] == 'Total':
-                            pred_val = float(splitt2[3])
-                            abort = True
-                predicted.append(pred_val)
-                reference.append(ref_val)                
-    return numpy.array(predicted), numpy.array(reference), numpy.array(natoms)
+    data = read_predict_out('predict.out')
+    return data['energy_pred'], data['energy_ref'], data['natoms']
 
 def calc_errors(predicted,reference):
     me = numpy.sum(predicted - reference)/len(reference)
@@ -1,90 +1,215 @@
 """
-This script reads the 'predict.out' file produced from execution of predict.x in aenet 
+This script reads the 'predict.out' file produced from execution of predict.x in aenet
 to extract predicted and reference energies, forces of test dataset
 and computes force error metrics.
+All errors are computed at once on the concatenated (total_atoms x 3) force arrays of the test set
+and broken down by element and by region. A structure is a slab if the largest gap between its Pt atoms along
+the surface normal (third cell vector, periodic) is at least vacuum_gap; heights are measured across that gap.
+Structures without a cell are slabs along z, structures without Pt have only gas H.
+    surface Pt      - Pt atoms of a slab within layer_tol of its top or bottom Pt layer
+    subsurface Pt   - all other Pt atoms of a slab
+    bulk Pt         - Pt atoms of structures without vacuum gap
+    adsorbed H      - H atoms from layer_tol below to ads_height above the top (or bottom) Pt layer of a slab
+    subsurface H    - H atoms of a slab deeper than layer_tol below the outermost Pt layers
+    gas H           - H atoms further than ads_height from the slab, or in structures without Pt
+    bulk H          - H atoms of structures without vacuum gap
 
     Functions:
         get_all_values()       - Extracts predicted and reference total energies and atomic forces from the 'predict.out' file.
         get_force_errors()     - Calculates maximum force error, RMS force error, and MAE force error for each structure.
+        atom_errors()          - Component, magnitude, vector and angular errors of every atom.
+        surface_heights()      - Height of every atom across the vacuum gap, outermost Pt layers and slab flag.
+        classify_regions()     - Region of every atom (surface/subsurface/bulk Pt, adsorbed/subsurface/gas/bulk H).
+        error_table()          - Counts, MAE, RMSE and percentiles of the errors per group of atoms.
+        plot_histograms()      - Histograms of the force errors per region.
         main()                 - Main function that processes the data, calculates force errors, and prints the average force errors.
 
     Output:
-        Printed values for average "Max force error", "RMS force error", and "MA force error" (in eV/Angstrom).
-""" 
+        Printed values for average "Max force error", "RMS force error", and "MA force error" (in eV/Angstrom),
+        tables of the errors per element and per region, and a plot ('force_errors_hist.png').
+"""
 
 import numpy
-from ase.io import read
 import matplotlib.pyplot as plt
+from predict_parser import read_predict_out
+
+layer_tol = 1.0     # Angstrom, Pt within this distance of the outermost Pt are in the surface layer (Pt(111): 2.27 A between layers)
+ads_height = 2.0    # Angstrom, H closer than this to the outermost Pt layers are adsorbed
+vacuum_gap = 5.0    # Angstrom, structures with a larger gap between Pt atoms along the surface normal are slabs
+min_force = 0.05    # eV/Angstrom, angular errors are only computed for reference forces larger than this
+regions = ['surface Pt', 'subsurface Pt', 'bulk Pt', 'adsorbed H', 'subsurface H', 'gas H', 'bulk H', 'other']
+percentiles = [50, 90, 95, 99]
 
 def get_all_values():
     '''
         get_all_values
-        Read the predict.out file
+        Read the predict.out file (parsed once and cached, see predict_parser.py)
+    '''
+    return read_predict_out('predict.out')
+
+def get_force_errors(pforces,rforces,offsets):
+    '''
+        get_force_errors
+        Max, RMS and MA force error of every structure from concatenated forces and per-structure atom offsets
     '''
-    ffile = open('predict.out','r')
-    lines = ffile.readlines()
-    ffile.close()
-    #
-    predicted = []
-    reference = []
-    predicted_forces = []
-    reference_forces = []
-    # Total energy and forces
-    for a,line in enumerate(lines):
-        splitt = line.split()
-        if len(splitt) > 1:
-            if splitt[0] == 'File' and splitt[1] == 'name' and splitt[3].find('.ann') == -1: # Not the potentials, just the structures
-                current_struct = splitt[3]
-                # Read reference value from this file! Path is the same as in predict.out
-                ref = open(current_struct,'r')
-                lin = ref.readlines()
-                ref.close()
-                ref_val = float(lin[0].split()[-2])
-                ref_forces = read(current_struct).get_forces()/27.211386245988
-                pred_forces = numpy.zeros_like(ref_forces)
-
-                i = 0
-                while lines[a+i].find('corresponding atomic forces')<0:
-                    i += 1
-                while lines[a+i].find('-----')<0:
-                    i += 1
-                i += 1
-                for j in range(len(pred_forces)):
-                    pred_forces[j][:] = [float(x) for x in lines[a+i].split()[-3:]]
-                    i += 1
-                while lines[a+i].find('Total energy')<0:
-                    i += 1
-                pred_val = float(lines[a+i].split()[3])
-
-                predicted.append(pred_val)
-                reference.append(ref_val)
-                predicted_forces.append(pred_forces)
-                reference_forces.append(ref_forces)
-    return numpy.array(predicted), numpy.array(reference), predicted_forces, reference_forces
-
-def get_force_errors(pforces,rforces):
+    #length of difference force vector on each atom:
+    d = numpy.linalg.norm(pforces - rforces,axis=1)
+    natoms = numpy.diff(offsets)
     #max force error on individual atom
-    max_forces = numpy.empty(len(pforces))
+    max_forces = numpy.maximum.reduceat(d, offsets[:-1])
     #RMS error
-    rms_forces = numpy.empty(len(pforces))
+    rms_forces = (numpy.add.reduceat(d**2, offsets[:-1])/natoms)**0.5
     #MAE error
-    mae_forces = numpy.empty(len(pforces))
-    for i,(p,r) in enumerate(zip(pforces,rforces)):
-        diff = p - r
-        #length of difference force vector on each atom:
-        d = numpy.linalg.norm(diff,axis=1)
-        max_forces[i] = numpy.max(d)
-        rms_forces[i] = numpy.average(d**2)**0.5
-        mae_forces[i] = numpy.average(d)
+    mae_forces = numpy.add.reduceat(d, offsets[:-1])/natoms
     return max_forces, rms_forces, mae_forces
 
+def atom_errors(pforces, rforces):
+    '''
+        atom_errors
+        Per-atom errors: component (N x 3), magnitude |Fp|-|Fr|, vector |Fp-Fr| and angle between Fp and Fr (degrees,
+        NaN for reference forces below min_force)
+    '''
+    component = pforces - rforces
+    pnorm = numpy.linalg.norm(pforces, axis=1)
+    rnorm = numpy.linalg.norm(rforces, axis=1)
+    cosine = numpy.einsum('ij,ij->i', pforces, rforces) / numpy.maximum(pnorm*rnorm, 1e-12)
+    angle = numpy.degrees(numpy.arccos(numpy.clip(cosine, -1., 1.)))
+    angle[rnorm < min_force] = numpy.nan
+    return {'component': component,
+            'magnitude': pnorm - rnorm,
+            'vector': numpy.linalg.norm(component, axis=1),
+            'angle': angle}
+
+def surface_heights(data):
+    '''
+        surface_heights
+        Height of every atom along the surface normal, measured from the middle of the largest (periodic) gap
+        between the Pt atoms of its structure, the heights of the bottom and top Pt layer, and whether the
+        structure is a slab (gap of at least vacuum_gap). Without a cell the heights are the z coordinates.
+    '''
+    natoms = data['natoms']
+    structure = numpy.repeat(numpy.arange(len(natoms)), natoms)
+    pt = data['symbols'] == 'Pt'
+    cells = data['cells']
+    volume = numpy.abs(numpy.linalg.det(cells))
+    periodic = volume > 1e-6
+    height = data['positions'][:, 2].copy()
+    # without a cell: outermost Pt along z (structures without Pt have no surface)
+    ztop = numpy.full(len(natoms), -numpy.inf)
+    zbottom = numpy.full(len(natoms), numpy.inf)
+    numpy.maximum.at(ztop, structure[pt], height[pt])
+    numpy.minimum.at(zbottom, structure[pt], height[pt])
+    slab = ~periodic & numpy.isfinite(ztop)
+
+    inv = numpy.zeros_like(cells)
+    inv[periodic] = numpy.linalg.inv(cells[periodic])
+    # fractional coordinate along c and distance between the lattice planes along the surface normal
+    frac = numpy.einsum('ij,ij->i', data['positions'], inv[structure][:, :, 2]) % 1.0
+    spacing = numpy.where(periodic, volume/numpy.maximum(numpy.linalg.norm(numpy.cross(cells[:, 0], cells[:, 1]), axis=1), 1e-12), 0.)
+    ipt = numpy.nonzero(pt & periodic[structure])[0]
+    if len(ipt):
+        order = ipt[numpy.lexsort((frac[ipt], structure[ipt]))]
+        s, f = structure[order], frac[order]
+        first = numpy.nonzero(numpy.r_[True, s[1:] != s[:-1]])[0]
+        group = numpy.cumsum(numpy.r_[True, s[1:] != s[:-1]]) - 1
+        last = numpy.r_[s[1:] != s[:-1], True]
+        # gap above every Pt atom to the next Pt atom of its structure, the last one wraps around
+        above = numpy.r_[f[1:], 0.]
+        above[last] = f[first[group[last]]] + 1.
+        gap = above - f
+        widest = numpy.maximum.reduceat(gap, first)
+        candidates = numpy.nonzero(gap == widest[group])[0]
+        _, pick = numpy.unique(group[candidates], return_index=True)
+        below_gap = f[candidates[pick]]
+        periodic_pt = s[first]
+        middle = numpy.zeros(len(natoms))
+        width = numpy.zeros(len(natoms))
+        middle[periodic_pt] = below_gap + widest/2
+        width[periodic_pt] = widest
+        inside = numpy.isin(structure, periodic_pt)
+        height[inside] = ((frac[inside] - middle[structure[inside]]) % 1.0) * spacing[structure[inside]]
+        zbottom[periodic_pt] = width[periodic_pt]/2 * spacing[periodic_pt]
+        ztop[periodic_pt] = (1. - width[periodic_pt]/2) * spacing[periodic_pt]
+        slab[periodic_pt] = width[periodic_pt] * spacing[periodic_pt] >= vacuum_gap
+    return height, ztop[structure], zbottom[structure], slab[structure]
+
+def classify_regions(data):
+    '''
+        classify_regions
+        Index into regions for every atom, from its height relative to the outermost Pt layers of its structure
+    '''
+    z, ztop, zbottom, slab = surface_heights(data)
+    pt = data['symbols'] == 'Pt'
+    h = data['symbols'] == 'H'
+    has_pt = numpy.isfinite(ztop)
+    region = numpy.full(len(z), regions.index('other'))
+    surface = pt & slab & ((z > ztop - layer_tol) | (z < zbottom + layer_tol))
+    region[pt & slab] = regions.index('subsurface Pt')
+    region[surface] = regions.index('surface Pt')
+    region[pt & ~slab] = regions.index('bulk Pt')
+    adsorbed = ((z > ztop - layer_tol) & (z < ztop + ads_height)) | ((z < zbottom + layer_tol) & (z > zbottom - ads_height))
+    subsurface = (z <= ztop - layer_tol) & (z >= zbottom + layer_tol)
+    region[h] = regions.index('gas H')
+    region[h & slab & adsorbed] = regions.index('adsorbed H')
+    region[h & slab & subsurface] = regions.index('subsurface H')
+    region[h & has_pt & ~slab] = regions.index('bulk H')
+    return region
+
+def error_table(title, labels, groups, errors):
+    '''
+        error_table
+        Print counts, component MAE/RMSE, MAE of |dF|, percentiles of |dF| and median angular error per group
+    '''
+    header = f'{title:15s} {"atoms":>8s} {"MAE(F_i)":>9s} {"RMSE(F_i)":>9s} {"MAE|dF|":>9s}' \
+             + ''.join(f' {"p"+str(p):>8s}' for p in percentiles) + f' {"max":>8s} {"angle":>7s}'
+    print(header)
+    for g, label in enumerate(labels):
+        mask = groups == g
+        if not numpy.any(mask):
+            continue
+        comp = errors['component'][mask]
+        vec = errors['vector'][mask]
+        angle = errors['angle'][mask]
+        median_angle = numpy.nanmedian(angle) if numpy.any(~numpy.isnan(angle)) else numpy.nan
+        print(f'{label:15s} {numpy.sum(mask):8d} {numpy.mean(numpy.abs(comp)):9.4f} {numpy.sqrt(numpy.mean(comp**2)):9.4f} '
+              f'{numpy.mean(vec):9.4f}' + ''.join(f' {v:8.4f}' for v in numpy.percentile(vec, percentiles))
+              + f' {numpy.max(vec):8.4f} {median_angle:7.2f}')
+    print()
+
+def plot_histograms(region, errors, filename='force_errors_hist.png'):
+    fig, axs = plt.subplots(1, 2, figsize=(12, 4.5))
+    bins = numpy.linspace(0, numpy.percentile(errors['vector'], 99.9), 60)
+    for r, label in enumerate(regions):
+        mask = region == r
+        if not numpy.any(mask):
+            continue
+        axs[0].hist(errors['vector'][mask], bins=bins, histtype='step', density=True, label=f'{label} ({numpy.sum(mask)})')
+        angle = errors['angle'][mask]
+        axs[1].hist(angle[~numpy.isnan(angle)], bins=numpy.linspace(0, 180, 61), histtype='step', density=True, label=label)
+    axs[0].set_xlabel('|F$_{ML}$ - F$_{DFT}$| [eV/Å]', fontsize=12)
+    axs[0].set_yscale('log')
+    axs[1].set_xlabel('angle between F$_{ML}$ and F$_{DFT}$ [°]', fontsize=12)
+    for ax in axs:
+        ax.set_ylabel('density', fontsize=12)
+        ax.legend(fontsize=9)
+    fig.tight_layout()
+    fig.savefig(filename)
+
 def main():
-    predicted, reference, predicted_forces, reference_forces = get_all_values()
-    max_forces, rms_forces, mae_forces = get_force_errors(predicted_forces, reference_forces)
+    data = get_all_values()
+    max_forces, rms_forces, mae_forces = get_force_errors(data['forces_pred'], data['forces_ref'], data['offsets'])
     #max_...,rms_..., and mae_forces are numpy array with length equaling to number of structures in predict.out
     print(f'Average "Max force error": {numpy.average(max_forces):10.6f} eV/Ang')
     print(f'Average "RMS force error": {numpy.average(rms_forces):10.6f} eV/Ang')
     print(f'Average "MA force error": {numpy.average(mae_forces):10.6f} eV/Ang')
+    print()
+
+    errors = atom_errors(data['forces_pred'], data['forces_ref'])
+    elements, element_index = numpy.unique(data['symbols'], return_inverse=True)
+    error_table('element', elements, element_index, errors)
+    region = classify_regions(data)
+    error_table('region', regions, region, errors)
+    plot_histograms(region, errors)
 
 
 if __name__ == '__main__':
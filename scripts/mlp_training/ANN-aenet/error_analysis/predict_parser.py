@@ -0,0 +1,147 @@
+"""
+Single-pass parser for the 'predict.out' file produced by predict.x in aenet, shared by the error analysis scripts
+(energy_errors.py, force_errors.py, Eads_errors.py and the ensemble scripts in nn_ensembles/ANN).
+Structure names, atom counts, predicted energies and per-atom coordinates and forces are extracted into typed arrays
+in one streaming pass; the reference (DFT) energies, forces and cells are read in bulk from the structure files
+named in predict.out. The result is cached next to predict.out as '<predict.out>.npz' and reused as long as
+size and modification time of predict.out are unchanged.
+
+    Functions:
+        read_predict_out()     - Parsed predictions (and optionally references) as a dict of arrays, cached.
+        parse_predict_out()    - Streaming parser for predict.out without the cache.
+        read_references()      - Reference energies, forces and cells of a list of XSF files.
+        split_atoms()          - Split a concatenated (total_atoms x ...) array into per-structure arrays.
+
+    Arrays (structures in the order of predict.out, atoms concatenated in that order):
+        names, natoms, offsets (n+1), energy_pred, symbols, positions, forces_pred
+        energy_ref, forces_ref, cells                                 (with references=True)
+"""
+
+import os
+import numpy
+
+cache_version = 1
+
+def parse_predict_out(filename='predict.out'):
+    '''
+        parse_predict_out
+        Streaming parse of predict.out
+    '''
+    names = []
+    natoms = []
+    energies = []
+    symbols = []
+    positions = []
+    forces = []
+    current = None
+    nat = None
+    with open(filename, 'r') as ffile:
+        for line in ffile:
+            splitt = line.split()
+            if len(splitt) < 2:
+                continue
+            if splitt[0] == 'Number' and splitt[1] == 'of' and splitt[2] == 'atoms':
+                nat = int(splitt[4])
+            elif splitt[0] == 'File' and splitt[1] == 'name' and splitt[3].find('.ann') == -1: # Not the potentials, just the structures
+                current = splitt[3]
+            elif current is not None and line.find('corresponding atomic forces')>-1:
+                # skip to the table, then read one row per atom: symbol x y z Fx Fy Fz
+                for line in ffile:
+                    if line.find('-----')>-1:
+                        break
+                count = 0
+                for line in ffile:
+                    row = line.split()
+                    if len(row) < 6 or line.find('-----')>-1:
+                        break
+                    symbols.append(row[0] if len(row) > 6 else '')
+                    positions.append(row[-6:-3])
+                    forces.append(row[-3:])
+                    count += 1
+                    if count == nat:
+                        break
+            elif current is not None and splitt[0] == 'Total' and len(splitt) > 3:
+                names.append(current)
+                energies.append(float(splitt[3]))
+                natoms.append(nat)
+                current = None
+    natoms = numpy.array(natoms, dtype=int)
+    data = {'names': numpy.array(names),
+            'natoms': natoms,
+            'offsets': numpy.concatenate(([0], numpy.cumsum(natoms))),
+            'energy_pred': numpy.array(energies),
+            'symbols': numpy.array(symbols),
+            'positions': numpy.array(positions, dtype=float).reshape(-1, 3),
+            'forces_pred': numpy.array(forces, dtype=float).reshape(-1, 3)}
+    if len(data['forces_pred']) != data['offsets'][-1]:
+        # predict.x was run without forces
+        data['forces_pred'] = numpy.full((data['offsets'][-1], 3), numpy.nan)
+    return data
+
+def read_references(names, natoms):
+    '''
+        read_references
+        Reference energy (first line), cell (PRIMVEC) and forces (PRIMCOORD or ATOMS, eV/Angstrom) of every XSF file.
+        Path is the same as in predict.out. Forces of a file with an unexpected number of atoms are NaN.
+    '''
+    energies = numpy.empty(len(names))
+    cells = numpy.zeros((len(names), 3, 3))
+    forces = numpy.full((numpy.sum(natoms), 3), numpy.nan)
+    offset = 0
+    for n, (name, nat) in enumerate(zip(names, natoms)):
+        with open(name, 'r') as ref:
+            lines = ref.readlines()
+        energies[n] = float(lines[0].split()[-2])
+        rows = []
+        for i, line in enumerate(lines):
+            key = line.strip()
+            if key == 'PRIMVEC':
+                cells[n] = [[float(x) for x in lines[i+k].split()[:3]] for k in range(1, 4)]
+            elif key == 'PRIMCOORD':
+                rows = [l.split()[4:7] for l in lines[i+2:i+2+int(lines[i+1].split()[0])]]
+                break
+            elif key == 'ATOMS':
+                for l in lines[i+1:]:
+                    if len(l.split()) < 7:
+                        break
+                    rows.append(l.split()[4:7])
+                break
+        if len(rows) == nat:
+            forces[offset:offset+nat] = numpy.array(rows, dtype=float)
+        offset += nat
+    return energies, forces, cells
+
+def read_predict_out(filename='predict.out', references=True, cache=True):
+    '''
+        read_predict_out
+        Parsed predict.out (and reference values) as a dict of arrays, using and updating the .npz cache
+    '''
+    st = os.stat(filename)
+    stamp = numpy.array([st.st_size, st.st_mtime_ns], dtype=numpy.int64)
+    cache_file = filename + '.npz'
+    data = None
+    if cache and os.path.exists(cache_file):
+        with numpy.load(cache_file) as cached:
+            if (int(cached['cache_version']) == cache_version and numpy.array_equal(cached['stamp'], stamp)
+                    and (bool(cached['references']) or not references)):
+                data = {key: cached[key] for key in cached.files}
+    if data is None:
+        data = parse_predict_out(filename)
+        data['references'] = numpy.array(False)
+        if references:
+            data['energy_ref'], data['forces_ref'], data['cells'] = read_references(data['names'], data['natoms'])
+            data['references'] = numpy.array(True)
+        if cache:
+            data['stamp'] = stamp
+            data['cache_version'] = numpy.array(cache_version)
+            tmp = f'{cache_file}.{os.getpid()}.tmp.npz'
+            numpy.savez(tmp, **data)
+            os.replace(tmp, cache_file)
+    return data
+
+def split_atoms(data, array):
+    '''
+        split_atoms
+        List of per-structure arrays from a concatenated per-atom array
+    '''
+    return numpy.split(array, data['offsets'][1:-1])
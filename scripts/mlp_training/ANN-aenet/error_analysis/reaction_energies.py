@@ -0,0 +1,141 @@
+"""
+This script evaluates reaction energies (adsorption energies, H2 dissociation, coverage-dependent binding, ...)
+from the predicted and reference total energies in 'predict.out' (parsed with predict_parser.py)
+and computes ME, MAE and RMSE per reaction class.
+
+A reaction class is a linear combination of systems. Every term has a regular expression that is searched in
+the structure names of predict.out; its named groups form the key of the system. The first term is the anchor:
+one reaction is evaluated for every structure it matches, and the other terms are looked up by the values of
+their named groups (a subset of the anchor's groups, e.g. none for a gas-phase reference).
+Each term is indexed once (hash map from key to row), and all reactions of a class are evaluated as array operations.
+
+    Reaction class spec (JSON list, see default_spec for the adsorption energies of Eads_errors.py):
+        name          - label of the reaction class
+        terms         - list of {pattern, coefficient[, multiply]}; the coefficient is multiplied by the
+                        numeric value of the named group 'multiply' (e.g. the number of adsorbed H)
+        divide        - optional named group of the anchor to normalize by (e.g. binding energy per H)
+
+    Functions:
+        index_term()          - Hash index from system key to row and all matches of one term.
+        build_reactions()     - Rows and coefficients of all reactions of one class.
+        evaluate()            - Predicted and reference energies of all reaction classes.
+        calc_errors()         - ME, MAE and RMSE between predicted and reference values.
+
+Usage:
+    python reaction_energies.py [--spec reactions.json] [--predict predict.out]
+"""
+
+import os
+import re
+import json
+import argparse
+import numpy
+from predict_parser import read_predict_out
+
+# structures are paired by the first two '_'-separated fields of the file name,
+# relaxed/unrelaxed and combined/clean are taken from the path (combined takes precedence)
+_key = r'(?:^|/)(?P<m1>[^/_]*)_(?P<m2>[^/_]*)[^/]*$'
+default_spec = [
+    {'name': 'adsorption (unrelaxed)',
+     'terms': [{'pattern': r'^(?=.*unrelaxed)(?=.*combined).*' + _key, 'coefficient': 1},
+               {'pattern': r'^(?=.*unrelaxed)(?!.*combined)(?=.*clean).*' + _key, 'coefficient': -1}]},
+    {'name': 'adsorption (relaxed)',
+     'terms': [{'pattern': r'^(?!.*unrelaxed)(?=.*relaxed)(?=.*combined).*' + _key, 'coefficient': 1},
+               {'pattern': r'^(?!.*unrelaxed)(?=.*relaxed)(?!.*combined)(?=.*clean).*' + _key, 'coefficient': -1}]},
+]
+
+def index_term(names, pattern):
+    '''
+        index_term
+        {key: row} of the structures matching a term (first occurrence of every key), key = values of the named groups,
+        and (row, key) of every match in order
+    '''
+    regex = re.compile(pattern)
+    groups = sorted(regex.groupindex)
+    index = {}
+    matches = []
+    for row, name in enumerate(names):
+        match = regex.search(name)
+        if match:
+            key = tuple(match.group(g) for g in groups)
+            index.setdefault(key, row)
+            matches.append((row, key))
+    return groups, index, matches
+
+def build_reactions(names, reaction):
+    '''
+        build_reactions
+        Rows (n x terms), coefficients (n x terms) and labels of all reactions of one class, one reaction for every
+        structure matching the anchor (several structures may share a key, e.g. different coverages of one slab).
+        Anchors for which a term has no matching system are reported and skipped.
+    '''
+    terms = reaction['terms']
+    indexed = [index_term(names, term['pattern']) for term in terms]
+    anchor_groups, _, anchor_matches = indexed[0]
+    rows, coefficients, labels = [], [], []
+    skipped = []
+    for row, key in anchor_matches:
+        values = dict(zip(anchor_groups, key))
+        found = [row]
+        for groups, index, _ in indexed[1:]:
+            found.append(index.get(tuple(values[g] for g in groups)))
+        if None in found:
+            skipped.append(os.path.basename(names[row]))
+            continue
+        coefs = [term['coefficient'] * (float(values[term['multiply']]) if 'multiply' in term else 1.) for term in terms]
+        if 'divide' in reaction:
+            coefs = [c / float(values[reaction['divide']]) for c in coefs]
+        rows.append(found)
+        coefficients.append(coefs)
+        labels.append(os.path.basename(names[row]))
+    if skipped:
+        print(f'{reaction["name"]}: no matching systems for {len(skipped)} structures, skipped: {", ".join(skipped[:5])}')
+    return (numpy.array(rows, dtype=int).reshape(-1, len(terms)),
+            numpy.array(coefficients, dtype=float).reshape(-1, len(terms)),
+            numpy.array(labels))
+
+def evaluate(names, predicted, reference, spec=default_spec):
+    '''
+        evaluate
+        {reaction class: (labels, predicted reaction energies, reference reaction energies)}
+    '''
+    results = {}
+    for reaction in spec:
+        rows, coefficients, labels = build_reactions(names, reaction)
+        results[reaction['name']] = (labels,
+                                     numpy.sum(predicted[rows] * coefficients, axis=1),
+                                     numpy.sum(reference[rows] * coefficients, axis=1))
+    return results
+
+def calc_errors(predicted,reference):
+    '''
+        Calculate ME, MAE, and RMSE between predicted and reference values
+    '''
+    me = numpy.sum(predicted - reference)/len(reference)
+    mae = numpy.sum(abs(predicted - reference))/len(reference)
+    rmse = numpy.sqrt((sum((predicted - reference)**2))/len(reference))
+    return me, mae, rmse
+
+def report(results):
+    for name, (labels, pred, ref) in results.items():
+        if len(labels):
+            me, mae, rmse = calc_errors(pred, ref)
+            print(f'{name:30s} {len(labels):6d} reactions   ME: {me:8.4f} eV   MAE: {mae:8.4f} eV   RMSE: {rmse:8.4f} eV')
+        else:
+            print(f'{name:30s}      0 reactions')
+
+def main():
+    parser = argparse.ArgumentParser(description='Errors of reaction energies from aenet predict.out.')
+    parser.add_argument('--spec', help='JSON list of reaction classes (default: adsorption energies as in Eads_errors.py)')
+    parser.add_argument('--predict', default='predict.out')
+    args = parser.parse_args()
+    spec = default_spec
+    if args.spec:
+        with open(args.spec, 'r') as ffile:
+            spec = json.load(ffile)
+    data = read_predict_out(args.predict)
+    report(evaluate(data['names'], data['energy_pred'], data['energy_ref'], spec))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,26 @@
 """
 This script reads the 'train.out' file, to extract and plot the Mean Absolute Error (MAE) values 
 for both the training and test sets across different iterations of ML potential training. 
+The table is parsed with TrainLog of train_monitor.py, which also follows a running training.
 """
 
-import numpy
+import os
+import sys
 import matplotlib.pyplot as plt
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from train_monitor import TrainLog
 
-def get_train_test_MAE():
+def get_train_test_MAE(skip=251):
     '''
         get_train_test_MAE
         Read train.out, extract MAE for training and test set.
+        Epochs before skip are left out (the initial steps where the error drops sharply).
     '''
-    ffile = open('train.out','r')
-    lines = ffile.readlines()
-    ffile.close()
-    #
-    mae_train = []
-    mae_test  = []
-    step = []
-    # Total energy
-    for a,line in enumerate(lines):
-        splitt = line.split()
-        if len(splitt) > 1:
-            if splitt[0] == '|------------TRAIN-----------|' and splitt[1] == '|------------TEST------------|': 
-                i = 252 # choose to skip the initial steps where the error drops sharply
-                stop = False
-                while not stop:
-                    i += 1
-                    splitt2 = lines[a+i].split()
-                    if len(splitt2) == 0:
-                        stop = True
-                    else:
-                        mae_train.append(float(splitt2[1]))
-                        mae_test.append(float(splitt2[3]))
-                        step.append(i)
-    return numpy.array(mae_train), numpy.array(mae_test), numpy.array(step)
+    log = TrainLog('train.out')
+    log.update()
+    step = log.array('epoch')
+    keep = step >= skip
+    return log.array('train_mae')[keep], log.array('test_mae')[keep], step[keep]
 
 def plot_stuff():
     # Plot training and test MAE
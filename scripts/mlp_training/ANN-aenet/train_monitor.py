@@ -0,0 +1,275 @@
+"""
+This script monitors the training of an aenet potential (train.x) while it runs and stops it early.
+train.out is followed incrementally (only the bytes written since the last poll are read) and the
+TRAIN/TEST MAE and RMSE table is parsed as it grows. A plot of the errors (train_monitor.png) is kept up to date,
+and train.x is stopped once the test error has not improved for a number of epochs (patience).
+The networks of the best epoch are kept in best/ if train.x writes per-epoch network files
+(file names given by --checkpoint-format, e.g. H.30t-30t-30t.ann-00042); on an early stop they are
+copied back to the network files named in train.in if the monitor started train.x itself (--run), otherwise
+only with --restore (they stay in best/). Without per-epoch network files train.x is not stopped
+(it writes the networks only at the end of the training), the monitor only reports the best epoch.
+Without --run/--pid the monitor ends when train.out has not grown for --timeout seconds (e.g. a crashed run).
+
+Usage:
+    python train_monitor.py --run "mpirun -np 120 train.x train.in"   # start train.x, output to train.out
+    python train_monitor.py --pid <PID of train.x/mpirun>              # attach to a running training
+    python train_monitor.py                                            # only monitor and report
+
+    Options: --patience 200 --min-delta 0.0 --min-epochs 300 --metric test_mae --plot-every 60 --poll 10 --timeout 3600 [--restore]
+"""
+
+import os
+import time
+import shlex
+import shutil
+import signal
+import argparse
+import subprocess
+import numpy
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+columns = ['epoch', 'train_mae', 'train_rmse', 'test_mae', 'test_rmse']
+
+class TrainLog:
+    '''
+        TrainLog
+        Incremental reader of the error table in train.out
+    '''
+    def __init__(self, filename='train.out'):
+        self.filename = filename
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.partial = b''
+        self.in_table = False
+        self.finished = False
+        self.rows = []
+
+    def update(self):
+        '''
+            update
+            Parse the lines appended since the last call; returns the number of new epochs
+        '''
+        if not os.path.exists(self.filename):
+            return 0
+        if os.path.getsize(self.filename) < self.offset:
+            # train.out was truncated by a new run
+            self.reset()
+        with open(self.filename, 'rb') as ffile:
+            ffile.seek(self.offset)
+            chunk = ffile.read()
+        self.offset += len(chunk)
+        lines = (self.partial + chunk).split(b'\n')
+        self.partial = lines.pop()   # incomplete last line, completed by the next read
+        n = len(self.rows)
+        for line in lines:
+            splitt = line.split()
+            if not self.in_table:
+                if len(splitt) > 1 and splitt[0].startswith(b'|----') and splitt[0].find(b'TRAIN') > -1:
+                    self.in_table = True
+            elif len(splitt) == 0:
+                if len(self.rows) > 0:
+                    self.in_table = False
+            elif splitt[0].isdigit():
+                self.rows.append([float(x) for x in splitt[:5]])
+            if line.find(b'Training finished') > -1:
+                self.finished = True
+        return len(self.rows) - n
+
+    def array(self, name):
+        return numpy.array([row[columns.index(name)] for row in self.rows])
+
+class EarlyStopping:
+    '''
+        EarlyStopping
+        Stop when the metric has not improved by more than min_delta for patience epochs (after min_epochs)
+    '''
+    def __init__(self, patience=200, min_delta=0.0, min_epochs=0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.min_epochs = min_epochs
+        self.best_epoch = None
+        self.best_value = numpy.inf
+
+    def update(self, epoch, value):
+        '''
+            update
+            Feed one epoch; returns True if this epoch is a new best
+        '''
+        if value < self.best_value - self.min_delta:
+            self.best_value = value
+            self.best_epoch = epoch
+            return True
+        return False
+
+    def should_stop(self, epoch):
+        return (self.best_epoch is not None and epoch >= self.min_epochs
+                and epoch - self.best_epoch >= self.patience)
+
+def read_networks(train_in='train.in'):
+    '''
+        read_networks
+        Network file names from the NETWORKS block of train.in
+    '''
+    networks = []
+    with open(train_in, 'r') as ffile:
+        lines = ffile.readlines()
+    for i, line in enumerate(lines):
+        if line.strip().upper() == 'NETWORKS':
+            for l in lines[i+1:]:
+                splitt = l.split()
+                if len(splitt) == 0:
+                    break
+                if splitt[0].startswith('!'):
+                    continue
+                networks.append(splitt[1])
+            break
+    return networks
+
+def keep_best(networks, epoch, checkpoint_format, best_dir='best'):
+    '''
+        keep_best
+        Copy the per-epoch network files of the best epoch to best_dir; returns False if they do not exist
+    '''
+    files = [checkpoint_format.format(network=network, epoch=epoch) for network in networks]
+    if not networks or not all(os.path.exists(f) for f in files):
+        return False
+    os.makedirs(best_dir, exist_ok=True)
+    for network, f in zip(networks, files):
+        shutil.copy(f, os.path.join(best_dir, network))
+    return True
+
+def plot_log(log, stopper, filename='train_monitor.png', skip=0):
+    epoch = log.array('epoch')
+    keep = epoch >= skip
+    fig, ax = plt.subplots()
+    ax.plot(epoch[keep], log.array('train_mae')[keep], '-', color='green', linewidth=2.0, label='Training set')
+    ax.plot(epoch[keep], log.array('test_mae')[keep], '-', color='red', linewidth=2.0, label='Test set')
+    if stopper.best_epoch is not None:
+        ax.axvline(stopper.best_epoch, color='grey', linestyle='--', label=f'best epoch {stopper.best_epoch:.0f}')
+    ax.set_yscale('log')
+    ax.set_xlabel('Training iteration', fontsize=15, labelpad=10)
+    ax.set_ylabel('MAE [eV]', fontsize=15, labelpad=10)
+    ax.legend(fontsize=12)
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+
+def stop_process(proc, pid):
+    # train.x is usually started through mpirun: signal the whole process group
+    if proc is not None:
+        os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
+        try:
+            proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
+    elif pid is not None:
+        os.kill(pid, signal.SIGTERM)
+        for i in range(60):
+            if not running(None, pid):
+                break
+            time.sleep(1.)
+
+def running(proc, pid):
+    if proc is not None:
+        return proc.poll() is None
+    if pid is not None:
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        return True
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Follow train.out of aenet train.x and stop the training early.')
+    parser.add_argument('--run', help='command that starts train.x (its output is written to --train-out)')
+    parser.add_argument('--pid', type=int, help='PID of a running train.x (or mpirun) to stop')
+    parser.add_argument('--train-out', default='train.out')
+    parser.add_argument('--train-in', default='train.in')
+    parser.add_argument('--metric', default='test_mae', choices=columns[1:])
+    parser.add_argument('--patience', type=int, default=200, help='epochs without improvement before stopping')
+    parser.add_argument('--min-delta', type=float, default=0.0, help='improvement (eV) that resets the patience')
+    parser.add_argument('--min-epochs', type=int, default=0, help='never stop before this epoch')
+    parser.add_argument('--checkpoint-format', default='{network}-{epoch:05d}', help='file names of per-epoch networks')
+    parser.add_argument('--plot-every', type=float, default=60., help='seconds between plot updates')
+    parser.add_argument('--skip', type=int, default=0, help='first epoch shown in the plot')
+    parser.add_argument('--poll', type=float, default=10., help='seconds between reads of train.out')
+    parser.add_argument('--restore', action='store_true', help='copy the networks of the best epoch over the network '
+                        'files also if train.x was not started by the monitor (--run)')
+    parser.add_argument('--timeout', type=float, default=3600., help='seconds without new output in train.out after which '
+                        'the monitor ends if there is no process to follow')
+    args = parser.parse_args()
+
+    proc = None
+    if args.run:
+        out = open(args.train_out, 'w')
+        proc = subprocess.Popen(shlex.split(args.run), stdout=out, stderr=subprocess.STDOUT, start_new_session=True)
+    networks = read_networks(args.train_in) if os.path.exists(args.train_in) else []
+    log = TrainLog(args.train_out)
+    stopper = EarlyStopping(args.patience, args.min_delta, args.min_epochs)
+    have_best = False
+    saved_epoch = None
+    last_plot = 0.
+    last_output = time.time()
+    stopped = None
+    warned = False
+    stalled = False
+    while True:
+        alive = running(proc, args.pid)
+        offset = log.offset
+        n_new = log.update()
+        if log.offset != offset:
+            last_output = time.time()
+        if stopped is None:
+            for row in log.rows[len(log.rows)-n_new:]:
+                stopper.update(int(row[0]), row[columns.index(args.metric)])
+                if stopper.should_stop(int(row[0])):
+                    stopped = int(row[0])
+                    break
+        stalled = alive is None and time.time() - last_output > args.timeout
+        finished = log.finished or alive is False or stalled
+        stop_now = stopped is not None and not warned
+        if (n_new and time.time() - last_plot > args.plot_every) or stop_now or finished:
+            # the networks of the best epoch are copied (at most) once per plot update
+            if stopper.best_epoch is not None and stopper.best_epoch != saved_epoch:
+                have_best = keep_best(networks, stopper.best_epoch, args.checkpoint_format)
+                saved_epoch = stopper.best_epoch
+            if len(log.rows):
+                plot_log(log, stopper, skip=args.skip)
+            last_plot = time.time()
+        if finished or (stop_now and have_best):
+            break
+        if stop_now:
+            # train.x writes the networks only when it finishes: stopping it now would leave none
+            print(f'No improvement of {args.metric} for {args.patience} epochs at epoch {stopped}, but no per-epoch '
+                  f'network files found: letting train.x finish')
+            warned = True
+        time.sleep(args.poll)
+
+    if stalled:
+        print(f'No new output in {args.train_out} for {args.timeout:.0f} s and no process to follow (use --run or --pid)')
+    if stopped is not None and have_best:
+        print(f'No improvement of {args.metric} for {args.patience} epochs, stopping the training at epoch {stopped}')
+        if alive:
+            stop_process(proc, args.pid)
+        else:
+            print('No process to stop (use --run or --pid)')
+    if len(log.rows):
+        print(f'Best epoch {stopper.best_epoch}: {args.metric} = {stopper.best_value:.6E} eV')
+    if stopped is not None and have_best and (proc is not None or args.restore):
+        for network in networks:
+            shutil.copy(os.path.join('best', network), network)
+        print(f'Networks of epoch {stopper.best_epoch} restored: {" ".join(networks)}')
+    elif stopped is not None and have_best:
+        # train.x was not started here and may still write the network files
+        print(f'Networks of epoch {stopper.best_epoch} kept in best/ (use --restore to copy them over {" ".join(networks)})')
+    elif stopped is not None:
+        print(f'The networks written by train.x are those of the last epoch, not of the best epoch {stopper.best_epoch}')
+
+
+if __name__ == '__main__':
+    main()
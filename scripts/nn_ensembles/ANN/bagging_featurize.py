@@ -0,0 +1,161 @@
+"""
+This script builds the training sets of aenet bootstrap ensembles from a single featurization.
+Instead of one generate.in per bag (bagging_make_generate.py), where generate.x recomputes the
+symmetry-function fingerprints of every structure in every bag (and of duplicates within a bag),
+every unique structure is featurized exactly once and the training file of each bag (n_ref.train) is
+assembled from the cached fingerprints by index and multiplicity.
+The bags are the same as those of bagging_make_generate.py (same structures, same random state).
+
+    1) python bagging_featurize.py prepare      -> unique_generate.in, bags_ann.npz
+    2) generate.x unique_generate.in            -> ref.train (fingerprints of all unique structures)
+    3) python bagging_featurize.py compose      -> 0_ref.train, 1_ref.train, ...
+
+The training-set file is read and written record by record (Fortran unformatted sequential, 4-byte record markers)
+with the layout written by aenet's generate.x:
+    header:    nTypes | nStrucs | typeName(:) | E_atom(:) | normalized | scale | shift
+    structure: len(filename) | filename | nAtoms, nTypes | energy | per atom: itype | coo(3) | for(3) | nsf | sf(nsf)
+    footer:    nAtomsTot | E_min, E_max, E_av | setups of all types (fingerprint statistics)
+nStrucs, nAtomsTot and the energy statistics are recomputed for every bag; the setups, including the
+fingerprint ranges used for normalization, are those of the full (unique) set and are copied unchanged.
+"""
+
+import mmap
+import glob
+import struct
+import argparse
+import numpy
+from bagging_make_generate import write_input
+
+manifest_file = 'bags_ann.npz'
+
+def fortran_records(buf, start=0, stop=None):
+    '''
+        fortran_records
+        (payload offset, payload length) of the unformatted sequential records in buf[start:stop]
+    '''
+    stop = len(buf) if stop is None else stop
+    records = []
+    pos = start
+    while pos < stop:
+        n = struct.unpack_from('<i', buf, pos)[0]
+        if n < 0 or pos + 8 + n > stop or struct.unpack_from('<i', buf, pos + 4 + n)[0] != n:
+            raise ValueError(f'corrupt record marker at byte {pos}')
+        records.append((pos + 4, n))
+        pos += 8 + n
+    return records
+
+def record_bytes(payload):
+    marker = struct.pack('<i', len(payload))
+    return marker + payload + marker
+
+def split_trainset(buf, names):
+    '''
+        split_trainset
+        Locate header, structure blocks and footer of a training-set file.
+        names are the structure files in the order given to generate.x; they are used to validate the layout.
+        Returns (header end, [(block start, block end, nAtoms, energy)], footer start)
+    '''
+    records = fortran_records(buf)
+    def rec(i):
+        off, n = records[i]
+        return buf[off:off+n]
+    ntypes = struct.unpack('<i', rec(0))[0]
+    nstrucs = struct.unpack('<i', rec(1))[0]
+    if nstrucs != len(names) or len(rec(2)) != 2*ntypes:
+        raise ValueError(f'unexpected training-set header: {nstrucs} structures and {ntypes} types, '
+                         f'expected {len(names)} structures')
+    header_end = records[7][0] - 4
+    blocks = []
+    r = 7
+    for name in names:
+        fname = rec(r+1).decode()
+        if fname.strip() != name.strip():
+            raise ValueError(f'structure {len(blocks)+1} is {fname}, expected {name}')
+        natoms = struct.unpack('<ii', rec(r+2))[0]
+        energy = struct.unpack('<d', rec(r+3))[0]
+        start = records[r][0] - 4
+        r += 4 + 5*natoms
+        end = records[r-1][0] + records[r-1][1] + 4
+        blocks.append((start, end, natoms, energy))
+    return header_end, blocks, records[r][0] - 4
+
+def energy_stats(natoms, energies):
+    per_atom = energies/natoms
+    return numpy.min(per_atom), numpy.max(per_atom), numpy.mean(per_atom)
+
+def compose(trainset, names, bags, prefix_format='{}_ref.train'):
+    '''
+        compose
+        Write the training file of every bag from the cached fingerprints of the unique structures
+    '''
+    with open(trainset, 'rb') as ffile:
+        buf = mmap.mmap(ffile.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end, blocks, footer_start = split_trainset(buf, names)
+        footer = fortran_records(buf, footer_start)
+        natoms = numpy.array([b[2] for b in blocks])
+        energies = numpy.array([b[3] for b in blocks])
+        # check that the footer is understood before rewriting it for the bags
+        off, n = footer[0]
+        stored_natoms = struct.unpack_from('<i', buf, off)[0]
+        off, n = footer[1]
+        stored_stats = struct.unpack_from('<ddd', buf, off)
+        recompute = (stored_natoms == numpy.sum(natoms)
+                     and numpy.allclose(stored_stats, energy_stats(natoms, energies), rtol=1e-8, atol=1e-10))
+        if not recompute:
+            print('warning: energy statistics of the training set could not be reproduced, '
+                  'copying them unchanged into every bag')
+        setups = buf[footer[2][0]-4:]
+        header = bytearray(buf[:header_end])
+        for n, (indices, counts) in enumerate(bags):
+            order = numpy.repeat(indices, counts)
+            # nStrucs is the payload of the second header record (after 4+4+4 bytes of the first and its marker)
+            struct.pack_into('<i', header, 16, len(order))
+            with open(prefix_format.format(n), 'wb') as out:
+                out.write(header)
+                for i in order:
+                    start, end = blocks[i][0], blocks[i][1]
+                    out.write(buf[start:end])
+                if recompute:
+                    out.write(record_bytes(struct.pack('<i', int(numpy.sum(natoms[order])))))
+                    out.write(record_bytes(struct.pack('<ddd', *energy_stats(natoms[order], energies[order]))))
+                else:
+                    out.write(buf[footer_start:footer[2][0]-4])
+                out.write(setups)
+            print(f'{prefix_format.format(n)}: {len(order)} structures ({len(indices)} unique)')
+        buf.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Featurize once, compose many aenet bootstrap training sets.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('prepare', help='write unique_generate.in and the bag manifest')
+    p.add_argument('--num-bags', type=int, default=5)
+    p = sub.add_parser('compose', help='assemble n_ref.train of every bag from the featurized unique set')
+    p.add_argument('--trainset', default='ref.train', help='output of generate.x for unique_generate.in')
+    args = parser.parse_args()
+
+    if args.command == 'prepare':
+        metals = ['Pt']
+        adsorbates = ['H']
+        all_structs = []
+        all_structs.extend(glob.glob('../*.xsf')) #all xsf files in the training set
+        rng = numpy.random.RandomState(1)
+        data = {'names': numpy.array(all_structs)}
+        for n in range(args.num_bags):
+            # same draws as bagging_make_generate.py
+            bootstrap_indices = rng.choice(numpy.arange(len(all_structs)), size=len(all_structs), replace=True,)
+            indices, counts = numpy.unique(bootstrap_indices, return_counts=True)
+            data[f'bag_{n}_indices'] = indices
+            data[f'bag_{n}_counts'] = counts
+        data['num_bags'] = numpy.array(args.num_bags)
+        numpy.savez(manifest_file, **data)
+        write_input(all_structs, metals, adsorbates, 'unique')
+        print(f'{len(all_structs)} unique structures, {args.num_bags} bags; run generate.x unique_generate.in')
+    else:
+        with numpy.load(manifest_file) as data:
+            names = [str(x) for x in data['names']]
+            bags = [(data[f'bag_{n}_indices'], data[f'bag_{n}_counts']) for n in range(int(data['num_bags']))]
+        compose(args.trainset, names, bags)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+This script evaluates the members of an ANN (aenet) ensemble on a test set or a pool of candidate structures
+in parallel through aenet's ASE calculator, without running predict.x and parsing predict.out files.
+aenet keeps one set of potentials per process (hence the MultiProcessCalculator of ase/calculators/mixing.py,
+see examples/ASE_multiproc_calc), so the members are evaluated one after the other, each by its own pool of
+--nproc worker processes: every worker loads the potentials of that member once (pool initializer) and evaluates
+shards of the structures, and no process ever loads a second member.
+
+Energies, forces and atomic energies (NaN if the calculator does not provide them) of every member are
+returned as arrays and stored in one .npz file together with the ensemble statistics:
+
+    energies (members x structures), forces (members x atoms x 3), atom_energies (members x atoms)
+    natoms, offsets, reference (DFT energy, NaN if unknown)
+    mean, sd, mean_per_atom, sd_per_atom, error, error_per_atom    (as in ensemble_predictions.py)
+    node_sd                                                      standard deviation of the atomic energies
+
+Usage:
+    python ensemble_evaluate.py [--members 5] [--potential-format '{member}_{element}.ann'] [--elements Pt H]
+                                [--nproc 8] [--output ensemble_eval.npz] [--threshold 0.01] structures...
+"""
+
+import argparse
+import numpy
+from multiprocessing import Pool
+from ase.io import read, write
+from ase.calculators.calculator import PropertyNotImplementedError
+from aenet.ase_calculator import ANNCalculator
+from ensemble_predictions import ensemble_stats
+
+_calc = None
+
+def potentials(member, elements, potential_format):
+    return {element: potential_format.format(member=member, element=element) for element in elements}
+
+def load_member(pots):
+    # pool initializer: the potentials of one member per worker process
+    global _calc
+    _calc = ANNCalculator(pots)
+
+def evaluate_shard(task):
+    '''
+        evaluate_shard
+        Energies, forces and atomic energies of a shard of structures with the member loaded in this worker
+    '''
+    indices, images = task
+    energies = numpy.empty(len(images))
+    forces = []
+    atom_energies = []
+    for i, atoms in enumerate(images):
+        atoms = atoms.copy()
+        atoms.calc = _calc
+        energies[i] = atoms.get_potential_energy()
+        forces.append(atoms.get_forces())
+        try:
+            atom_energies.append(atoms.get_potential_energies())
+        except (PropertyNotImplementedError, NotImplementedError):
+            atom_energies.append(numpy.full(len(atoms), numpy.nan))
+    return indices, energies, forces, atom_energies
+
+def read_structures(files):
+    '''
+        read_structures
+        All structures of the input files, and their reference energies
+        (first line of aenet XSF files, the energy of the attached calculator otherwise)
+    '''
+    images = []
+    reference = []
+    for ffile in files:
+        if ffile.endswith('.xsf'):
+            images.append(read(ffile))
+            with open(ffile, 'r') as fi:
+                line = fi.readline().split()
+            reference.append(float(line[-2]) if len(line) > 1 else numpy.nan)
+        else:
+            for atoms in read(ffile, index=':'):
+                images.append(atoms)
+                results = atoms.calc.results if atoms.calc is not None else {}
+                reference.append(results.get('energy', atoms.info.get('energy', numpy.nan)))
+    return images, numpy.array(reference, dtype=float)
+
+def evaluate_ensemble(images, members, elements, potential_format='{member}_{element}.ann', nproc=4):
+    '''
+        evaluate_ensemble
+        Energies (members x structures), forces (members x atoms x 3) and atomic energies (members x atoms)
+    '''
+    natoms = numpy.array([len(atoms) for atoms in images])
+    offsets = numpy.concatenate(([0], numpy.cumsum(natoms)))
+    shards = [s for s in numpy.array_split(numpy.arange(len(images)), nproc) if len(s)]
+    tasks = [(s, [images[i] for i in s]) for s in shards]
+    energies = numpy.empty((len(members), len(images)))
+    forces = numpy.empty((len(members), offsets[-1], 3))
+    atom_energies = numpy.empty((len(members), offsets[-1]))
+    for m, member in enumerate(members):
+        # a new pool per member: aenet cannot hold the potentials of two members in one process
+        with Pool(len(shards), initializer=load_member, initargs=(potentials(member, elements, potential_format),)) as pool:
+            for indices, e, f, ae in pool.imap_unordered(evaluate_shard, tasks):
+                energies[m, indices] = e
+                for i, fi, aei in zip(indices, f, ae):
+                    forces[m, offsets[i]:offsets[i+1]] = fi
+                    atom_energies[m, offsets[i]:offsets[i+1]] = aei
+    return natoms, offsets, energies, forces, atom_energies
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel evaluation of an aenet ensemble with the ASE calculator.')
+    parser.add_argument('structures', nargs='+', help='XSF files and/or trajectory files (any format read by ASE)')
+    parser.add_argument('--members', nargs='+', default=['1', '2', '3', '4', '5'],
+                        help='member labels, or the number of members')
+    parser.add_argument('--elements', nargs='+', default=['Pt', 'H'])
+    parser.add_argument('--potential-format', default='{member}_{element}.ann')
+    parser.add_argument('--nproc', type=int, default=4)
+    parser.add_argument('--output', default='ensemble_eval.npz')
+    parser.add_argument('--threshold', type=float, help='write structures with sd_per_atom above this (eV/atom) to selected.xyz')
+    args = parser.parse_args()
+
+    members = args.members
+    if len(members) == 1 and members[0].isdigit():
+        members = [str(i+1) for i in range(int(members[0]))]
+    images, reference = read_structures(args.structures)
+    natoms, offsets, energies, forces, atom_energies = evaluate_ensemble(images, members, args.elements,
+                                                                        args.potential_format, args.nproc)
+    stats = ensemble_stats(energies, natoms, reference)
+    stats['node_sd'] = numpy.std(atom_energies, axis=0)
+    numpy.savez(args.output, members=numpy.array(members), natoms=natoms, offsets=offsets,
+                energies=energies, forces=forces, atom_energies=atom_energies, **stats)
+    print(f'{len(members)} members, {len(images)} structures -> {args.output}')
+    if args.threshold is not None:
+        selected = numpy.nonzero(stats['sd_per_atom'] > args.threshold)[0]
+        print(f'{len(selected)} structures with sd > {args.threshold} eV/atom')
+        if len(selected):
+            write('selected.xyz', [images[i] for i in selected])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+This script aggregates the predict.out files of the members of an ANN ensemble (01_predict.out, 02_predict.out, ...).
+All member outputs are parsed in parallel (with the cached parser of mlp_training/ANN-aenet/error_analysis)
+and aligned by structure name into a (members x structures) matrix of predicted energies, so members listing
+the structures in a different order are handled, and structures missing from (or extra in) some members
+are reported and left out instead of mixing up the members.
+Reference energies are read once from the structure files of the aligned test set.
+
+    Functions:
+        load_members()      - Parse all member predict.out files in parallel.
+        align_members()     - Align the members by structure name, report missing/extra/duplicate entries.
+        ensemble_stats()    - Mean, standard deviation and error (total and per atom) over the members.
+        load_ensemble()     - All of the above for a list of predict.out files.
+
+Usage:
+    python ensemble_predictions.py [--nproc 4] [--output ensemble.npz] [predict.out files]
+"""
+
+import os
+import sys
+import glob
+import argparse
+import numpy
+from multiprocessing import Pool
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'mlp_training', 'ANN-aenet', 'error_analysis'))
+from predict_parser import read_predict_out, read_references
+
+def _parse(outs):
+    data = read_predict_out(outs, references=False)
+    return data['names'], data['natoms'], data['energy_pred']
+
+def load_members(predict_out, nproc=4):
+    '''
+        load_members
+        (names, natoms, predicted energies) of every member output
+    '''
+    if nproc > 1 and len(predict_out) > 1:
+        with Pool(min(nproc, len(predict_out))) as pool:
+            return pool.map(_parse, predict_out)
+    return [_parse(outs) for outs in predict_out]
+
+def align_members(predict_out, members):
+    '''
+        align_members
+        Align member predictions by structure name.
+        Structures are kept in the order of the first member if they are predicted (exactly once) by every member;
+        everything else is reported. Returns names, natoms and the (members x structures) energy matrix.
+    '''
+    counts = {}
+    for names, _, _ in members:
+        for name in set(names):
+            counts[name] = counts.get(name, 0) + 1
+    common = set(name for name, n in counts.items() if n == len(members))
+    for outs, (names, _, _) in zip(predict_out, members):
+        unique, multiplicity = numpy.unique(names, return_counts=True)
+        duplicates = unique[multiplicity > 1]
+        if len(duplicates):
+            print(f'{outs}: {len(duplicates)} structures listed more than once, skipped: {", ".join(duplicates[:5])}')
+            common -= set(duplicates)
+        extra = [name for name in unique if name not in common and name not in duplicates]
+        if extra:
+            print(f'{outs}: {len(extra)} structures not predicted by all members, skipped: {", ".join(extra[:5])}')
+    missing = sorted(name for name in counts if name not in common)
+    if missing:
+        print(f'{len(missing)} of {len(counts)} structures are left out')
+
+    names = numpy.array([name for name in members[0][0] if name in common])
+    energies = numpy.empty((len(members), len(names)))
+    natoms = None
+    for m, (outs, (member_names, member_natoms, member_energies)) in enumerate(zip(predict_out, members)):
+        index = {name: i for i, name in enumerate(member_names)}
+        order = numpy.array([index[name] for name in names], dtype=int)
+        energies[m] = member_energies[order]
+        if natoms is None:
+            natoms = member_natoms[order]
+        elif not numpy.array_equal(natoms, member_natoms[order]):
+            bad = names[natoms != member_natoms[order]]
+            raise ValueError(f'{outs}: number of atoms differs from {predict_out[0]} for {", ".join(bad[:5])}')
+    return names, natoms, energies
+
+def ensemble_stats(energies, natoms, reference=None):
+    '''
+        ensemble_stats
+        Statistics over the members (axis 0) of the (members x structures) energy matrix.
+        The error is reference - mean, as in error_uncertainty.py.
+    '''
+    per_atom = energies/natoms
+    stats = {'mean': numpy.mean(energies, axis=0),
+             'sd': numpy.std(energies, axis=0),
+             'mean_per_atom': numpy.mean(per_atom, axis=0),
+             'sd_per_atom': numpy.std(per_atom, axis=0)}
+    if reference is not None:
+        stats['reference'] = reference
+        stats['error'] = reference - stats['mean']
+        stats['reference_per_atom'] = reference/natoms
+        stats['error_per_atom'] = stats['reference_per_atom'] - stats['mean_per_atom']
+    return stats
+
+def load_ensemble(predict_out=None, nproc=4, references=True):
+    '''
+        load_ensemble
+        Names, natoms, (members x structures) energies and ensemble statistics of a set of member outputs
+    '''
+    predict_out = sorted(glob.glob('*predict.out')) if not predict_out else predict_out
+    if not predict_out:
+        raise ValueError('no predict.out files found')
+    names, natoms, energies = align_members(predict_out, load_members(predict_out, nproc))
+    reference = read_references(names, natoms)[0] if references else None
+    return names, natoms, energies, ensemble_stats(energies, natoms, reference)
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate the predict.out files of an ANN ensemble by structure name.')
+    parser.add_argument('predict_out', nargs='*', help='member outputs (default: *predict.out)')
+    parser.add_argument('--nproc', type=int, default=4)
+    parser.add_argument('--output', default='ensemble.npz')
+    args = parser.parse_args()
+    names, natoms, energies, stats = load_ensemble(args.predict_out, args.nproc)
+    numpy.savez(args.output, names=names, natoms=natoms, energies=energies, **stats)
+    print(f'{energies.shape[0]} members, {energies.shape[1]} structures')
+    print(f'MAE of the ensemble mean: {numpy.mean(numpy.abs(stats["error_per_atom"])):10.4f} eV/atom')
+    print(f'Average standard deviation: {numpy.mean(stats["sd_per_atom"]):10.4f} eV/atom')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+This script relates the per-atom uncertainty of the MACE ensemble (standard deviation of the node energies,
+the node_energy_var used for active learning by the mace_node calculator) to the per-atom force errors
+on labeled data (e.g. xyz_files/unstruct_seed/test_split.xyz, xyz_files/al_*/*.xyz).
+The committee is evaluated with error_uncertainty.py (or an existing committee file is used) and, over all atoms at once:
+    - a calibration curve: mean/RMS/90th percentile force error in equal-count bins of node SD
+    - rank correlations (Spearman, overall, per element and per input file) between node SD and force error
+    - how well a spike threshold (mean + 3 SD of node SD, as in active_learning/first_100.py, or a given value)
+      picks out the high-error atoms (precision and recall for the atoms with the largest force errors)
+
+The node SD is computed with ddof=0 here, as node_energy_var of the calculator used in the MD runs (dyn.py);
+committee files written by error_uncertainty.py use ddof=1.
+
+Usage:
+    python atom_calibration.py test_split.xyz al1_01.xyz ... [--models 01_swa.model ...] [--bins 20]
+    python atom_calibration.py --committee committee.npz --test test.xyz
+    Options: --threshold <eV> (default: mean + 3 SD), --error-quantile 0.95, --output atom_calibration.npz
+"""
+
+import glob
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.stats import rankdata
+from ase.io import read
+
+def spearman(x, y):
+    '''
+        spearman
+        Spearman rank correlation (Pearson correlation of the ranks, ties averaged)
+    '''
+    if len(x) < 2:
+        return np.nan
+    rx = rankdata(x)
+    ry = rankdata(y)
+    rx -= rx.mean()
+    ry -= ry.mean()
+    return np.sum(rx*ry) / np.sqrt(np.sum(rx**2) * np.sum(ry**2))
+
+def calibration_curve(node_sd, error, nbins=20):
+    '''
+        calibration_curve
+        Equal-count bins of node SD: mean node SD, mean, RMS and 90th percentile of the force error, atoms per bin
+    '''
+    order = np.argsort(node_sd, kind='stable')
+    bins = np.array_split(order, nbins)
+    edges = np.cumsum([0] + [len(b) for b in bins])
+    sorted_sd = node_sd[order]
+    sorted_err = error[order]
+    counts = np.diff(edges)
+    keep = counts > 0
+    starts = edges[:-1][keep]
+    counts = counts[keep]
+    mean_sd = np.add.reduceat(sorted_sd, starts) / counts
+    mean_err = np.add.reduceat(sorted_err, starts) / counts
+    rms_err = np.sqrt(np.add.reduceat(sorted_err**2, starts) / counts)
+    p90_err = np.array([np.percentile(sorted_err[s:s+c], 90) for s, c in zip(starts, counts)])
+    return {'bin_sd': mean_sd, 'bin_mae': mean_err, 'bin_rmse': rms_err, 'bin_p90': p90_err, 'bin_count': counts}
+
+def threshold_scores(node_sd, error, threshold, error_quantile=0.95):
+    '''
+        threshold_scores
+        Flagged atoms (node SD > threshold) against high-error atoms (force error above the given quantile)
+    '''
+    flagged = node_sd > threshold
+    high = error > np.quantile(error, error_quantile)
+    hits = np.sum(flagged & high)
+    return {'threshold': threshold,
+            'flagged': np.sum(flagged),
+            'high_error': np.sum(high),
+            'precision': hits / np.sum(flagged) if np.any(flagged) else np.nan,
+            'recall': hits / np.sum(high) if np.any(high) else np.nan,
+            'mae_flagged': np.mean(error[flagged]) if np.any(flagged) else np.nan,
+            'mae_unflagged': np.mean(error[~flagged]) if np.any(~flagged) else np.nan}
+
+def plot_stuff(node_sd, error, curve, threshold, filename='atom_calibration.png'):
+    fig, axs = plt.subplots(1, 2, figsize=(11, 4.5))
+    positive = (node_sd > 0) & (error > 0)
+    axs[0].hexbin(node_sd[positive], error[positive], xscale='log', yscale='log', bins='log', gridsize=60, cmap='viridis')
+    axs[0].axvline(threshold, color='red', linestyle='--', label='spike threshold')
+    axs[0].set_xlabel('node SD [eV]', fontsize=12)
+    axs[0].set_ylabel('force error |F$_{ML}$ - F$_{DFT}$| [eV/Å]', fontsize=12)
+    axs[0].legend(fontsize=10)
+    axs[1].plot(curve['bin_sd'], curve['bin_mae'], 'o-', color='blue', label='mean')
+    axs[1].plot(curve['bin_sd'], curve['bin_rmse'], 's-', color='orange', label='RMS')
+    axs[1].plot(curve['bin_sd'], curve['bin_p90'], '^-', color='grey', label='90th percentile')
+    axs[1].axvline(threshold, color='red', linestyle='--')
+    axs[1].set_xscale('log')
+    axs[1].set_xlabel('node SD (bin mean) [eV]', fontsize=12)
+    axs[1].set_ylabel('force error [eV/Å]', fontsize=12)
+    axs[1].legend(fontsize=10)
+    fig.tight_layout()
+    fig.savefig(filename)
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-atom force error vs node-energy SD of a MACE ensemble.')
+    parser.add_argument('structures', nargs='*', help='labeled structures (extended XYZ with energy and forces)')
+    parser.add_argument('--models', nargs='+', help='ensemble members (default: *_swa.model)')
+    parser.add_argument('--committee', help='use an existing committee file of error_uncertainty.py instead of evaluating')
+    parser.add_argument('--test', default='test.xyz', help='structures of the committee file (for the elements)')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--device', default='cuda')
+    parser.add_argument('--bins', type=int, default=20)
+    parser.add_argument('--threshold', type=float, help='spike threshold on node SD (default: mean + 3 SD)')
+    parser.add_argument('--error-quantile', type=float, default=0.95, help='atoms above this error quantile are high-error')
+    parser.add_argument('--output', default='atom_calibration.npz')
+    args = parser.parse_args()
+
+    if args.committee:
+        with np.load(args.committee) as data:
+            results = {key: data[key] for key in data.files}
+        files = [args.test]
+        images = read(args.test, index=':')
+        source = np.zeros(len(images), dtype=int)
+    else:
+        # torch and mace are only needed when the committee is evaluated here
+        from error_uncertainty import load_models, committee
+        files = args.structures
+        images, source = [], []
+        for n, ffile in enumerate(files):
+            frames = read(ffile, index=':')
+            images.extend(frames)
+            source.extend([n]*len(frames))
+        source = np.array(source)
+        model_paths = args.models if args.models else sorted(glob.glob('*_swa.model'))
+        models = load_models(model_paths, args.device)
+        results = committee(images, models, args.batch_size, args.device, ddof=0)
+
+    node_sd = results['node_sd']
+    error = np.linalg.norm(results['forces_mean'] - results['forces_ref'], axis=1)
+    symbols = np.concatenate([atoms.get_chemical_symbols() for atoms in images])
+    atom_source = np.repeat(source, np.diff(results['offsets']))
+    valid = ~np.isnan(error)
+    node_sd, error, symbols, atom_source = node_sd[valid], error[valid], symbols[valid], atom_source[valid]
+
+    threshold = args.threshold if args.threshold is not None else np.mean(node_sd) + 3*np.std(node_sd)
+    curve = calibration_curve(node_sd, error, args.bins)
+    scores = threshold_scores(node_sd, error, threshold, args.error_quantile)
+
+    print(f'{len(error)} atoms, Spearman rank correlation node SD vs force error: {spearman(node_sd, error):6.3f}')
+    for element in np.unique(symbols):
+        mask = symbols == element
+        print(f'  {element:3s} {np.sum(mask):10d} atoms   Spearman {spearman(node_sd[mask], error[mask]):6.3f}')
+    if len(files) > 1:
+        for n, ffile in enumerate(files):
+            mask = atom_source == n
+            print(f'  {ffile}: {np.sum(mask)} atoms   Spearman {spearman(node_sd[mask], error[mask]):6.3f}')
+    print(f'{"node SD":>10s} {"MAE":>8s} {"RMSE":>8s} {"p90":>8s} {"atoms":>8s}')
+    for i in range(len(curve['bin_sd'])):
+        print(f'{curve["bin_sd"][i]:10.5f} {curve["bin_mae"][i]:8.4f} {curve["bin_rmse"][i]:8.4f} '
+              f'{curve["bin_p90"][i]:8.4f} {curve["bin_count"][i]:8d}')
+    print(f'threshold = {threshold:.5f} eV: {scores["flagged"]} atoms flagged, '
+          f'precision {scores["precision"]:.3f} and recall {scores["recall"]:.3f} for the {scores["high_error"]} atoms '
+          f'above the {args.error_quantile:.2f} error quantile; MAE flagged {scores["mae_flagged"]:.4f}, '
+          f'unflagged {scores["mae_unflagged"]:.4f} eV/Ang')
+
+    np.savez(args.output, node_sd=node_sd, force_error=error, symbols=symbols, source=atom_source, **curve,
+             **{'threshold_' + key: value for key, value in scores.items()})
+    plot_stuff(node_sd, error, curve, threshold)
+
+
+if __name__ == '__main__':
+    main()
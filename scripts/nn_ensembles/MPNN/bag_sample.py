@@ -1,20 +1,96 @@
 """
-This script creates bootstrap samples in extended XYZ format for MLP training in MACE,
+This script creates bootstrap samples for MLP training in MACE,
 by randomly selecting structures with replacement from the full training dataset.
+Bags are stored as seeded index manifests (frame indices and multiplicities per bag, bags.npz)
+over one shared dataset store (train.store, see data_generation/utilties/dataset_store.py)
+instead of full copies of the dataset; bags are read lazily through the manifest,
+or written to extended XYZ on demand (e.g. to node-local scratch) for run_train.py.
+
+Usage:
+    python bag_sample.py make [--seed 1] [--num-samples 10]      # writes train.store (once) and bags.npz
+    python bag_sample.py write <bag number> <bag_sample_n.xyz>    # materialize one bag for --train_file
 """
 
-import random
-from ase.io import read, write
+import os
+import sys
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data_generation', 'utilties'))
+from dataset_store import DatasetStore, import_extxyz
 
 xyz_file = 'train.xyz'
+store_path = 'train.store'
+manifest_file = 'bags.npz'
 num_structures = 3000 # number of structures in the training dataset
 num_samples = 10
-molecules = read(xyz_file, index=':')
-if len(molecules) != num_structures:
-    raise ValueError(f"The XYZ file contains {len(molecules)} structures, expected {num_structures}.")
-
-# Create specified number of bootstrap samples
-for i in range(num_samples):
-    sampled_molecules = [random.choice(molecules) for _ in range(num_structures)]
-    output_file = f'bag_sample_{i+1}.xyz'
-    write(output_file, sampled_molecules)
\ No newline at end of file
+
+def make_bags(n_frames, num_samples, bag_size=None, seed=1):
+    '''
+        make_bags
+        Bootstrap bags as (unique frame indices, multiplicities), reproducible for a given seed
+    '''
+    rng = np.random.default_rng(seed)
+    bag_size = n_frames if bag_size is None else bag_size
+    bags = []
+    for i in range(num_samples):
+        indices, counts = np.unique(rng.integers(0, n_frames, size=bag_size), return_counts=True)
+        bags.append((indices, counts))
+    return bags
+
+def write_manifest(filename, bags, dataset, seed):
+    data = {'dataset': np.array(dataset), 'seed': np.array(seed), 'num_samples': np.array(len(bags))}
+    for i, (indices, counts) in enumerate(bags):
+        data[f'bag_{i+1}_indices'] = indices
+        data[f'bag_{i+1}_counts'] = counts
+    np.savez(filename, **data)
+
+def read_bag(n, manifest=manifest_file):
+    '''
+        read_bag
+        Frame indices and multiplicities of bag n (1-based, as the bag_sample_n.xyz files were)
+    '''
+    with np.load(manifest) as data:
+        return str(data['dataset']), data[f'bag_{n}_indices'], data[f'bag_{n}_counts']
+
+def iter_bag(n, manifest=manifest_file, store=None):
+    '''
+        iter_bag
+        Lazily yield the Atoms of bag n from the shared dataset store, each as often as it was drawn
+    '''
+    dataset, indices, counts = read_bag(n, manifest)
+    store = DatasetStore(dataset) if store is None else store
+    for i, count in zip(indices, counts):
+        atoms = store.get_atoms(int(i))
+        for _ in range(count):
+            yield atoms.copy()
+
+def main():
+    parser = argparse.ArgumentParser(description='Bootstrap bags for MACE ensemble training as index manifests.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('make', help='write the bag manifest')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--num-samples', type=int, default=num_samples)
+    p.add_argument('--bag-size', type=int, default=None, help='structures per bag (default: size of the dataset)')
+    p = sub.add_parser('write', help='write one bag to extended XYZ')
+    p.add_argument('bag', type=int)
+    p.add_argument('output')
+    args = parser.parse_args()
+
+    if args.command == 'make':
+        if os.path.exists(store_path):
+            store = DatasetStore(store_path)
+        else:
+            store = import_extxyz(store_path, [xyz_file])
+        if len(store) != num_structures:
+            raise ValueError(f"The dataset contains {len(store)} structures, expected {num_structures}.")
+        bags = make_bags(len(store), args.num_samples, args.bag_size, args.seed)
+        write_manifest(manifest_file, bags, store_path, args.seed)
+        for i, (indices, counts) in enumerate(bags):
+            print(f'bag {i+1}: {np.sum(counts)} structures, {len(indices)} unique')
+    else:
+        dataset, indices, counts = read_bag(args.bag)
+        DatasetStore(dataset).to_extxyz(args.output, np.repeat(indices, counts))
+
+
+if __name__ == '__main__':
+    main()
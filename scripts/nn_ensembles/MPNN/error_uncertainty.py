@@ -0,0 +1,161 @@
+"""
+This script predicts the energies of test structures with all MPNN (MACE) ensemble members in one process
+and analyzes the error-uncertainty correlation (replaces error_uncertainty.sh.sh and the separate
+evaluation runs writing 01_out.xyz, 02_out.xyz, ...).
+All members (*_swa.model) are loaded once, the graphs of the test set are built once and every member
+evaluates them in batches. Energies, node energies and forces of all members are reduced to the ensemble mean,
+standard deviation and errors with NumPy and stored at full precision in one file (.npz or .h5):
+
+    energies        (members x structures)   total energies of every member
+    natoms, reference                        number of atoms and DFT energy of every structure
+    mean_per_atom, sd_per_atom               ensemble mean and standard deviation of the energy per atom
+    error_per_atom                           |DFT - mean| per atom (as 'err' of error_uncertainty.sh.sh)
+    offsets                                  per-structure atom offsets into the per-atom arrays
+    node_sd                                  standard deviation of the node (atomic) energies, per atom
+    forces_mean, forces_sd, forces_ref       ensemble mean force, standard deviation of the force components, DFT forces
+
+The standard deviations use ddof=1, as error_uncertainty.sh.sh did.
+
+Usage:
+    python error_uncertainty.py [--test test.xyz] [--output committee.npz] [--batch-size 16] [--device cuda] [models]
+"""
+
+import glob
+import argparse
+import torch
+import numpy as np
+import matplotlib.pyplot as plt
+from ase.io import read
+from mace import data
+from mace.tools import torch_geometric, torch_tools, utils
+
+def load_models(model_paths, device='cuda', default_dtype='float64'):
+    '''
+        load_models
+        All ensemble members, each loaded once
+    '''
+    torch_tools.set_default_dtype(default_dtype)
+    models = []
+    for path in model_paths:
+        model = torch.load(f=path, map_location=device).to(device)
+        for param in model.parameters():
+            param.requires_grad = False
+        models.append(model)
+    return models
+
+def build_dataset(atoms_list, model):
+    '''
+        build_dataset
+        Graphs of the test structures for the cutoff and species of a model
+    '''
+    z_table = utils.AtomicNumberTable([int(z) for z in model.atomic_numbers])
+    configs = [data.config_from_atoms(atoms) for atoms in atoms_list]
+    return [data.AtomicData.from_config(config, z_table=z_table, cutoff=float(model.r_max)) for config in configs]
+
+def evaluate_member(model, dataset, batch_size=16, device='cuda'):
+    '''
+        evaluate_member
+        Energies (structures), node energies (atoms) and forces (atoms x 3) of one member
+    '''
+    loader = torch_geometric.dataloader.DataLoader(dataset=dataset, batch_size=batch_size, shuffle=False, drop_last=False)
+    energies, node_energies, forces = [], [], []
+    for batch in loader:
+        batch = batch.to(device)
+        output = model(batch.to_dict(), compute_stress=False)
+        energies.append(torch_tools.to_numpy(output['energy']))
+        node_energies.append(torch_tools.to_numpy(output['node_energy']))
+        forces.append(torch_tools.to_numpy(output['forces']))
+    return np.concatenate(energies), np.concatenate(node_energies), np.concatenate(forces)
+
+def reference_values(atoms_list):
+    '''
+        reference_values
+        DFT energies and forces of the test structures (NaN where missing)
+    '''
+    energies = np.full(len(atoms_list), np.nan)
+    forces = []
+    for i, atoms in enumerate(atoms_list):
+        results = atoms.calc.results if atoms.calc is not None else {}
+        energies[i] = results.get('energy', atoms.info.get('energy', np.nan))
+        forces.append(results.get('forces', atoms.arrays.get('forces', np.full((len(atoms), 3), np.nan))))
+    return energies, np.concatenate(forces)
+
+def committee(atoms_list, models, batch_size=16, device='cuda', ddof=1):
+    '''
+        committee
+        Evaluate all members and reduce to ensemble statistics (dict of arrays)
+    '''
+    datasets = {}
+    energies, node_energies, forces = [], [], []
+    for model in models:
+        # members trained with the same settings share the graphs of the test set
+        key = (float(model.r_max), tuple(int(z) for z in model.atomic_numbers))
+        if key not in datasets:
+            datasets[key] = build_dataset(atoms_list, model)
+        e, ne, f = evaluate_member(model, datasets[key], batch_size, device)
+        energies.append(e)
+        node_energies.append(ne)
+        forces.append(f)
+    energies = np.array(energies)
+    node_energies = np.array(node_energies)
+    forces = np.array(forces)
+    natoms = np.array([len(atoms) for atoms in atoms_list])
+    reference, forces_ref = reference_values(atoms_list)
+    per_atom = energies/natoms
+    mean_per_atom = np.mean(per_atom, axis=0)
+    return {'energies': energies,
+            'natoms': natoms,
+            'offsets': np.concatenate(([0], np.cumsum(natoms))),
+            'reference': reference,
+            'mean_per_atom': mean_per_atom,
+            'sd_per_atom': np.std(per_atom, axis=0, ddof=ddof),
+            'error_per_atom': np.abs(reference/natoms - mean_per_atom),
+            'node_sd': np.std(node_energies, axis=0, ddof=ddof),
+            'forces_mean': np.mean(forces, axis=0),
+            'forces_sd': np.std(forces, axis=0, ddof=ddof),
+            'forces_ref': forces_ref}
+
+def save(filename, results):
+    if filename.endswith('.h5'):
+        import h5py
+        with h5py.File(filename, 'w') as f:
+            for key, value in results.items():
+                f.create_dataset(key, data=value.astype('S') if value.dtype.kind == 'U' else value)
+    else:
+        np.savez(filename, **results)
+
+def plot_stuff(sd, err, filename='err_sd.png'):
+    # Error-uncertainty correlation plot
+    plt.plot(sd,err,'x',color='blue',markersize=3)
+    plt.plot(err,err,'-.',color='black')
+    plt.xlabel('Ensemble SD, eV/atom',fontsize=12)
+    plt.ylabel('Error relative to DFT, eV/atom',fontsize=12)
+    plt.xticks(fontsize=10)
+    plt.yticks(fontsize=10)
+    plt.xlim(None,0.02)
+    plt.ylim(None,0.02)
+    plt.tight_layout()
+    plt.savefig(filename)
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate a MACE ensemble on a test set in one process.')
+    parser.add_argument('models', nargs='*', help='ensemble members (default: *_swa.model)')
+    parser.add_argument('--test', default='test.xyz')
+    parser.add_argument('--output', default='committee.npz', help='.npz or .h5')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--device', default='cuda')
+    parser.add_argument('--default-dtype', default='float64')
+    args = parser.parse_args()
+
+    model_paths = args.models if args.models else sorted(glob.glob('*_swa.model'))
+    atoms_list = read(args.test, index=':')
+    models = load_models(model_paths, args.device, args.default_dtype)
+    results = committee(atoms_list, models, args.batch_size, args.device)
+    results['models'] = np.array(model_paths)
+    save(args.output, results)
+    print(f'{len(model_paths)} members, {len(atoms_list)} structures -> {args.output}')
+    plot_stuff(results['sd_per_atom'], results['error_per_atom'])
+
+
+if __name__ == '__main__':
+    main()
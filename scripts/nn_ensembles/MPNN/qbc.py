@@ -1,25 +1,20 @@
 """
 this script picks structures in the test set with high prediction uncertainty, based on a set threshold
-the file 'std' is generated from execution of error_uncertainty.sh 
+the ensemble standard deviation ('sd_per_atom') is read from committee.npz, generated from execution of error_uncertainty.py
 """
 
+import numpy as np
 from ase.io.trajectory import Trajectory
 from ase.io import read, write
 
-filename = 'std'
-sd_idx = 0 # 0-based index
+filename = 'committee.npz'
 traj = Trajectory('test.traj')
 
-image_num = []
-with open(filename, 'r') as file:
-    for line_number, line in enumerate(file, start=1):
-        columns = line.split()
-        sd = float(columns[sd_idx])
-        if sd > 0.002:
-           print('sd=',sd, 'struct=',line_number)
-           image_num.append(line_number)
+with np.load(filename) as data:
+    sd = data['sd_per_atom']
+image_num = np.nonzero(sd > 0.002)[0] # 0-based index, as in test.traj
+for j in image_num:
+    print('sd=',sd[j], 'struct=',j+1)
 
-for j,atoms in enumerate(traj):
-    for im_n in image_num:
-        if j==im_n:
-           write('%d.xyz' %j,atoms)
+for j in image_num:
+    write('%d.xyz' %j,traj[int(j)])
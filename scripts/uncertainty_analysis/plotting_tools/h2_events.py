@@ -0,0 +1,95 @@
+"""
+This script counts H2 formation/dissociation and adsorption/desorption events in an MD trajectory analyzed by stats.py.
+The molecules of every frame are the connected components of the H-H bonds (Data/<ads>_stats.h5, datasets
+molecule and bound, labeled by their smallest atom index). Consecutive frames are compared with array operations:
+a molecule is unchanged if all its atoms keep its label and its size is the same, otherwise
+    formation      a molecule (2 or more atoms) of this frame did not exist in the previous frame
+    dissociation   a molecule of the previous frame does not exist anymore
+Unchanged molecules and single atoms (H) are followed for
+    adsorption     not bonded to the slab in the previous frame, bonded now
+    desorption     bonded to the slab in the previous frame, not bonded now
+An exchange (H2 + H -> H + H2) shows up as one dissociation and one formation.
+The frames are read in blocks, the events are written to an event log with frame, time and atoms.
+
+Usage:
+    python h2_events.py [Data/H_stats.h5] [--dt 0.5] [--output Data/H_events.dat] [--block 4096]
+"""
+
+import argparse
+import h5py
+import numpy as np
+
+event_kinds = ['formation', 'dissociation', 'adsorption', 'desorption']
+
+def frame_events(prev_mol, prev_bound, mol, bound):
+    '''
+        frame_events
+        Molecule labels of the events between two frames: formed, dissociated, adsorbed, desorbed
+    '''
+    n = max(prev_mol.max(), mol.max()) + 1
+    size_prev = np.bincount(prev_mol, minlength=n)
+    size = np.bincount(mol, minlength=n)
+    moved = prev_mol != mol
+    changed = (np.bincount(mol, weights=moved, minlength=n) > 0) | (size != size_prev)
+    prev_changed = (np.bincount(prev_mol, weights=moved, minlength=n) > 0) | (size != size_prev)
+    labels = np.unique(mol)
+    prev_labels = np.unique(prev_mol)
+    formed = labels[changed[labels] & (size[labels] > 1)]
+    dissociated = prev_labels[prev_changed[prev_labels] & (size_prev[prev_labels] > 1)]
+    on_slab = np.bincount(mol, weights=bound, minlength=n) > 0
+    prev_on_slab = np.bincount(prev_mol, weights=prev_bound, minlength=n) > 0
+    same = labels[~changed[labels]]
+    adsorbed = same[on_slab[same] & ~prev_on_slab[same]]
+    desorbed = same[~on_slab[same] & prev_on_slab[same]]
+    return formed, dissociated, adsorbed, desorbed
+
+def find_events(filename, block=4096):
+    '''
+        find_events
+        Event log (list of (frame, kind, atoms)) of a stats.py data file, read in blocks of frames
+    '''
+    events = []
+    with h5py.File(filename, 'r') as f:
+        atoms = f['molecule_atoms'][()]
+        frames = f['frames'][()]
+        prev = None
+        for start in range(0, len(frames), block):
+            mol_block = f['molecule'][:, start:start+block]
+            bound_block = f['bound'][:, start:start+block]
+            for n in range(mol_block.shape[1]):
+                mol, bound = mol_block[:, n], bound_block[:, n]
+                if prev is not None:
+                    found = frame_events(prev[0], prev[1], mol, bound)
+                    for kind, labels in zip(event_kinds, found):
+                        # participating atoms: of the previous frame for dissociation, of this frame otherwise
+                        ref = prev[0] if kind == 'dissociation' else mol
+                        for label in labels:
+                            events.append((frames[start+n], kind, atoms[ref == label]))
+                prev = (mol, bound)
+    return events
+
+def main():
+    parser = argparse.ArgumentParser(description='H2 formation/dissociation and adsorption/desorption events.')
+    parser.add_argument('data', nargs='?', default='Data/H_stats.h5', help='data file of stats.py')
+    parser.add_argument('--dt', type=float, default=1.0, help='time between trajectory frames (e.g. fs)')
+    parser.add_argument('--output', help='event log (default: <data>_events.dat)')
+    parser.add_argument('--block', type=int, default=4096, help='frames read at once')
+    args = parser.parse_args()
+
+    output = args.output if args.output else args.data.replace('_stats.h5', '') + '_events.dat'
+    events = find_events(args.data, args.block)
+    with open(output, 'w') as ffile:
+        ffile.write(f'#{"frame":>9s} {"time":>12s} {"event":>13s} {"size":>5s} atoms\n')
+        for frame, kind, atoms in events:
+            ffile.write(f'{frame:10d} {frame*args.dt:12.2f} {kind:>13s} {len(atoms):5d} {",".join(map(str, atoms))}\n')
+    kinds = np.array([kind for _, kind, _ in events])
+    sizes = np.array([len(atoms) for _, _, atoms in events])
+    for kind in event_kinds:
+        mask = kinds == kind
+        by_size = ', '.join(f'{np.sum(sizes[mask] == s)} x {s} atoms' for s in np.unique(sizes[mask]))
+        print(f'{kind:13s} {np.sum(mask):8d}   {by_size}')
+    print(f'Event log written to {output}')
+
+
+if __name__ == '__main__':
+    main()
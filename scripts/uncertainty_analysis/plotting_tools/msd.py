@@ -0,0 +1,177 @@
+"""
+This script computes mean-squared displacements (MSD) and diffusion coefficients of H on/in the Pt slab
+from an MD trajectory (run.traj of dyn.py).
+The trajectory is read in chunks of frames: the positions of the adsorbate atoms are unwrapped (minimum-image
+steps between consecutive frames), corrected for the drift of the slab center and written to an on-disk
+array (msd_positions.npy), so that memory stays bounded by the chunk size and by the atoms analyzed at once.
+The MSD over all time origins is computed with the FFT algorithm (O(T log T) per atom instead of O(T^2)),
+separately for the in-plane (xy) and out-of-plane (z) components, and averaged per region:
+    surface       between 1 A below and 2 A above the top slab layer
+    subsurface    more than 1 A below the top slab layer
+    gas           more than 2 A above the top slab layer
+An atom belongs to the region it spends at least --min-fraction of the frames in ('mixed' otherwise).
+Error bars come from block averaging: the trajectory is cut into --blocks blocks, the MSD and the diffusion
+coefficients (D = slope/4 in-plane, slope/2 out-of-plane, fitted over --fit lag fractions of a block)
+are computed for every block, and their standard error over the blocks is reported.
+
+Usage:
+    python msd.py [run.traj] [--element H] [--slab Pt] [--dt 0.5] [--stride 1] [--blocks 5] [--fit 0.1 0.5]
+                  [--chunk 2000] [--batch 64] [--output msd.npz]
+"""
+
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from ase.io.trajectory import Trajectory
+from site_lattice import slab_layers
+
+regions = ['surface', 'subsurface', 'gas', 'mixed']
+
+def msd_fft(x):
+    '''
+        msd_fft
+        MSD over all time origins for every column of x (T x n), for lags 0 ... T-1
+    '''
+    T = len(x)
+    lags = np.arange(T)
+    D = x**2
+    # S1(m) = sum over origins k of x(k)^2 + x(k+m)^2, from cumulative sums
+    front = np.concatenate((np.zeros((1,) + x.shape[1:]), np.cumsum(D, axis=0)[:-1]))
+    back = np.concatenate((np.zeros((1,) + x.shape[1:]), np.cumsum(D[::-1], axis=0)[:-1]))
+    S1 = 2*D.sum(axis=0) - front - back
+    # S2(m) = sum over origins k of x(k) x(k+m), autocorrelation by FFT (zero padded)
+    F = np.fft.rfft(x, n=2*T, axis=0)
+    S2 = np.fft.irfft(F*F.conj(), axis=0)[:T]
+    return (S1 - 2*S2) / (T - lags).reshape((-1,) + (1,)*(x.ndim-1))
+
+def unwrap_positions(filename, atoms_sel, slab, output, stride=1, chunk=2000, layer_tol=1.0, gas_height=2.0,
+                     subsurface_depth=1.0):
+    '''
+        unwrap_positions
+        Stream the trajectory: unwrapped, drift-corrected positions (T x atoms x 3) in a .npy memmap,
+        and the number of frames every atom spends in each region
+    '''
+    with Trajectory(filename) as traj:
+        indices = range(0, len(traj), stride)
+        first = traj[0]
+        cell = np.array(first.cell)
+        inv = np.linalg.inv(cell)
+        pbc = first.pbc
+        top = slab_layers(first, slab, layer_tol)[0]
+        out = np.lib.format.open_memmap(output, mode='w+', dtype=np.float64, shape=(len(indices), len(atoms_sel), 3))
+        counts = np.zeros((len(atoms_sel), 3), dtype=np.int64)
+        moving = np.concatenate((atoms_sel, slab))
+        prev = None
+        for start in range(0, len(indices), chunk):
+            block = [traj[i] for i in indices[start:start+chunk]]
+            pos = np.array([atoms.positions[moving] for atoms in block])
+            frac = pos @ inv
+            steps = np.diff(frac, axis=0, prepend=frac[:1] if prev is None else prev[None])
+            steps[..., pbc] -= np.round(steps[..., pbc])
+            ufrac = np.cumsum(steps, axis=0) + (frac[0] if prev is None else last)
+            prev, last = frac[-1], ufrac[-1]
+            unwrapped = ufrac @ cell
+            drift = unwrapped[:, len(atoms_sel):].mean(axis=1, keepdims=True)
+            out[start:start+len(block)] = unwrapped[:, :len(atoms_sel)] - drift
+            height = pos[:, :len(atoms_sel), 2] - np.array([atoms.positions[top, 2].mean() for atoms in block])[:, None]
+            counts[:, 0] += np.sum((height >= -subsurface_depth) & (height <= gas_height), axis=0)
+            counts[:, 1] += np.sum(height < -subsurface_depth, axis=0)
+            counts[:, 2] += np.sum(height > gas_height, axis=0)
+        out.flush()
+    return out, counts
+
+def block_msd(positions, members, nblocks, batch=64):
+    '''
+        block_msd
+        In-plane and out-of-plane MSD (blocks x lags) averaged over the member atoms, for every block
+    '''
+    T = positions.shape[0] // nblocks
+    msd_xy = np.zeros((nblocks, T))
+    msd_z = np.zeros((nblocks, T))
+    for b in range(nblocks):
+        for s in range(0, len(members), batch):
+            x = np.array(positions[b*T:(b+1)*T, members[s:s+batch]])
+            x -= x[0]
+            m = msd_fft(x)
+            msd_xy[b] += m[:, :, 0].sum(axis=1) + m[:, :, 1].sum(axis=1)
+            msd_z[b] += m[:, :, 2].sum(axis=1)
+    return msd_xy/len(members), msd_z/len(members)
+
+def diffusion(lag_time, msd, fit, dim):
+    '''
+        diffusion
+        D from a linear fit of MSD (blocks x lags) over the lag window fit (fractions of the block length)
+    '''
+    lo, hi = int(fit[0]*len(lag_time)), max(int(fit[1]*len(lag_time)), int(fit[0]*len(lag_time)) + 2)
+    slopes = np.array([np.polyfit(lag_time[lo:hi], m[lo:hi], 1)[0] for m in msd])
+    return slopes/(2*dim)
+
+def sem(values):
+    return np.std(values, ddof=1)/np.sqrt(len(values)) if len(values) > 1 else np.nan
+
+def plot_stuff(lag_time, results, filename='msd.png'):
+    fig, axs = plt.subplots(1, 2, figsize=(11, 4.5))
+    for name, res in results.items():
+        for ax, key in zip(axs, ('msd_xy', 'msd_z')):
+            mean, err = res[key].mean(axis=0), np.array([sem(v) for v in res[key].T])
+            line, = ax.plot(lag_time, mean, label=f'{name} ({res["natoms"]} atoms)')
+            ax.fill_between(lag_time, mean - err, mean + err, color=line.get_color(), alpha=0.3)
+    for ax, title in zip(axs, ('in-plane (xy)', 'out-of-plane (z)')):
+        ax.set_title(title, fontsize=14)
+        ax.set_xlabel('lag time [ps]', fontsize=12)
+        ax.set_ylabel('MSD [Å$^2$]', fontsize=12)
+    axs[0].legend(fontsize=10)
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(description='FFT-based MSD and diffusion coefficients of H on/in a Pt slab.')
+    parser.add_argument('trajectory', nargs='?', default='run.traj')
+    parser.add_argument('--element', default='H', help='diffusing species')
+    parser.add_argument('--slab', default='Pt', help='slab species (regions and drift correction)')
+    parser.add_argument('--dt', type=float, default=0.5, help='time between trajectory frames in fs')
+    parser.add_argument('--stride', type=int, default=1, help='use every n-th frame')
+    parser.add_argument('--blocks', type=int, default=5, help='blocks for the error bars')
+    parser.add_argument('--fit', type=float, nargs=2, default=[0.1, 0.5], help='lag window of the fit (fractions of a block)')
+    parser.add_argument('--min-fraction', type=float, default=0.9, help='fraction of frames an atom must spend in its region')
+    parser.add_argument('--chunk', type=int, default=2000, help='frames read at once')
+    parser.add_argument('--batch', type=int, default=64, help='atoms transformed at once')
+    parser.add_argument('--positions', default='msd_positions.npy', help='on-disk array of the unwrapped positions')
+    parser.add_argument('--output', default='msd.npz')
+    args = parser.parse_args()
+
+    with Trajectory(args.trajectory) as traj:
+        symbols = np.array(traj[0].get_chemical_symbols())
+    atoms_sel = np.nonzero(symbols == args.element)[0]
+    slab = np.nonzero(symbols == args.slab)[0]
+    positions, counts = unwrap_positions(args.trajectory, atoms_sel, slab, args.positions, args.stride, args.chunk)
+    nframes = positions.shape[0]
+    fraction = counts/nframes
+    region = np.where(fraction.max(axis=1) >= args.min_fraction, np.argmax(fraction, axis=1), regions.index('mixed'))
+
+    lag_time = np.arange(nframes // args.blocks)*args.dt*args.stride/1000.   # ps
+    results = {}
+    print(f'{len(atoms_sel)} {args.element} atoms, {nframes} frames, {args.blocks} blocks of {len(lag_time)} frames')
+    print(f'{"region":>11s} {"atoms":>6s} {"D_xy [cm2/s]":>24s} {"D_z [cm2/s]":>24s}')
+    for code, name in enumerate(regions):
+        members = np.nonzero(region == code)[0]
+        if len(members) == 0:
+            continue
+        msd_xy, msd_z = block_msd(positions, members, args.blocks, args.batch)
+        # A^2/ps -> cm^2/s
+        d_xy = diffusion(lag_time, msd_xy, args.fit, 2)*1e-4
+        d_z = diffusion(lag_time, msd_z, args.fit, 1)*1e-4
+        results[name] = {'natoms': len(members), 'atoms': atoms_sel[members], 'msd_xy': msd_xy, 'msd_z': msd_z,
+                         'D_xy': d_xy, 'D_z': d_z}
+        print(f'{name:>11s} {len(members):6d} {np.mean(d_xy):11.3e} +- {sem(d_xy):9.2e} {np.mean(d_z):11.3e} +- {sem(d_z):9.2e}')
+
+    np.savez(args.output, lag_time=lag_time, region=region, atoms=atoms_sel,
+             **{f'{name}_{key}': value for name, res in results.items() for key, value in res.items()})
+    plot_stuff(lag_time, results)
+
+
+if __name__ == '__main__':
+    main()
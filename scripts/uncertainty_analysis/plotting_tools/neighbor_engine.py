@@ -0,0 +1,152 @@
+"""
+Neighbor engine for the trajectory analysis of stats.py.
+Instead of a new NeighborList and a dense connectivity matrix for every frame, a Verlet list of candidate pairs
+(pairs within the bond cutoff plus a skin, with their periodic shifts) is built with ASE's linked-cell
+primitive_neighbor_list and reused for the following frames; it is only rebuilt when an atom has moved by more
+than half the skin (or the cell has changed). In every frame the bonds are evaluated for the candidate pairs
+as one array operation and stored as a sparse (CSR) connectivity matrix.
+Two atoms are bonded if their distance is below the sum of their natural cutoffs (covalent radii) plus 0.6 A,
+the same criterion as ASE's NeighborList with its default skin of 0.3 A per atom used by stats.py before.
+
+    Classes/functions:
+        VerletNeighbors      - Incrementally updated candidate pairs and CSR connectivity of a trajectory.
+        analyze_frame()      - Slab distance, coordination, site type and H-H bonding of all adsorbates of a frame.
+        analyze_frames()     - Typed (adsorbates x frames) arrays for a range of frames read from a trajectory file;
+                               the unit of work of the process pool of stats.py.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from ase.io.trajectory import Trajectory
+from ase.neighborlist import natural_cutoffs, primitive_neighbor_list
+from ase.geometry import get_distances
+
+ads_sites = ['vacuum', 'ontop', 'bridge', 'hollow']   # by the number of bonded slab atoms, more: 'in bulk'
+ads_types = ['gas H', 'gas Hₙ', 'H*', 'Hₙ*']   # by (bonded to the slab, bonded to other adsorbates)
+
+class VerletNeighbors:
+    '''
+        VerletNeighbors
+        Candidate pairs (i, j, shift) within bond cutoff + skin, rebuilt only when needed
+    '''
+    def __init__(self, atoms, skin=1.0, bond_tol=0.6):
+        self.radii = np.array(natural_cutoffs(atoms))
+        self.skin = skin
+        self.bond_tol = bond_tol
+        self.natoms = len(atoms)
+        self.ref_positions = None
+        self.ref_cell = None
+        self.nbuilds = 0
+
+    def build(self, atoms):
+        # pairs with d < r_i + r_j + bond_tol + skin
+        cutoffs = self.radii + 0.5*(self.bond_tol + self.skin)
+        i, j, S = primitive_neighbor_list('ijS', atoms.pbc, atoms.cell.complete(), atoms.positions, cutoffs,
+                                          self_interaction=False)
+        self.i, self.j, self.S = i, j, S
+        self.bond_cutoff = self.radii[i] + self.radii[j] + self.bond_tol
+        self.ref_positions = atoms.positions.copy()
+        self.ref_cell = np.array(atoms.cell)
+        self.nbuilds += 1
+
+    def needs_build(self, atoms):
+        if self.ref_positions is None or not np.allclose(self.ref_cell, atoms.cell):
+            return True
+        # a wrapped atom also shows up as a large displacement, its shifts are renewed by the rebuild
+        displacement = np.max(np.sum((atoms.positions - self.ref_positions)**2, axis=1))
+        return displacement > (0.5*self.skin)**2
+
+    def update(self, atoms):
+        '''
+            update
+            Connectivity (CSR, binary, both ways) of the frame
+        '''
+        if self.needs_build(atoms):
+            self.build(atoms)
+        D = atoms.positions[self.j] - atoms.positions[self.i] + self.S @ np.array(atoms.cell)
+        bonded = np.einsum('ij,ij->i', D, D) < self.bond_cutoff**2
+        conn = sparse.csr_matrix((np.ones(np.sum(bonded), dtype=np.int8), (self.i[bonded], self.j[bonded])),
+                                 shape=(self.natoms, self.natoms))
+        conn.sum_duplicates()
+        conn.data[:] = 1   # several periodic images of a neighbor count once, as in the dense matrix
+        return conn
+
+def site_codes(n_slab):
+    # index into ads_sites, len(ads_sites) for 'in bulk'
+    return np.minimum(n_slab, len(ads_sites))
+
+def type_codes(n_slab, n_ads):
+    # index into ads_types
+    return 2*(n_slab > 0) + (n_ads > 0)
+
+def analyze_frame(atoms, conn, ads_indices, slab_indices, ads_mask, slab_mask):
+    '''
+        analyze_frame
+        Descriptors of all selected adsorbates at once:
+            slb_dist   - distance to the closest selected slab atom (minimum image)
+            tot_coord  - number of bonded atoms
+            n_slab     - number of bonded (selected) slab atoms -> site (index into ads_sites, len(ads_sites) = in bulk)
+            n_ads      - number of bonded adsorbate atoms (all atoms of the adsorbate species)
+            ads_type   - index into ads_types
+            hh_pairs   - bonded adsorbate-adsorbate pairs (i < j) among all adsorbate atoms
+            molecule   - for all adsorbate atoms: molecule (connected component of the adsorbate-adsorbate bonds),
+                         labeled by its smallest atom index, so that an unchanged molecule keeps its label
+            bound      - for all adsorbate atoms: bonded to a (selected) slab atom
+    '''
+    ads_indices = np.asarray(ads_indices)
+    rows = conn[ads_indices]
+    tot_coord = np.asarray(rows.sum(axis=1)).ravel()
+    n_slab = rows @ slab_mask.astype(np.int64)
+    n_ads = rows @ ads_mask.astype(np.int64)
+    slb_dist = np.min(get_distances(atoms.positions[ads_indices], atoms.positions[slab_indices],
+                                    cell=atoms.cell, pbc=atoms.pbc)[1], axis=1)
+    ads_graph = conn[ads_mask][:, ads_mask]
+    hh = sparse.triu(ads_graph, k=1).tocoo()
+    all_ads = np.nonzero(ads_mask)[0]
+    ncomp, labels = connected_components(ads_graph, directed=False)
+    smallest = np.full(ncomp, len(ads_mask))
+    np.minimum.at(smallest, labels, all_ads)
+    return {'slb_dist': slb_dist,
+            'tot_coord': tot_coord,
+            'n_slab': n_slab,
+            'n_ads': n_ads,
+            'site': site_codes(n_slab),
+            'ads_type': type_codes(n_slab, n_ads),
+            'hh_pairs': np.stack((all_ads[hh.row], all_ads[hh.col]), axis=1),
+            'molecule': smallest[labels],
+            'bound': (conn[ads_mask] @ slab_mask.astype(np.int64)) > 0}
+
+def analyze_frames(filename, indices, ads_indices, slab_indices, ads_mask, slab_mask, skin=1.0, lattice=None):
+    '''
+        analyze_frames
+        Open the trajectory and analyze the given frames with one Verlet list;
+        returns (adsorbates x frames) arrays of slb_dist, tot_coord, n_slab and n_ads,
+        and of lattice_site, site_id and site_offset if a SiteLattice is given;
+        molecule and bound are (all adsorbate atoms x frames)
+    '''
+    shape = (len(ads_indices), len(indices))
+    out = {'slb_dist': np.empty(shape),
+           'tot_coord': np.empty(shape, dtype=np.int16),
+           'n_slab': np.empty(shape, dtype=np.int16),
+           'n_ads': np.empty(shape, dtype=np.int16)}
+    all_shape = (np.sum(ads_mask), len(indices))
+    out.update({'molecule': np.empty(all_shape, dtype=np.int32), 'bound': np.empty(all_shape, dtype=np.int8)})
+    if lattice is not None:
+        out.update({'lattice_site': np.empty(shape, dtype=np.int8),
+                    'site_id': np.empty(shape, dtype=np.int32),
+                    'site_offset': np.empty(shape)})
+    neighbors = None
+    with Trajectory(filename) as traj:
+        for n, index in enumerate(indices):
+            atoms = traj[index]
+            if neighbors is None:
+                neighbors = VerletNeighbors(atoms, skin)
+            res = analyze_frame(atoms, neighbors.update(atoms), ads_indices, slab_indices, ads_mask, slab_mask)
+            if lattice is not None:
+                lattice.update(atoms)
+                res['lattice_site'], res['site_id'], res['site_offset'], _ = lattice.query(atoms.positions[ads_indices])
+            for key in out:
+                out[key][:, n] = res[key]
+    out['nbuilds'] = neighbors.nbuilds if neighbors is not None else 0
+    return out
@@ -0,0 +1,123 @@
+"""
+Rendering helpers for the per-atom plots of sigma_Enode.py and stats.py.
+Figures are drawn with the non-interactive Agg backend in a pool of worker processes, long MD series are
+downsampled for display (minimum and maximum of every pixel column, so spikes stay visible), and
+aggregate views replace the thousands of per-atom figures.
+
+    Functions:
+        minmax_indices()   - Indices of the min/max samples per pixel column of a series.
+        render_many()      - Call a rendering function for a list of tasks in a process pool.
+        plot_series()      - One downsampled series (e.g. node SD of one atom) -> PNG.
+        plot_heatmap()     - atoms x steps heatmap (maximum per pixel column) -> PNG.
+        plot_envelopes()   - Per-region min/max envelope and median of a per-atom quantity -> PNG.
+"""
+
+import os
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+from multiprocessing import Pool
+
+def minmax_indices(y, width=1000):
+    '''
+        minmax_indices
+        Sorted indices of the smallest and largest sample of each of width equal bins of y
+    '''
+    n = len(y)
+    if n <= 2*width:
+        return np.arange(n)
+    bins = np.arange(n) * width // n
+    order = np.lexsort((y, bins))   # by bin, then by value
+    starts = np.searchsorted(bins[order], np.arange(width))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate((order[starts], order[ends])))
+
+def block_max(a, width=1000):
+    '''
+        block_max
+        Maximum over equal blocks of columns of a 2D array (at most width columns are kept)
+    '''
+    n = a.shape[1]
+    if n <= width:
+        return a
+    starts = np.arange(width) * n // width
+    return np.maximum.reduceat(a, starts, axis=1)
+
+def render_many(func, tasks, nproc=None):
+    '''
+        render_many
+        func(task) for every task in nproc processes; returns the results (e.g. file names)
+    '''
+    nproc = nproc or os.cpu_count()
+    if nproc == 1 or len(tasks) < 2:
+        return [func(task) for task in tasks]
+    with Pool(min(nproc, len(tasks))) as pool:
+        return pool.map(func, tasks, chunksize=max(1, len(tasks) // (4*nproc)))
+
+def plot_series(task):
+    '''
+        plot_series
+        task = (y, filename, title, ylabel): line plot of y over the MD steps, downsampled for display
+    '''
+    y, filename, title, ylabel = task
+    keep = minmax_indices(y)
+    fig, ax = plt.subplots()
+    ax.plot(keep, y[keep], color='black')
+    ax.set_title(title, fontsize=20)
+    ax.set_xlabel('MD steps', fontsize=20)
+    ax.set_ylabel(ylabel, fontsize=20)
+    ax.tick_params(axis='both', which='major', labelsize=18)
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+    return filename
+
+def plot_heatmap(values, filename, label='node energy SD, eV', order=None, boundaries=None, width=1000):
+    '''
+        plot_heatmap
+        values (steps x atoms) as an atoms x steps image, logarithmic color scale.
+        order sorts the atoms (e.g. by region), boundaries are drawn as horizontal lines between regions.
+    '''
+    image = values.T if order is None else values[:, order].T
+    image = block_max(image, width)
+    positive = image[image > 0]
+    norm = LogNorm(vmin=positive.min(), vmax=positive.max()) if len(positive) else None
+    fig, ax = plt.subplots(figsize=(12, 8))
+    im = ax.imshow(image, aspect='auto', interpolation='nearest', origin='lower', norm=norm, cmap='viridis',
+                   extent=(0, values.shape[0], 0, values.shape[1]))
+    for name, start in (boundaries or {}).items():
+        ax.axhline(start, color='white', linewidth=0.8)
+        ax.text(0.01*values.shape[0], start, name, color='white', fontsize=12, va='bottom')
+    fig.colorbar(im, ax=ax, label=label)
+    ax.set_xlabel('MD steps', fontsize=16)
+    ax.set_ylabel('Atom' if order is None else 'Atom (sorted by region)', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(filename, dpi=150)
+    plt.close(fig)
+    return filename
+
+def plot_envelopes(values, regions, filename, ylabel='node energy SD, eV', width=1000):
+    '''
+        plot_envelopes
+        For every region (name -> atom indices): min-max band, 90th percentile and median over its atoms per step
+    '''
+    steps = np.arange(values.shape[0])
+    fig, axs = plt.subplots(len(regions), 1, figsize=(10, 3*len(regions)), sharex=True, squeeze=False)
+    for ax, (name, atoms) in zip(axs[:, 0], regions.items()):
+        sub = values[:, atoms]
+        lower, upper = sub.min(axis=1), sub.max(axis=1)
+        keep = np.union1d(minmax_indices(lower, width), minmax_indices(upper, width))
+        ax.fill_between(steps[keep], lower[keep], upper[keep], color='grey', alpha=0.4, label='min - max')
+        ax.plot(steps[keep], np.percentile(sub[keep], 90, axis=1), color='red', linewidth=1, label='90th percentile')
+        ax.plot(steps[keep], np.median(sub[keep], axis=1), color='black', linewidth=1, label='median')
+        ax.set_yscale('log')
+        ax.set_title(f'{name} ({len(atoms)} atoms)', fontsize=14)
+        ax.set_ylabel(ylabel, fontsize=12)
+    axs[0, 0].legend(fontsize=10)
+    axs[-1, 0].set_xlabel('MD steps', fontsize=14)
+    fig.tight_layout()
+    fig.savefig(filename, dpi=150)
+    plt.close(fig)
+    return filename
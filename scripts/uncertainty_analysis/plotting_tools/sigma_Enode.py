@@ -1,27 +1,69 @@
 """
-This script reads MD data from an HDF5 file and plots the evolution of local uncertainty for each atom across MD frames 
+This script reads MD data from an HDF5 file and plots the evolution of local uncertainty for each atom across MD frames
+By default two aggregate figures are written instead of one figure per atom:
+    node_sd_heatmap.png     atoms x MD steps heatmap of the node energy SD (atoms sorted by bonding regime)
+    node_sd_envelopes.png   min/max envelope, 90th percentile and median of the node energy SD per bonding regime
+The bonding regimes (Pt, H*, gas phase H) are taken from the MD input structure: H atoms more than 2 A
+above the top Pt atom are gas phase H. Per-atom figures (plot_atom_<i>.png) are still available with --atoms;
+they are rendered in parallel and downsampled for display.
+
+Usage:
+    python sigma_Enode.py [--data md_data.h5] [--structure inp.xyz] [--atoms all | 0 17 1188 ...] [--nproc 8]
 """
+import os
+import argparse
 import h5py
-import matplotlib.pyplot as plt
-
-with h5py.File('md_data.h5', 'r') as f:
-    node_sd = f['node_sd'][()]
-    epot = f['epot'][()]
-    sd = f['sd'][()]
-steps = node_sd.shape[0]
-atoms = node_sd.shape[1]
-
-#adjust the range to correspond to atoms in the respective bonding regimes
-for i in range(atoms):
-    plt.figure()
-    plt.plot(range(steps), node_sd[:, i],color="black")
-    plt.title(f'Pt: atom #{i}',fontsize=20)
-    #plt.title(f'gas phase $H_2$: atom #{i}',fontsize=20)
-    #plt.title(f'H*: atom #{i}',fontsize=20)
-    plt.xlabel('MD steps',fontsize=20)
-    plt.ylabel('node energy SD, eV',fontsize=20)
-    plt.xticks(fontsize=18)
-    plt.yticks(fontsize=18)
-    plt.tight_layout()
-    plt.savefig(f'plot_atom_{i}.png')  # Save each plot as a PNG file
-    plt.close()
\ No newline at end of file
+import numpy as np
+from ase.io import read
+from render import render_many, plot_series, plot_heatmap, plot_envelopes
+
+def bonding_regimes(atoms, ads_height=2.0):
+    '''
+        bonding_regimes
+        Atom indices of Pt, surface H (H*) and gas phase H
+    '''
+    symbols = np.array(atoms.get_chemical_symbols())
+    z = atoms.positions[:, 2]
+    top = z[symbols == 'Pt'].max()
+    regions = {'Pt': np.nonzero(symbols == 'Pt')[0],
+               'H*': np.nonzero((symbols == 'H') & (z <= top + ads_height))[0],
+               'gas phase H': np.nonzero((symbols == 'H') & (z > top + ads_height))[0]}
+    other = np.nonzero((symbols != 'Pt') & (symbols != 'H'))[0]
+    if len(other):
+        regions['other'] = other
+    return {name: atoms_ for name, atoms_ in regions.items() if len(atoms_)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Node energy SD of every atom along an MD run.')
+    parser.add_argument('--data', default='md_data.h5')
+    parser.add_argument('--structure', default='inp.xyz', help='MD input structure (for the bonding regimes)')
+    parser.add_argument('--atoms', nargs='+', help="also write one figure per atom ('all' or atom indices)")
+    parser.add_argument('--nproc', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with h5py.File(args.data, 'r') as f:
+        node_sd = f['node_sd'][()]
+    steps = node_sd.shape[0]
+    atoms = node_sd.shape[1]
+
+    if os.path.exists(args.structure):
+        regions = bonding_regimes(read(args.structure))
+    else:
+        regions = {'all atoms': np.arange(atoms)}
+    order = np.concatenate(list(regions.values()))
+    boundaries = dict(zip(regions, np.cumsum([0] + [len(r) for r in regions.values()])))
+    plot_heatmap(node_sd, 'node_sd_heatmap.png', order=order, boundaries=boundaries)
+    plot_envelopes(node_sd, regions, 'node_sd_envelopes.png')
+    print(f'{atoms} atoms, {steps} MD steps -> node_sd_heatmap.png, node_sd_envelopes.png')
+
+    if args.atoms:
+        selected = range(atoms) if args.atoms == ['all'] else [int(i) for i in args.atoms]
+        region_of = {i: name for name, members in regions.items() for i in members}
+        tasks = [(node_sd[:, i], f'plot_atom_{i}.png', f'{region_of.get(i, "")}: atom #{i}', 'node energy SD, eV')
+                 for i in selected]
+        render_many(plot_series, tasks, args.nproc)
+        print(f'{len(tasks)} per-atom figures written')
+
+
+if __name__ == '__main__':
+    main()
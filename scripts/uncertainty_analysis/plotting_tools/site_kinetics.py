@@ -0,0 +1,142 @@
+"""
+This script turns the site time series of stats.py (Data/<ads>_stats.h5) into kinetic quantities:
+residence time distributions per site, hop counts and rates between sites, and the fraction of time
+spent in each state (adsorbed on a site, gas phase, below the surface).
+The state of an adsorbate in a frame is its site of the surface lattice (ontop, bridge, fcc, hcp) when it is
+bonded to the slab, 'gas' without slab bonds, 'in bulk' with more than three slab bonds and 'unassigned'
+if no lattice site is known (reconstructed surface); with --codes site the coordination-based sites of stats.py
+(vacuum, ontop, bridge, hollow, in bulk) are used instead.
+The (adsorbates x frames) state array is run-length encoded as a whole. Runs shorter than --min-dwell frames
+are vibrational flicker and are attributed to the preceding state (minimum-dwell filter) before the runs are
+merged again. The first and last run of every adsorbate are cut by the trajectory and are left out of the
+residence times (they still count for the occupancies).
+
+Usage:
+    python site_kinetics.py [Data/H_stats.h5] [--min-dwell 5] [--dt 0.5] [--codes lattice|site] [--output site_kinetics.npz]
+"""
+
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from stats_data import read_stats
+
+def lattice_states(data):
+    '''
+        lattice_states
+        State codes from the lattice sites and the coordination-based sites, and the state names
+    '''
+    names = list(data['lattice_labels']) + ['gas', 'in bulk', 'unassigned']
+    site_labels = list(data['site_labels'])
+    states = data['lattice_site'].astype(np.int8)
+    states[(states < 0) | (data['site_id'] < 0)] = names.index('unassigned')
+    states[data['site'] == site_labels.index('vacuum')] = names.index('gas')
+    states[data['site'] == site_labels.index('in bulk')] = names.index('in bulk')
+    return states, names
+
+def run_lengths(states):
+    '''
+        run_lengths
+        Runs of equal states of every row: row, start frame, length and state of every run (in row order)
+    '''
+    nrows, nframes = states.shape
+    starts = np.ones(states.shape, dtype=bool)
+    starts[:, 1:] = states[:, 1:] != states[:, :-1]
+    flat = np.nonzero(starts.ravel())[0]
+    length = np.diff(np.append(flat, nrows*nframes))
+    return flat // nframes, flat % nframes, length, states.ravel()[flat]
+
+def min_dwell_filter(row, start, length, state, min_dwell):
+    '''
+        min_dwell_filter
+        Give runs shorter than min_dwell frames (except the first run of a row) the state of the preceding
+        run that is long enough, then merge neighboring runs of the same state
+    '''
+    first = np.ones(len(row), dtype=bool)
+    first[1:] = row[1:] != row[:-1]
+    keep = first | (length >= min_dwell)
+    source = np.maximum.accumulate(np.where(keep, np.arange(len(row)), 0))
+    state = state[source]
+    new = first.copy()
+    new[1:] |= state[1:] != state[:-1]
+    index = np.nonzero(new)[0]
+    return row[index], start[index], np.add.reduceat(length, index), state[index]
+
+def kinetics(row, start, length, state, nstates, nframes):
+    '''
+        kinetics
+        Transition counts (from x to), frames spent per state, and the uncensored runs
+    '''
+    same_row = row[1:] == row[:-1]
+    transitions = np.zeros((nstates, nstates), dtype=np.int64)
+    np.add.at(transitions, (state[:-1][same_row], state[1:][same_row]), 1)
+    occupancy = np.bincount(state, weights=length, minlength=nstates)
+    censored = (start == 0) | (start + length == nframes)
+    return transitions, occupancy, ~censored
+
+def plot_stuff(length, state, uncensored, names, dt, filename='site_kinetics.png'):
+    fig, ax = plt.subplots(figsize=(8, 5))
+    times = length[uncensored]*dt
+    if len(times):
+        bins = np.logspace(np.log10(times.min()), np.log10(times.max()) + 1e-9, 30)
+        for code, name in enumerate(names):
+            sel = times[state[uncensored] == code]
+            if len(sel):
+                ax.hist(sel, bins=bins, histtype='step', linewidth=1.5, label=f'{name} ({len(sel)})')
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('residence time', fontsize=14)
+    ax.set_ylabel('number of visits', fontsize=14)
+    ax.legend(fontsize=10)
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(description='Site residence times and hopping rates from the stats.py data file.')
+    parser.add_argument('data', nargs='?', default='Data/H_stats.h5', help='data file of stats.py')
+    parser.add_argument('--codes', default='lattice', choices=['lattice', 'site'], help='lattice sites or coordination-based sites')
+    parser.add_argument('--min-dwell', type=int, default=5, help='shorter runs (frames) are flicker')
+    parser.add_argument('--dt', type=float, default=1.0, help='time between trajectory frames (e.g. fs)')
+    parser.add_argument('--output', default='site_kinetics.npz')
+    args = parser.parse_args()
+
+    if args.codes == 'lattice':
+        states, names = lattice_states(read_stats(args.data, keys=['site', 'lattice_site', 'site_id']))
+    else:
+        data = read_stats(args.data, keys=['site'])
+        states, names = data['site'], list(data['site_labels'])
+    nframes = states.shape[1]
+    runs = run_lengths(states)
+    nraw = len(runs[0])
+    if args.min_dwell > 1:
+        runs = min_dwell_filter(*runs, args.min_dwell)
+    row, start, length, state = runs
+    transitions, occupancy, uncensored = kinetics(row, start, length, state, len(names), nframes)
+    print(f'{states.shape[0]} adsorbates, {nframes} frames: {nraw} runs, {len(row)} after the {args.min_dwell}-frame minimum dwell')
+
+    time = occupancy*args.dt
+    print(f'{"state":>12s} {"fraction":>9s} {"visits":>8s} {"mean res.":>10s} {"median":>10s} {"hops out/time":>14s}')
+    for code, name in enumerate(names):
+        res = length[uncensored & (state == code)]*args.dt
+        hops = transitions[code].sum() - transitions[code, code]
+        rate = hops/time[code] if time[code] > 0 else np.nan
+        print(f'{name:>12s} {occupancy[code]/occupancy.sum():9.4f} {len(res):8d} '
+              f'{np.mean(res) if len(res) else np.nan:10.2f} {np.median(res) if len(res) else np.nan:10.2f} {rate:14.3e}')
+    adsorbed = [names.index(name) for name in names if name not in ('gas', 'vacuum', 'in bulk')]
+    gas = [names.index(name) for name in names if name in ('gas', 'vacuum')]
+    print(f'time fraction adsorbed {occupancy[adsorbed].sum()/occupancy.sum():.4f}, gas phase {occupancy[gas].sum()/occupancy.sum():.4f}')
+    print('hops (from row to column):')
+    print(' '*12 + ''.join(f'{name:>11s}' for name in names))
+    for code, name in enumerate(names):
+        print(f'{name:>12s}' + ''.join(f'{n:11d}' for n in transitions[code]))
+
+    np.savez(args.output, names=np.array(names), transitions=transitions, occupancy=occupancy,
+             rates=transitions/np.where(time > 0, time, np.nan)[:, None],
+             run_row=row, run_start=start, run_length=length, run_state=state, uncensored=uncensored)
+    plot_stuff(length, state, uncensored, names, args.dt)
+
+
+if __name__ == '__main__':
+    main()
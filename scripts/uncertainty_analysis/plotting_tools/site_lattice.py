@@ -0,0 +1,116 @@
+"""
+Adsorption-site lattice of a (111) slab for the classification of adsorbate positions by stats.py.
+The sites are built once from the slab layers of a frame, as for an fcc(111) stacking:
+    ontop    above the atoms of the top layer
+    bridge   midway between neighboring atoms of the top layer
+    hcp      above the atoms of the second layer
+    fcc      above the atoms of the third layer
+(the same site names as fcc111sites of the seed generators). Any xy position is mapped to the nearest site
+with a KD-tree over the sites and their periodic images, for all adsorbates of a frame in one query.
+The lattice is refreshed only when the surface reconstructs (top-layer atoms moved laterally by more than
+refresh_tol or left the top layer); the sites of a refreshed lattice keep the ids of the original sites
+they coincide with, sites without a counterpart (or all sites, if no layers are left) get the id -1.
+
+    Classes:
+        SiteLattice   - Site positions, types and ids with a vectorized nearest-site query.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from ase.neighborlist import primitive_neighbor_list
+
+lattice_sites = ['ontop', 'bridge', 'fcc', 'hcp']
+
+def slab_layers(atoms, slab_indices, layer_tol=1.0):
+    '''
+        slab_layers
+        Atom indices of the slab layers from the top down (atoms within layer_tol in z form a layer)
+    '''
+    slab_indices = np.asarray(slab_indices)
+    z = atoms.positions[slab_indices, 2]
+    order = np.argsort(-z)
+    breaks = np.nonzero(-np.diff(z[order]) > layer_tol)[0] + 1
+    return [np.sort(slab_indices[layer]) for layer in np.split(order, breaks)]
+
+class SiteLattice:
+    '''
+        SiteLattice
+        ontop/bridge/fcc/hcp sites of the slab surface
+    '''
+    def __init__(self, atoms, slab_indices, layer_tol=1.0, refresh_tol=0.8, match_tol=0.5):
+        self.slab_indices = np.asarray(slab_indices)
+        self.layer_tol = layer_tol
+        self.refresh_tol = refresh_tol
+        self.match_tol = match_tol
+        self.nbuilds = 0
+        self.build(atoms)
+        self.ref_tree = self.tree
+        self.ref_types = self.types
+        self.site_id = np.arange(len(self.types))
+
+    def wrap(self, xy):
+        # into the surface cell
+        frac = np.linalg.solve(self.cell2.T, xy.T).T % 1.0
+        return frac @ self.cell2
+
+    def build(self, atoms):
+        layers = slab_layers(atoms, self.slab_indices, self.layer_tol)
+        if len(layers) < 3:
+            raise ValueError('at least three slab layers are needed to tell fcc from hcp hollows')
+        top, second, third = layers[:3]
+        self.cell2 = np.array(atoms.cell)[:2, :2]
+        pos = atoms.positions
+        i, j, D = primitive_neighbor_list('ijD', atoms.pbc, atoms.cell.complete(), pos[top], 5.0)
+        d = np.linalg.norm(D, axis=1)
+        nearest = np.full(len(top), np.inf)
+        np.minimum.at(nearest, i, d)
+        bridge = (i < j) & (d < 1.2*np.median(nearest))
+        sites = [pos[top, :2], pos[top][i[bridge], :2] + 0.5*D[bridge, :2], pos[third, :2], pos[second, :2]]
+        self.sites = self.wrap(np.concatenate(sites))
+        self.types = np.repeat(np.arange(len(lattice_sites), dtype=np.int8), [len(s) for s in sites])
+        self.top = top
+        self.top_xy = pos[top, :2].copy()
+        self.top_z = np.mean(pos[top, 2])
+        # sites and their images in the neighboring cells
+        shifts = np.array([[a, b] for a in (-1, 0, 1) for b in (-1, 0, 1)]) @ self.cell2
+        self.tree = cKDTree((self.sites[None, :, :] + shifts[:, None, :]).reshape(-1, 2))
+        self.nbuilds += 1
+
+    def nearest(self, tree, xy):
+        d, k = tree.query(self.wrap(xy))
+        return d, k % (tree.n // 9)
+
+    def reconstructed(self, atoms):
+        top = slab_layers(atoms, self.slab_indices, self.layer_tol)[0]
+        if len(top) != len(self.top) or np.any(top != self.top):
+            return True
+        frac = np.linalg.solve(self.cell2.T, (atoms.positions[top, :2] - self.top_xy).T).T
+        frac -= np.round(frac)
+        return np.max(np.linalg.norm(frac @ self.cell2, axis=1)) > self.refresh_tol
+
+    def update(self, atoms):
+        '''
+            update
+            Rebuild the sites if the surface has reconstructed; returns True after a rebuild
+        '''
+        if not self.reconstructed(atoms):
+            return False
+        try:
+            self.build(atoms)
+        except ValueError:
+            # no layered surface left: the old sites are kept, none of them is a regular site anymore
+            self.site_id = np.full(len(self.types), -1)
+            return False
+        d, k = self.nearest(self.ref_tree, self.sites)
+        same = (d < self.match_tol) & (self.ref_types[k] == self.types)
+        self.site_id = np.where(same, k, -1)
+        return True
+
+    def query(self, positions):
+        '''
+            query
+            Site type (index into lattice_sites), site id and lateral distance to the nearest site
+            of every position, and its height above the top layer
+        '''
+        d, k = self.nearest(self.tree, positions[:, :2])
+        return self.types[k], self.site_id[k], d, positions[:, 2] - self.top_z
@@ -4,14 +4,18 @@ in MD trajectory of Pt(111)-hydrogen interface, generating 4-panel plots.
 Created by Filippo Balzaretti, modified by Johannes Voss and Suman Bhasker-Ranganath
 """
 
-from ase import neighborlist
 from ase.io.trajectory import Trajectory
-from ase.geometry import get_distances
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import os
-from ase.io.jsonio import write_json
 import sys
+from multiprocessing import Pool
+from neighbor_engine import analyze_frames
+from site_lattice import SiteLattice
+from stats_data import create_stats, write_chunk, read_stats
+from render import render_many, minmax_indices
 
 
 
@@ -23,11 +27,6 @@ font = {'family': 'DejaVu Sans',
         'size': 35,
         }
 
-ads_sites = {'0': 'vacuum' ,
-             '1': 'ontop'  ,
-             '2': 'bridge' ,
-             '3': 'hollow' }
-
 site_colors = {'vacuum' : '#1f77b4', # default matplotlib color
                'ontop'  : 'green'  ,
                'bridge' : 'orange' ,
@@ -47,10 +46,11 @@ def parse_input():
                 print("""
 EXAMPLE OF USAGE:
        - python3 stats.py run.traj_all H_all Pt_all
+       - python3 stats.py run.traj_all H_all Pt_all 16
 
 INSTRUCTIONS:
 The script runs with user inputs in the following order:
-Usage: python3 stats.py <trajectory> <adsorbant atoms> <slab atoms>
+Usage: python3 stats.py <trajectory> <adsorbant atoms> <slab atoms> [<processes>]
 
 <trajectory>:
    Name of trajectory file followed by the frames of interest.
@@ -76,6 +76,9 @@ Usage: python3 stats.py <trajectory> <adsorbant atoms> <slab atoms>
        - Pt_[0,10,19]
        - Pt_all
 
+<processes>:
+   Number of worker processes analyzing chunks of frames (default: all cores).
+
 ADDITIONAL INFORMATION:
 - Make sure to separate with the underscore '_' and not to have it anywhere else
 - Make sure to only have empty spaces ' ' between the input and not anywhere else.
@@ -83,27 +86,29 @@ ADDITIONAL INFORMATION:
 """)
                 sys.exit()
 
-        elif len(sys.argv) == 4:
-                traj      = Trajectory(sys.argv[1].split('_')[0])
+        elif len(sys.argv) in (4, 5):
+                traj_file = sys.argv[1].split('_')[0]
+                traj      = Trajectory(traj_file)
                 traj_inds = sys.argv[1].split('_')[1]
                 ads       = sys.argv[2].split('_')[0]
                 ads_inds  = sys.argv[2].split('_')[1]
                 slb       = sys.argv[3].split('_')[0]
                 slb_inds  = sys.argv[3].split('_')[1]
+                nproc     = int(sys.argv[4]) if len(sys.argv) == 5 else os.cpu_count()
 
+                # frames are only read by the workers, each opening the trajectory itself
                 if traj_inds == 'all':
-                        frames = traj
+                        traj_indeces = list(range(len(traj)))
                 else:
                         if ':' not in traj_inds:
                                 traj_indeces = eval(traj_inds)
                         else:
                                 start, end  = map(int, traj_inds[1:-1].split(':'))
                                 traj_indeces = list(range(start, end))
-
-                        frames = [traj[i] for i in traj_indeces]
+                last = traj[traj_indeces[-1]]
 
                 if ads_inds == 'all':
-                        ads_indeces = [i for i, atom in enumerate(frames[-1])
+                        ads_indeces = [i for i, atom in enumerate(last)
                                            if atom.symbol == ads]
                 else:
                         if ':' not in ads_inds:
@@ -114,7 +119,7 @@ ADDITIONAL INFORMATION:
                                 ads_indeces = list(range(start, end))
 
                 if slb_inds == 'all':
-                        slb_indeces = [i for i, atom in enumerate(frames[-1])
+                        slb_indeces = [i for i, atom in enumerate(last)
                                            if atom.symbol == slb]
                 else:
                         if ':' not in slb_inds:
@@ -125,56 +130,39 @@ ADDITIONAL INFORMATION:
                                 slb_indeces = list(range(start, end))
 
 
-                return traj, frames, ads, ads_indeces, slb, slb_indeces
+                return traj, traj_file, traj_indeces, ads, ads_indeces, slb, slb_indeces, nproc
         else:
-                print("You need 3 input string. Use '--h' for more details.")
+                print("You need 3 or 4 input strings. Use '--h' for more details.")
                 sys.exit()
 
 
-def get_connectivity_matrix(atoms_object):
-    """
-    Generate a connectivity matrix for the atoms_object.
-
-    Parameters:
-    - atoms_object: ASE Atoms object
-        The atoms object for which the connectivity matrix is to be generated.
-
-    Returns:
-    - connectivity_matrix: 2D numpy array
-        The connectivity matrix where each element (i, j) represents whether
-        atom i is bonded to atom j. A value of 1 indicates a bond, and 0 indicates
-        no bond.
-    """
-
-    cutoff = neighborlist.natural_cutoffs(atoms_object) # covalent radii cutoff
-    neighborList = neighborlist.NeighborList(cutoff, self_interaction=False,
-                                                                                         bothways=True)
-    neighborList.update(atoms_object)
-    connectivity_matrix = neighborList.get_connectivity_matrix(sparse=False)
-
-    return connectivity_matrix
-
-def plot_stats(information):
+def plot_stats(information, filename, zmax):
         """
     Plot statistical information for a single adsorbant in the dynamics.
 
     Parameters:
-    - information: list of dictionaries
-        A list where each dictionary represents statistical information for
-        a specific frame. Each dictionary should contain keys 'slb_dist',
-        'site_type', 'tot_coord', and 'ads_type', corresponding to the
-        surface distance, adsorption site type, total coordination, and
-        adsorption interaction type, respectively.
+    - information: dictionary of arrays (one entry per frame)
+        As returned by stats_data.read_stats for one adsorbant, with keys
+        'slb_dist', 'site', 'tot_coord' and 'ads_type' (surface distance,
+        adsorption site code, total coordination and adsorption interaction
+        code) and the code tables 'site_labels' and 'type_labels'.
+    - filename: name of the figure
+    - zmax: upper limit of the surface distance axis (length of the c axis)
+
+    The time series are downsampled for display (frames with the smallest and
+    largest value per pixel column), the histograms use all frames.
 
     Returns:
     None, but it saves the figure in the Figs folder
     """
-        # Convert lists into np.arrays
-        frames        = np.arange(0, len(information), 1)
-        slb_distances = np.array([entry['slb_dist' ] for entry in information])
-        adsorptions   = np.array([entry['site_type' ] for entry in information])
-        coordinations = np.array([entry['tot_coord'] for entry in information])
-        interactions  = np.array([entry['ads_type' ] for entry in information])
+        # Decode the site and interaction types
+        frames        = np.arange(0, len(information['slb_dist']), 1)
+        slb_distances = information['slb_dist']
+        adsorptions   = information['site_labels'][information['site']]
+        coordinations = information['tot_coord']
+        interactions  = information['type_labels'][information['ads_type']]
+        shown_dist    = minmax_indices(slb_distances)
+        shown_coord   = minmax_indices(coordinations)
 
 
         fig = plt.figure(figsize=(25.08, 17.08), facecolor='w',constrained_layout=True)
@@ -182,12 +170,12 @@ def plot_stats(information):
 
         # -------- Top-left plot: evolution of distances over time --------
         ax1 = fig.add_subplot(gs[0,0])                                  # upper-left
-        point_colors = [site_colors.get(site_color) for site_color in adsorptions]
-        ax1.scatter(frames, slb_distances, c = point_colors, alpha = 0.5,
+        point_colors = [site_colors.get(site_color) for site_color in adsorptions[shown_dist]]
+        ax1.scatter(frames[shown_dist], slb_distances[shown_dist], c = point_colors, alpha = 0.5,
                             linewidth = 0.5)
 
         ax1.set_xlim(frames[0], frames[-1])
-        ax1.set_ylim(0, np.linalg.norm(traj[-1].cell[2])) # assumes cubic cell
+        ax1.set_ylim(0, zmax) # assumes cubic cell
         ax1.set_xlabel('MD steps', fontdict=font)
         ax1.set_ylabel('Surface distance (Å)', fontdict=font)
 
@@ -224,8 +212,8 @@ def plot_stats(information):
 
         # -------- Bottom-left plot: evolution of coordinations over time --------
         ax3 = fig.add_subplot(gs[1,0])
-        point_colors = [itr_colors.get(ads_color) for ads_color in interactions]
-        ax3.scatter(frames, coordinations, c = point_colors, alpha = 0.5,
+        point_colors = [itr_colors.get(ads_color) for ads_color in interactions[shown_coord]]
+        ax3.scatter(frames[shown_coord], coordinations[shown_coord], c = point_colors, alpha = 0.5,
                             linewidth = 0.5)
 
         ax3.set_xlabel('MD steps', fontdict=font)
@@ -266,85 +254,61 @@ def plot_stats(information):
         #title
         #plt.suptitle(f'{ads}: atom #{Ai}', fontsize = 30)
         #plt.subplots_adjust(top=0.90)
-        plt.savefig(f'Figs/{ads}-{Ai}.png')
-        print('Figure saved in the folder Figs!\n')
+        plt.savefig(filename)
         plt.close()
+        return filename
 
 
-# ------------ MAIN --------------- #
-# Get user input
-traj, frames, ads, ads_indeces, slb, slb_indeces = parse_input()
-# all adsorbant will be considered in the connectivity
-all_ads_atoms = [i for i, atom in enumerate(frames[-1])
-                      if atom.symbol == ads]
-
-# Create two folders where data and figs are gonna be stored
-os.system('mkdir Data')
-os.system('mkdir Figs')
-
-# Huge list containing all infos of each adsorbant per frame in ROW
-all_ads_infos = []
-
-
-# First loop: run through each frame of the trajectory and
-# compute connectivity  matrix
-for frame in frames:
-        all_ads_infos_per_frame = []
-        positions  = frame.get_positions()
-        all_coords = get_connectivity_matrix(frame)
-        # Second loop: run through the i-th adsorbant index, Ai, individually
-        for Ai in ads_indeces:
-                # Find all distances of atom Ai w.r.t all others, then look for the
-                # minimum value filtering among the slab indeces
-                all_distances  = get_distances(positions[Ai], positions,
-                                                                       cell=frame.cell, pbc=frame.pbc)[1][0]
-                slb_dist = np.min(all_distances[slb_indeces])
-
-                # Find through the connectivity matrix the amount of indeces that are
-                # coordinated as molecule and as adsorbant-surface interactions
-                coords_indeces = np.nonzero(all_coords[Ai])[0]
-                in_ads = set(coords_indeces).intersection(set(all_ads_atoms))
-                in_slb = set(coords_indeces).intersection(set(slb_indeces))
-                tot_coord = np.sum(all_coords[Ai])
-                try:
-                        site_type  = ads_sites[str(len(in_slb))]
-                except:
-                        site_type = 'in bulk'
-
-                if len(in_ads) == 0:
-                        mol_type = f'{ads}'
-                        if len(in_slb) == 0:
-                                ads_type =  'gas H'
-                        else:
-                                ads_type = 'H*'
-                else:
-                        mol_type = f'{ads}{len(in_ads)+1}'
-                        if len(in_slb) == 0:
-                                ads_type = 'gas H\u2099'
-                        else:
-                                ads_type = 'H\u2099*'
+def analyze_task(task):
+        # unit of work of the process pool: one chunk of frames
+        return analyze_frames(*task)
 
+def render_task(task):
+        # each worker reads the series of its adsorbant from the data file
+        data_file, Ai, filename, zmax = task
+        return plot_stats(read_stats(data_file, atoms=Ai), filename, zmax)
 
 
-                # Create a dictionary with information about Ai in frame
-                Ai_infos = {'slb_dist'  : slb_dist,
-                                'tot_coord' : tot_coord,
-                    'site_type' : site_type,
-                                        'mol_type'  : mol_type, # not used in the plotting
-                                        'ads_type'  : ads_type,
-                                        }
-                all_ads_infos_per_frame.append(Ai_infos)
-        all_ads_infos.append(all_ads_infos_per_frame)
-
-# Now each row represents each ads evolution over time
-all_ads_infos = np.array(all_ads_infos).T
-
-
-for i in range(0, len(all_ads_infos)):
-        Ai            = ads_indeces[i]
-        Ai_ads_infos  = all_ads_infos[i]
-        write_json(f'Data/{ads}-{Ai}_infos.json', Ai_ads_infos)
-        print(f'Arrays saved in Data/{ads}-{Ai}_infos.dat')
-
-        # Plot time-evolution of ads-(Ai)
-        plot_stats(Ai_ads_infos)
\ No newline at end of file
+# ------------ MAIN --------------- #
+chunk_size = 1000   # frames per task, each task builds its own neighbor list once
+
+if __name__ == '__main__':
+        # Get user input
+        traj, traj_file, traj_indeces, ads, ads_indeces, slb, slb_indeces, nproc = parse_input()
+        last = traj[traj_indeces[-1]]
+        # all adsorbant will be considered in the connectivity
+        ads_mask = np.array([atom.symbol == ads for atom in last])
+        slb_mask = np.zeros(len(last), dtype=bool)
+        slb_mask[slb_indeces] = True
+
+        # Create two folders where data and figs are gonna be stored
+        os.system('mkdir Data')
+        os.system('mkdir Figs')
+
+        # Typed (adsorbants x frames) datasets of Data/{ads}_stats.h5, filled chunk by chunk as the
+        # workers finish: every worker reads its own range of frames and keeps a Verlet list between them
+        data_file = f'Data/{ads}_stats.h5'
+        starts = range(0, len(traj_indeces), chunk_size)
+        # ontop/bridge/fcc/hcp sites from the slab layers of the first frame, shared by all workers
+        try:
+                lattice = SiteLattice(traj[traj_indeces[0]], slb_indeces)
+        except ValueError as err:
+                print(f'No site lattice: {err}')
+                lattice = None
+        tasks = [(traj_file, traj_indeces[start:start+chunk_size], ads_indeces, slb_indeces, ads_mask, slb_mask, 1.0, lattice)
+                 for start in starts]
+        nbuilds = 0
+        with create_stats(data_file, ads_indeces, traj_indeces, ads, slb, traj_file, lattice,
+                          np.nonzero(ads_mask)[0]) as f, \
+             Pool(max(1, min(nproc, len(tasks)))) as pool:
+                for start, res in zip(starts, pool.imap(analyze_task, tasks)):
+                        write_chunk(f, start, res)
+                        nbuilds += res['nbuilds']
+        print(f'{len(traj_indeces)} frames in {len(tasks)} chunks, neighbor list built {nbuilds} times')
+        print(f'Arrays saved in {data_file}')
+
+        # Plot time-evolution of each ads-(Ai), in parallel
+        zmax = np.linalg.norm(traj[-1].cell[2])
+        tasks = [(data_file, Ai, f'Figs/{ads}-{Ai}.png', zmax) for Ai in ads_indeces]
+        render_many(render_task, tasks, nproc)
+        print(f'{len(tasks)} figures saved in the folder Figs!')
@@ -0,0 +1,111 @@
+"""
+Storage of the per-adsorbate time series of stats.py in one compressed HDF5 file (Data/{ads}_stats.h5).
+All series are (adsorbates x frames) arrays, the site and interaction types are integer codes
+whose labels are stored as attributes:
+
+    slb_dist      float    distance to the closest slab atom
+    tot_coord     int16    number of bonded atoms
+    site          int8     index into attrs['site_labels']  (vacuum, ontop, bridge, hollow, in bulk)
+    ads_type      int8     index into attrs['type_labels']  (gas H, gas Hₙ, H*, Hₙ*)
+    mol_size      int16    number of adsorbate atoms in the molecule (1 + bonded adsorbate atoms)
+    lattice_site  int8     nearest site of the surface lattice, index into attrs['lattice_labels']
+                           (ontop, bridge, fcc, hcp), -1 without a lattice (fewer than three slab layers)
+    site_id       int32    id of that site (index into lattice_xy/lattice_types), -1 for sites of a reconstructed surface
+    site_offset   float    lateral distance to that site
+    lattice_xy, lattice_types   sites of the lattice of the first frame
+
+and for all atoms of the adsorbate species (rows: molecule_atoms), used by h2_events.py:
+    molecule      int32    molecule (connected adsorbate-adsorbate bonds) labeled by its smallest atom index
+    bound         int8     bonded to the slab
+    ads_indices            atom index of every row
+    frames                 trajectory frame of every column
+
+    Functions:
+        create_stats()   - Create the file with empty datasets, filled chunk by chunk with write_chunk().
+        write_chunk()    - Store the results of a range of frames.
+        read_stats()     - Load any selection of adsorbate atoms and frames.
+"""
+
+import h5py
+import numpy as np
+from neighbor_engine import ads_sites, ads_types, site_codes, type_codes
+from site_lattice import lattice_sites
+
+series = {'slb_dist': np.float64, 'tot_coord': np.int16, 'site': np.int8, 'ads_type': np.int8, 'mol_size': np.int16,
+          'lattice_site': np.int8, 'site_id': np.int32, 'site_offset': np.float64}
+lattice_series = ['lattice_site', 'site_id', 'site_offset']
+
+def create_stats(filename, ads_indices, frames, ads, slb, trajectory='', lattice=None, all_ads=None):
+    '''
+        create_stats
+        HDF5 file with chunked, compressed (adsorbates x frames) datasets
+    '''
+    shape = (len(ads_indices), len(frames))
+    chunks = (max(1, min(shape[0], 16)), max(1, min(shape[1], 4096)))
+    f = h5py.File(filename, 'w')
+    for key, dtype in series.items():
+        f.create_dataset(key, shape=shape, dtype=dtype, chunks=chunks, compression='gzip', shuffle=True,
+                         fillvalue=-1 if key in lattice_series else 0)
+    f.create_dataset('ads_indices', data=np.asarray(ads_indices))
+    if all_ads is not None:
+        all_shape = (len(all_ads), len(frames))
+        all_chunks = (max(1, min(all_shape[0], 64)), chunks[1])
+        f.create_dataset('molecule_atoms', data=np.asarray(all_ads))
+        for key, dtype in (('molecule', np.int32), ('bound', np.int8)):
+            f.create_dataset(key, shape=all_shape, dtype=dtype, chunks=all_chunks, compression='gzip', shuffle=True)
+    f.create_dataset('frames', data=np.asarray(frames))
+    f.attrs['site_labels'] = ads_sites + ['in bulk']
+    f.attrs['type_labels'] = ads_types
+    f.attrs['lattice_labels'] = lattice_sites
+    if lattice is not None:
+        f.create_dataset('lattice_xy', data=lattice.sites)
+        f.create_dataset('lattice_types', data=lattice.types)
+    f.attrs['adsorbate'] = ads
+    f.attrs['slab'] = slb
+    f.attrs['trajectory'] = trajectory
+    return f
+
+def write_chunk(f, start, res):
+    '''
+        write_chunk
+        Store the analyze_frames() results of the frames start, start+1, ...
+    '''
+    stop = start + res['slb_dist'].shape[1]
+    f['slb_dist'][:, start:stop] = res['slb_dist']
+    f['tot_coord'][:, start:stop] = res['tot_coord']
+    f['site'][:, start:stop] = site_codes(res['n_slab'])
+    f['ads_type'][:, start:stop] = type_codes(res['n_slab'], res['n_ads'])
+    f['mol_size'][:, start:stop] = res['n_ads'] + 1
+    for key in lattice_series + ['molecule', 'bound']:
+        if key in res and key in f:
+            f[key][:, start:stop] = res[key]
+
+def read_stats(filename, atoms=None, frames=slice(None), keys=None):
+    '''
+        read_stats
+        Series of the given adsorbate atoms (atom indices, default all) and frames (slice of columns),
+        plus ads_indices, frames and the code tables site_labels and type_labels.
+        For a single atom index the series are 1D.
+    '''
+    with h5py.File(filename, 'r') as f:
+        ads_indices = f['ads_indices'][()]
+        if atoms is None:
+            rows = slice(None)
+        else:
+            row_of = {a: i for i, a in enumerate(ads_indices)}
+            rows = np.array([row_of[a] for a in np.atleast_1d(atoms)])
+        out = {'ads_indices': ads_indices[rows], 'frames': f['frames'][frames],
+               'site_labels': np.array(f.attrs['site_labels']), 'type_labels': np.array(f.attrs['type_labels']),
+               'lattice_labels': np.array(f.attrs['lattice_labels'])}
+        for key in (keys if keys is not None else series):
+            if isinstance(rows, slice):
+                out[key] = f[key][rows, frames]
+            else:
+                # h5py reads rows in increasing order only
+                order = np.unique(rows, return_inverse=True)
+                out[key] = f[key][order[0], frames][order[1]]
+    if atoms is not None and np.ndim(atoms) == 0:
+        for key in list(series) + ['ads_indices']:
+            if key in out:
+                out[key] = out[key][0]
+    return out
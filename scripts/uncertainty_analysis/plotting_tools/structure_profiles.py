@@ -0,0 +1,185 @@
+"""
+This script accumulates radial distribution functions (H-H, Pt-H, Pt-Pt, ...) and z-density profiles
+over MD trajectories or structure sets (e.g. run.traj, xyz_files/al_1/*.xyz ... al_5) to compare the interfaces
+of different active-learning iterations.
+The frames of every input file are split into ranges processed by a pool of workers; every worker reads
+its range in chunks, finds the pairs within rmax with ASE's cell-list neighbor search and adds them to
+per-species-pair histograms. The partial results (Profiles) are merged by adding them up.
+The RDFs are normalized for slab geometries with vacuum: instead of the density of the whole cell,
+the ideal (uncorrelated) pair count of every frame uses the z-distribution of the partner atoms,
+    ideal_AB(r) dr = sum over A atoms a of 2 pi r dr / area * (number of B atoms with |z_B - z_a| < r),
+i.e. B atoms spread uniformly in xy over their actual layers, so that g(r) -> 1 for uncorrelated atoms
+of the slab and is not diluted by the vacuum. The z profiles are number densities per A^3 of every species.
+
+Usage:
+    python structure_profiles.py run.traj [al_1.xyz al_2.xyz ...] [--pairs H-H Pt-H Pt-Pt] [--rmax 6.0]
+                                 [--bins 300] [--zbins 300] [--stride 1] [--nproc 8] [--output profiles.npz]
+"""
+
+import os
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from multiprocessing import Pool
+from ase.io import read
+from ase.io.trajectory import Trajectory
+from ase.neighborlist import primitive_neighbor_list
+
+class Profiles:
+    '''
+        Profiles
+        Mergeable pair histograms, ideal pair counts and z histograms
+    '''
+    def __init__(self, pairs, rmax=6.0, nbins=300, zmax=40.0, zbins=300):
+        self.pairs = [tuple(pair) for pair in pairs]
+        self.species = sorted(set(s for pair in self.pairs for s in pair))
+        self.r_edges = np.linspace(0., rmax, nbins + 1)
+        self.z_edges = np.linspace(0., zmax, zbins + 1)
+        self.hist = np.zeros((len(self.pairs), nbins))
+        self.ideal = np.zeros((len(self.pairs), nbins))
+        self.z_hist = np.zeros((len(self.species), zbins))
+        self.z_volume = np.zeros(zbins)   # sum over frames of area * dz (for the densities)
+        self.nframes = 0
+
+    def __iadd__(self, other):
+        for key in ('hist', 'ideal', 'z_hist', 'z_volume', 'nframes'):
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        return self
+
+    def update(self, atoms):
+        '''
+            update
+            Add the pairs and z positions of one frame
+        '''
+        symbols = np.array(atoms.get_chemical_symbols())
+        cell = np.array(atoms.cell)
+        area = np.linalg.norm(np.cross(cell[0], cell[1]))
+        z = atoms.positions[:, 2]
+        rmax = self.r_edges[-1]
+        i, j, d = primitive_neighbor_list('ijd', atoms.pbc, atoms.cell.complete(), atoms.positions, rmax,
+                                          self_interaction=False)
+        r = 0.5*(self.r_edges[1:] + self.r_edges[:-1])
+        dr = np.diff(self.r_edges)
+        for p, (a, b) in enumerate(self.pairs):
+            sel = (symbols[i] == a) & (symbols[j] == b)
+            self.hist[p] += np.histogram(d[sel], bins=self.r_edges)[0]
+            za, zb = np.sort(z[symbols == a]), np.sort(z[symbols == b])
+            if atoms.pbc[2]:
+                zb = np.concatenate((zb - cell[2, 2], zb, zb + cell[2, 2]))
+            # B atoms within |z_B - z_a| < r of every A atom (minus the atom itself for A = B)
+            within = (np.searchsorted(zb, za[:, None] + r[None, :], side='left')
+                      - np.searchsorted(zb, za[:, None] - r[None, :], side='right'))
+            if a == b:
+                within = within - 1
+            self.ideal[p] += 2*np.pi*r*dr/area * within.sum(axis=0)
+        for s, name in enumerate(self.species):
+            self.z_hist[s] += np.histogram(z[symbols == name], bins=self.z_edges)[0]
+        self.z_volume += area*np.diff(self.z_edges)
+        self.nframes += 1
+
+    def rdf(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.hist/self.ideal
+
+    def density(self):
+        return self.z_hist/self.z_volume
+
+def count_frames(filename):
+    if filename.endswith('.traj'):
+        with Trajectory(filename) as traj:
+            return len(traj)
+    return len(read(filename, index=':'))
+
+def accumulate(task):
+    '''
+        accumulate
+        Profiles of the frames start:stop:stride of a file, read in chunks
+    '''
+    filename, start, stop, stride, chunk, settings = task
+    profiles = Profiles(**settings)
+    for first in range(start, stop, chunk*stride):
+        for atoms in read(filename, index=f'{first}:{min(first + chunk*stride, stop)}:{stride}'):
+            profiles.update(atoms)
+    return profiles
+
+def profiles_of_file(filename, settings, stride=1, chunk=500, nproc=4):
+    '''
+        profiles_of_file
+        Profiles of all frames of a file, frame ranges processed in parallel and merged
+    '''
+    nframes = count_frames(filename)
+    ranges = np.array_split(np.arange(0, nframes, stride), max(1, min(nproc, nframes // stride)))
+    tasks = [(filename, int(r[0]), int(r[-1]) + 1, stride, chunk, settings) for r in ranges if len(r)]
+    total = Profiles(**settings)
+    with Pool(min(nproc, len(tasks))) as pool:
+        for partial in pool.imap_unordered(accumulate, tasks):
+            total += partial
+    return total
+
+def plot_stuff(results, pairs, filename_rdf='rdf.png', filename_z='z_profiles.png'):
+    fig, axs = plt.subplots(1, len(pairs), figsize=(5*len(pairs), 4), squeeze=False)
+    for label, profiles in results.items():
+        r = 0.5*(profiles.r_edges[1:] + profiles.r_edges[:-1])
+        for ax, g in zip(axs[0], profiles.rdf()):
+            ax.plot(r, g, label=label)
+    for ax, (a, b) in zip(axs[0], pairs):
+        ax.axhline(1.0, color='grey', linestyle=':')
+        ax.set_title(f'{a}-{b}', fontsize=14)
+        ax.set_xlabel('r [Å]', fontsize=12)
+        ax.set_ylabel('g(r)', fontsize=12)
+    axs[0, 0].legend(fontsize=9)
+    fig.tight_layout()
+    fig.savefig(filename_rdf)
+    plt.close(fig)
+
+    species = next(iter(results.values())).species
+    fig, axs = plt.subplots(len(species), 1, figsize=(8, 3*len(species)), sharex=True, squeeze=False)
+    for label, profiles in results.items():
+        z = 0.5*(profiles.z_edges[1:] + profiles.z_edges[:-1])
+        for ax, rho in zip(axs[:, 0], profiles.density()):
+            ax.plot(z, rho, label=label)
+    for ax, name in zip(axs[:, 0], species):
+        ax.set_ylabel(f'{name} density [Å$^{{-3}}$]', fontsize=12)
+    axs[-1, 0].set_xlabel('z [Å]', fontsize=12)
+    axs[0, 0].legend(fontsize=9)
+    fig.tight_layout()
+    fig.savefig(filename_z)
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(description='RDFs and z-density profiles of slab trajectories/structure sets.')
+    parser.add_argument('files', nargs='+', help='trajectories or structure files (any format read by ASE)')
+    parser.add_argument('--pairs', nargs='+', default=['H-H', 'Pt-H', 'Pt-Pt'])
+    parser.add_argument('--rmax', type=float, default=6.0)
+    parser.add_argument('--bins', type=int, default=300)
+    parser.add_argument('--zmax', type=float, help='upper end of the z profiles (default: largest c of the first frames)')
+    parser.add_argument('--zbins', type=int, default=300)
+    parser.add_argument('--stride', type=int, default=1)
+    parser.add_argument('--chunk', type=int, default=500, help='frames read at once by a worker')
+    parser.add_argument('--nproc', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default='profiles.npz')
+    args = parser.parse_args()
+
+    pairs = [tuple(pair.split('-')) for pair in args.pairs]
+    zmax = args.zmax if args.zmax else max(read(f, index=0).cell[2, 2] for f in args.files)
+    settings = {'pairs': pairs, 'rmax': args.rmax, 'nbins': args.bins, 'zmax': zmax, 'zbins': args.zbins}
+    results = {}
+    for ffile in args.files:
+        results[ffile] = profiles_of_file(ffile, settings, args.stride, args.chunk, args.nproc)
+        print(f'{ffile}: {results[ffile].nframes} frames')
+
+    first = next(iter(results.values()))
+    out = {'r': 0.5*(first.r_edges[1:] + first.r_edges[:-1]), 'z': 0.5*(first.z_edges[1:] + first.z_edges[:-1]),
+           'files': np.array(list(results)), 'pairs': np.array(args.pairs), 'species': np.array(first.species)}
+    for key in ('rdf', 'density'):
+        out[key] = np.array([getattr(profiles, key)() for profiles in results.values()])
+    for key in ('hist', 'ideal', 'z_hist', 'z_volume', 'nframes'):
+        out[key] = np.array([getattr(profiles, key) for profiles in results.values()])
+    np.savez(args.output, **out)
+    plot_stuff(results, pairs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+This script maps where on the surface and at what depth the local uncertainty (node energy SD) of an MD run
+concentrates. The frames of run.traj and the node_sd rows of md_data.h5 (both written every step by dyn.py)
+are streamed together in chunks, and the node SD of every atom in every frame is binned, with np.add.at over
+all atoms of a chunk at once, into
+    xy maps    fractional surface coordinates (nx x ny cells) per group: Pt layers 1, 2, ... from the top,
+               H* (up to 2 A above the top layer), gas phase H, subsurface H (more than 1 A below the top layer)
+    z profiles height relative to the top Pt layer, per element
+Every cell keeps the count, sum and maximum of the node SD and a histogram on fixed logarithmic SD bins,
+from which the mean, maximum and the 90th/99th percentiles are reported. The grids (fractional coordinates,
+heights relative to the top layer) and the SD bins are the same for every run, so the maps of different
+AL iterations can be compared cell by cell (--plot with several files uses one color scale).
+
+Usage:
+    python uncertainty_maps.py [--traj run.traj] [--data md_data.h5] [--grid 24 24] [--output uncertainty_maps.npz]
+    python uncertainty_maps.py --plot al1_maps.npz al2_maps.npz ...
+"""
+
+import argparse
+import numpy as np
+import h5py
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from ase.io.trajectory import Trajectory
+from site_lattice import slab_layers
+
+sd_edges = np.logspace(-5, 0, 101)   # eV, shared by all runs
+z_edges = np.linspace(-15., 15., 121)   # A relative to the top slab layer
+quantiles = [0.9, 0.99]
+
+class UncertaintyMaps:
+    '''
+        UncertaintyMaps
+        Count, sum, max and SD histogram of node_sd per (group, x, y) cell and per (element, z) bin
+    '''
+    def __init__(self, groups, elements, grid=(24, 24)):
+        self.groups = groups
+        self.elements = elements
+        self.grid = tuple(grid)
+        shape = (len(groups),) + self.grid
+        zshape = (len(elements), len(z_edges) - 1)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.sum = np.zeros(shape)
+        self.max = np.zeros(shape)
+        self.hist = np.zeros(shape + (len(sd_edges) - 1,), dtype=np.int64)
+        self.z_count = np.zeros(zshape, dtype=np.int64)
+        self.z_sum = np.zeros(zshape)
+        self.z_max = np.zeros(zshape)
+        self.z_hist = np.zeros(zshape + (len(sd_edges) - 1,), dtype=np.int64)
+
+    def add(self, group, ix, iy, element, iz, sd):
+        '''
+            add
+            Bin node SD values (flat arrays over atoms and frames) into the maps and profiles
+        '''
+        isd = np.clip(np.searchsorted(sd_edges, sd) - 1, 0, len(sd_edges) - 2)
+        cell = (group, ix, iy)
+        np.add.at(self.count, cell, 1)
+        np.add.at(self.sum, cell, sd)
+        np.maximum.at(self.max, cell, sd)
+        np.add.at(self.hist, cell + (isd,), 1)
+        inside = (iz >= 0) & (iz < len(z_edges) - 1)
+        zcell = (element[inside], iz[inside])
+        np.add.at(self.z_count, zcell, 1)
+        np.add.at(self.z_sum, zcell, sd[inside])
+        np.maximum.at(self.z_max, zcell, sd[inside])
+        np.add.at(self.z_hist, zcell + (isd[inside],), 1)
+
+def hist_quantile(hist, q):
+    '''
+        hist_quantile
+        Quantile q from histograms on sd_edges (last axis), geometric bin centers; NaN for empty cells
+    '''
+    cumulative = np.cumsum(hist, axis=-1)
+    total = cumulative[..., -1:]
+    index = np.argmax(cumulative >= q*total, axis=-1)
+    centers = np.sqrt(sd_edges[1:]*sd_edges[:-1])
+    return np.where(total[..., 0] > 0, centers[index], np.nan)
+
+def atom_groups(atoms, slab='Pt', ads='H', layer_tol=1.0):
+    '''
+        atom_groups
+        Group names, the slab layer of every slab atom (-1 otherwise) and the top-layer atoms
+    '''
+    layers = slab_layers(atoms, [i for i, s in enumerate(atoms.get_chemical_symbols()) if s == slab], layer_tol)
+    layer_of = np.full(len(atoms), -1)
+    for n, layer in enumerate(layers):
+        layer_of[layer] = n
+    groups = [f'{slab} layer {n+1}' for n in range(len(layers))] + [f'{ads}*', f'gas phase {ads}', f'subsurface {ads}']
+    return groups, layer_of, layers[0]
+
+def accumulate(traj_file, data_file, chunk=500, grid=(24, 24), slab='Pt', ads='H', ads_height=2.0, subsurface_depth=1.0):
+    '''
+        accumulate
+        One pass over the trajectory and the node SD of md_data.h5, chunk by chunk; the slab atoms keep
+        the layer of the first frame, the adsorbates are grouped by their height in every frame
+    '''
+    with Trajectory(traj_file) as traj, h5py.File(data_file, 'r') as f:
+        node_sd = f['node_sd']
+        nframes = min(len(traj), node_sd.shape[0])
+        if len(traj) != node_sd.shape[0]:
+            print(f'{len(traj)} frames in {traj_file}, {node_sd.shape[0]} steps in {data_file}: using the first {nframes}')
+        first = traj[0]
+        symbols = np.array(first.get_chemical_symbols())
+        elements = sorted(set(symbols))
+        element = np.array([elements.index(s) for s in symbols])
+        groups, layer_of, top = atom_groups(first, slab, ads)
+        nlayers = len(groups) - 3
+        maps = UncertaintyMaps(groups, elements, grid)
+        is_ads = symbols == ads
+        for start in range(0, nframes, chunk):
+            stop = min(start + chunk, nframes)
+            sd = node_sd[start:stop]
+            frames = [traj[i] for i in range(start, stop)]
+            pos = np.array([atoms.positions for atoms in frames])
+            frac = np.array([atoms.cell.scaled_positions(atoms.positions) for atoms in frames]) % 1.0
+            height = pos[:, :, 2] - pos[:, top, 2].mean(axis=1, keepdims=True)
+            group = np.broadcast_to(layer_of, height.shape).copy()
+            group[:, is_ads] = np.where(height[:, is_ads] > ads_height, nlayers + 1,
+                                        np.where(height[:, is_ads] < -subsurface_depth, nlayers + 2, nlayers))
+            ix = np.minimum((frac[:, :, 0]*grid[0]).astype(int), grid[0] - 1)
+            iy = np.minimum((frac[:, :, 1]*grid[1]).astype(int), grid[1] - 1)
+            iz = np.searchsorted(z_edges, height) - 1
+            keep = group >= 0
+            maps.add(group[keep], ix[keep], iy[keep], np.broadcast_to(element, height.shape)[keep], iz[keep], sd[keep])
+    return maps, nframes
+
+def summary(maps):
+    '''
+        summary
+        Mean, max and quantile maps (groups x nx x ny) and profiles (elements x z bins)
+    '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = {'mean': maps.sum/maps.count, 'z_mean': maps.z_sum/maps.z_count}
+    out['max'] = np.where(maps.count > 0, maps.max, np.nan)
+    out['z_max'] = np.where(maps.z_count > 0, maps.z_max, np.nan)
+    for q in quantiles:
+        out[f'q{int(100*q)}'] = hist_quantile(maps.hist, q)
+        out[f'z_q{int(100*q)}'] = hist_quantile(maps.z_hist, q)
+    return out
+
+def save(filename, maps, nframes):
+    np.savez(filename, groups=np.array(maps.groups), elements=np.array(maps.elements), grid=np.array(maps.grid),
+             sd_edges=sd_edges, z_edges=z_edges, nframes=nframes, count=maps.count, sum=maps.sum, max_raw=maps.max,
+             hist=maps.hist, z_count=maps.z_count, z_sum=maps.z_sum, z_hist=maps.z_hist, **summary(maps))
+
+def plot_stuff(files, key='q99', filename='uncertainty_maps.png'):
+    '''
+        plot_stuff
+        One row per file, one column per group (common color scale), and the z profiles of all files
+    '''
+    data = [np.load(f) for f in files]
+    groups = list(data[0]['groups'])
+    values = np.concatenate([d[key][np.isfinite(d[key])].ravel() for d in data])
+    vmin, vmax = (values.min(), values.max()) if len(values) else (1e-5, 1.)
+    norm = matplotlib.colors.LogNorm(vmin=max(vmin, sd_edges[0]), vmax=max(vmax, 2*sd_edges[0]))
+    fig, axs = plt.subplots(len(files), len(groups), figsize=(3*len(groups), 3*len(files)), squeeze=False)
+    for row, (ffile, d) in enumerate(zip(files, data)):
+        for col, group in enumerate(groups):
+            ax = axs[row, col]
+            im = ax.imshow(d[key][col].T, origin='lower', extent=(0, 1, 0, 1), norm=norm, cmap='viridis')
+            ax.set_title(f'{group}' if row == 0 else '', fontsize=11)
+            ax.set_xticks([])
+            ax.set_yticks([])
+        axs[row, 0].set_ylabel(ffile, fontsize=9)
+    fig.colorbar(im, ax=axs, label=f'node energy SD ({key}), eV', shrink=0.8)
+    fig.savefig(filename, dpi=150)
+    plt.close(fig)
+
+    fig, axs = plt.subplots(1, len(data[0]['elements']), figsize=(6*len(data[0]['elements']), 4), squeeze=False)
+    z = 0.5*(z_edges[1:] + z_edges[:-1])
+    for ffile, d in zip(files, data):
+        for ax, element, prof, top in zip(axs[0], d['elements'], d['z_mean'], d[f'z_{key}']):
+            line, = ax.plot(z, prof, label=f'{ffile} mean')
+            ax.plot(z, top, linestyle='--', color=line.get_color(), label=f'{ffile} {key}')
+            ax.set_title(element, fontsize=14)
+    for ax in axs[0]:
+        ax.set_yscale('log')
+        ax.set_xlabel('height above the top layer [Å]', fontsize=12)
+        ax.set_ylabel('node energy SD, eV', fontsize=12)
+    axs[0, 0].legend(fontsize=8)
+    fig.tight_layout()
+    fig.savefig('uncertainty_z_profiles.png')
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(description='Surface and depth maps of the node energy SD of an MD run.')
+    parser.add_argument('--traj', default='run.traj')
+    parser.add_argument('--data', default='md_data.h5')
+    parser.add_argument('--grid', type=int, nargs=2, default=[24, 24], help='cells along the a and b surface vectors')
+    parser.add_argument('--chunk', type=int, default=500, help='frames read at once')
+    parser.add_argument('--slab', default='Pt')
+    parser.add_argument('--ads', default='H')
+    parser.add_argument('--output', default='uncertainty_maps.npz')
+    parser.add_argument('--plot', nargs='+', help='only plot these map files (e.g. of several AL iterations)')
+    parser.add_argument('--key', default='q99', help='map shown: mean, max, q90 or q99')
+    args = parser.parse_args()
+
+    if args.plot:
+        plot_stuff(args.plot, args.key)
+        return
+    maps, nframes = accumulate(args.traj, args.data, args.chunk, args.grid, args.slab, args.ads)
+    save(args.output, maps, nframes)
+    print(f'{nframes} frames -> {args.output}')
+    for n, group in enumerate(maps.groups):
+        count = maps.count[n].sum()
+        if count:
+            print(f'{group:>16s} {count:10d} values, mean {maps.sum[n].sum()/count:.5f} eV, '
+                  f'99th percentile {hist_quantile(maps.hist[n].sum(axis=(0, 1)), 0.99):.5f} eV, max {maps.max[n].max():.5f} eV')
+    plot_stuff([args.output], args.key)
+
+
+if __name__ == '__main__':
+    main()